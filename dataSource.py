@@ -0,0 +1,530 @@
+#! python3
+
+import pandas as pd
+import numpy as np
+import sys, os, logging, logging.config, contextlib, threading, getopt, abc
+
+# Internal imports
+import utils
+
+#define constants
+BATCH_SIZE = 500   #number of ids or symbols given to one query
+ROWS_PER_INSERT = 100   #rows written by one multi-row INSERT
+QUOTE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+#columns of the tables read by the screeners, the ones exported to a snapshot
+TABLE_COLUMNS = {
+    'symbols': ['id', 'ticker', 'exchange_id', 'industry', 'active', 'lastDate', 'lastDayPrice', 'avg30DayPrice', 'avg60DayPrice', 'avg90DayPrice',
+        'lastDayVolume', 'avg30DayVolume', 'avg60DayVolume', 'avg90DayVolume', 'ibdRelativeStrength'],
+    'daily_quotes': ['symbol', 'formatted_date', 'open', 'high', 'low', 'close', 'adjclose', 'volume'],
+    'weekly_quotes': ['symbol', 'formatted_date', 'open', 'high', 'low', 'close', 'adjclose', 'volume'],
+    'monthly_quotes': ['symbol', 'formatted_date', 'open', 'high', 'low', 'close', 'adjclose', 'volume'],
+    'candlestickpattern': ['name', 'functionName', 'sign', 'performanceRank'],
+    'screener': ['id', 'user_id', 'name', 'region', 'expression', 'priceType', 'priceLow', 'priceHigh', 'volumeType', 'volumeLow', 'volumeHigh',
+        'exchanges', 'watchlists', 'industries', 'lastUpdate'],
+    'screenertranslation': ['screener_id', 'statement', 'translation'],
+    'screenerresult': ['screener_id', 'result', 'lastUpdate'],
+    'user': ['id', 'email', 'isVerified'],
+    'watchlist': ['id', 'symbols'],
+    'notificationoutbox': ['id', 'channel', 'receiver', 'subject', 'body', 'status', 'attempts', 'lastError', 'created', 'lastUpdate'],
+}
+#tables of a snapshot, the notifications of a database aren't sent again from its snapshot
+SNAPSHOT_TABLES = [name for name in TABLE_COLUMNS if name != 'notificationoutbox']
+SCREENER_COLUMNS = ['id', 'expression', 'priceType', 'priceLow', 'priceHigh', 'volumeType', 'volumeLow', 'volumeHigh', 'exchanges', 'watchlists', 'industries', 'lastUpdate']
+
+
+class DataSource(abc.ABC):
+    """Data read and written by the screeners, a backend implements all the abstract methods.
+    The rows are tuples in the order of the columns of the query they replace:
+    - SqlDataSource: the MySQL database, or a SQLite copy of it
+    - FrameDataSource: DataFrames of the tables in memory
+    - ParquetDataSource: a snapshot of the tables in Parquet files, see exportTables
+    """
+
+    def dispose(self):
+        """Release the connections of the source, before a worker process uses it."""
+        pass
+
+    @abc.abstractmethod
+    def getTable(self, name):
+        """Return a table as a DataFrame with its TABLE_COLUMNS."""
+
+    @abc.abstractmethod
+    def getCandlestickPatterns(self):
+        """Return the (name, functionName, sign, performanceRank) of the candlestick patterns by performance rank."""
+
+    @abc.abstractmethod
+    def getSymbols(self, columns):
+        """Return the columns of the active symbols."""
+
+    @abc.abstractmethod
+    def selectSymbols(self, symbols=None, industries=None, lastDate=None, bounds=()):
+        """Return the active tickers among symbols and in one of industries when they are given, with a last date from lastDate
+        and the (column, low, high) bounds, see SymbolIndex.select."""
+
+    @abc.abstractmethod
+    def getExchangeSymbols(self, exchanges):
+        """Return the active tickers of the exchange ids."""
+
+    @abc.abstractmethod
+    def getRelativeStrength(self, symbol):
+        """Return the IBD relative strength of a symbol, None when it has none."""
+
+    @abc.abstractmethod
+    def getRelativeStrengthRanking(self, symbols, top, limit):
+        """Return the limit active symbols with the highest IBD relative strength when top is True, the lowest otherwise."""
+
+    @abc.abstractmethod
+    def queryQuotes(self, symbols, timeframe, datapoints):
+        """Return {symbol: dataframe} of the latest datapoints quotes adjusted with adjclose for the symbols having quotes."""
+
+    @abc.abstractmethod
+    def getScreeners(self, region=None, screener_id=None):
+        """Return the screeners by id with SCREENER_COLUMNS and the last update of their result."""
+
+    @abc.abstractmethod
+    def getWatchlists(self, ids):
+        """Return {str(id): symbols} of the watchlists."""
+
+    @abc.abstractmethod
+    def getTranslations(self, screener_ids):
+        """Return the (screener_id, statement, translation) of the screeners."""
+
+    @abc.abstractmethod
+    def replaceTranslation(self, screener_id, rows):
+        """Replace the (statement, translation) of a screener."""
+
+    @abc.abstractmethod
+    def getScreenerResult(self, screener_id):
+        """Return the saved result of a screener, None when it has none."""
+
+    @abc.abstractmethod
+    def getScreenerRecipients(self, screener_ids):
+        """Return the (screener id, name, user id, email of the user when verified) of the screeners."""
+
+    @abc.abstractmethod
+    def saveScreenerResults(self, results):
+        """Save the (screener_id, message) results of screeners."""
+
+    @abc.abstractmethod
+    def addNotifications(self, notifications):
+        """Add pending (id, channel, receiver, subject, body) notifications to the outbox."""
+
+    @abc.abstractmethod
+    def getPendingNotifications(self):
+        """Return the (id, channel, receiver, subject, body) of the pending notifications, the oldest first."""
+
+    @abc.abstractmethod
+    def updateNotifications(self, updates):
+        """Set the (id, status, attempts, error) of sent or failed notifications."""
+
+
+class SqlDataSource(DataSource):
+    """The MySQL database of the screeners through an sqlalchemy engine, the connections are taken from its pool."""
+
+    placeholder = '%s'
+    #query = "UPDATE screener SET result = %s, resultTimestamp = %s WHERE id = %s"
+    #the row alias needs MySQL 8.0.19 or later, VALUES(result) is deprecated since 8.0.20
+    resultsQuery = "INSERT INTO screenerresult (screener_id, result) VALUES {values} AS new ON DUPLICATE KEY UPDATE result=new.result, lastUpdate=UTC_TIMESTAMP()"
+    resultsRow = "(%s, %s)"
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    def dispose(self):
+        self._engine.dispose()   #don't share the connections of the parent process
+
+    def __fetchall(self, query):
+        with contextlib.closing(self._engine.raw_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def __execute(self, statements):
+        """Execute the (query, rows) statements with one commit."""
+        with contextlib.closing(self._engine.raw_connection()) as conn:
+            cursor = conn.cursor()
+            for query, rows in statements:
+                cursor.executemany(query, rows)
+            conn.commit()
+            cursor.close()
+
+    def getTable(self, name):
+        with contextlib.closing(self._engine.raw_connection()) as conn:
+            return pd.read_sql_query(f"SELECT {', '.join(TABLE_COLUMNS[name])} FROM {name}", conn)
+
+    def getCandlestickPatterns(self):
+        return self.__fetchall("SELECT name, functionName, sign, performanceRank FROM candlestickpattern order by performanceRank")
+
+    def getSymbols(self, columns):
+        return self.__fetchall(f"SELECT {', '.join(columns)} FROM symbols WHERE active=1")
+
+    def selectSymbols(self, symbols=None, industries=None, lastDate=None, bounds=()):
+        query = "SELECT ticker FROM symbols WHERE active=1"
+        if lastDate is not None:
+            query += f" and lastDate >= '{lastDate}'"
+        if symbols is not None:
+            query += " and ticker in (" + ', '.join(["'%s'" %symbol for symbol in symbols]) + ")"
+        for column, low, high in bounds:
+            if low is not None:
+                query += " and " + column + ">=" + str(low)
+            if high is not None:
+                query += " and " + column + "<=" + str(high)
+        if industries is not None:
+            query += " and industry in (" + ', '.join(["'%s'" %industry for industry in industries]) + ")"
+        return [row[0] for row in self.__fetchall(query)]
+
+    def getExchangeSymbols(self, exchanges):
+        return [row[0] for row in self.__fetchall(f"SELECT ticker FROM symbols WHERE active=1 and exchange_id in ({','.join([str(exchange) for exchange in exchanges])})")]
+
+    def getRelativeStrength(self, symbol):
+        rows = self.__fetchall(f"SELECT ibdRelativeStrength FROM symbols WHERE ticker = '{symbol}'")
+        return None if len(rows) == 0 else rows[0][0]
+
+    def getRelativeStrengthRanking(self, symbols, top, limit):
+        query = "SELECT ticker FROM symbols WHERE active=1 and ticker in ({}) order by ibdRelativeStrength {} limit {}" \
+            .format(','.join([f"'{symbol}'" for symbol in symbols]), 'desc' if top else 'asc', limit)
+        return [row[0] for row in self.__fetchall(query)]
+
+    def queryQuotes(self, symbols, timeframe, datapoints):
+        tablename = timeframe + '_quotes'
+        query = f"SELECT symbol, formatted_date as date, open*adjclose/close as open, high*adjclose/close as high, low*adjclose/close as low, adjclose as close, volume, \
+ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY formatted_date DESC) as rownumber FROM {tablename} WHERE symbol in (" + ', '.join(["'%s'" %symbol for symbol in symbols]) + ")"
+        query = f"SELECT symbol, date, open, high, low, close, volume FROM ({query}) as quotes WHERE rownumber <= {datapoints} ORDER BY symbol, date ASC"
+        with contextlib.closing(self._engine.raw_connection()) as conn:
+            df = pd.read_sql_query(query, conn, index_col='date')
+        return dict((symbol, group[QUOTE_COLUMNS].round(4)) for symbol, group in df.groupby('symbol', sort=False))
+
+    def getScreeners(self, region=None, screener_id=None):
+        query = f"SELECT {', '.join(['screener.' + column for column in SCREENER_COLUMNS])}, screenerresult.lastUpdate " \
+            "FROM screener LEFT JOIN screenerresult ON screenerresult.screener_id = screener.id"
+        conditions = []
+        if region is not None:
+            conditions.append(f"region = '{region}'")
+        if screener_id is not None:
+            conditions.append(f"screener.id = {screener_id}")
+        if len(conditions) > 0:
+            query += " WHERE " + ' and '.join(conditions)
+        return self.__fetchall(query + " ORDER BY screener.id")
+
+    def getWatchlists(self, ids):
+        ids = list(ids)
+        watchlists = {}
+        for i in range(0, len(ids), BATCH_SIZE):
+            rows = self.__fetchall(f"SELECT id, symbols FROM watchlist where id in ({','.join([str(id) for id in ids[i:i+BATCH_SIZE]])})")
+            watchlists.update((str(row[0]), row[1]) for row in rows)
+        return watchlists
+
+    def getTranslations(self, screener_ids):
+        rows = []
+        for i in range(0, len(screener_ids), BATCH_SIZE):
+            rows.extend(self.__fetchall(f"SELECT screener_id, statement, translation FROM screenertranslation where screener_id in ({','.join([str(screener_id) for screener_id in screener_ids[i:i+BATCH_SIZE]])})"))
+        return rows
+
+    def replaceTranslation(self, screener_id, rows):
+        with contextlib.closing(self._engine.raw_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM screenertranslation WHERE screener_id = {screener_id}")
+            if len(rows) > 0:
+                query = f"INSERT INTO screenertranslation (screener_id, statement, translation) VALUES ({', '.join([self.placeholder] * 3)})"
+                cursor.executemany(query, [(screener_id,) + tuple(row) for row in rows])
+            conn.commit()
+            cursor.close()
+
+    def getScreenerResult(self, screener_id):
+        rows = self.__fetchall(f"SELECT result FROM screenerresult WHERE screener_id = {screener_id}")
+        return None if len(rows) == 0 else rows[0][0]
+
+    def getScreenerRecipients(self, screener_ids):
+        rows = []
+        for i in range(0, len(screener_ids), BATCH_SIZE):
+            query = "SELECT screener.id, screener.name, screener.user_id, user.email FROM screener LEFT JOIN user ON user.id = screener.user_id and user.isVerified = 1 " \
+                f"WHERE screener.id in ({','.join([str(screener_id) for screener_id in screener_ids[i:i+BATCH_SIZE]])})"
+            rows.extend(self.__fetchall(query))
+        return rows
+
+    def saveScreenerResults(self, results):
+        #the multi-row statements are written here, mysqlclient 1.4 runs executemany of an INSERT with a row alias row by row
+        statements = []
+        for i in range(0, len(results), ROWS_PER_INSERT):
+            rows = results[i:i+ROWS_PER_INSERT]
+            query = self.resultsQuery.format(values=', '.join([self.resultsRow] * len(rows)))
+            statements.append((query, [tuple(value for row in rows for value in row)]))
+        self.__execute(statements)
+
+    def addNotifications(self, notifications):
+        query = f"INSERT INTO notificationoutbox (id, channel, receiver, subject, body, status) VALUES ({', '.join([self.placeholder] * 5)}, 'pending')"
+        self.__execute([(query, [tuple(notification) for notification in notifications])])
+
+    def getPendingNotifications(self):
+        return self.__fetchall("SELECT id, channel, receiver, subject, body FROM notificationoutbox WHERE status = 'pending' ORDER BY created, id")
+
+    def updateNotifications(self, updates):
+        #one statement for the notifications with the same outcome, most of them being sent at the first attempt
+        outcomes = {}
+        for outboxId, status, attempts, error in updates:
+            outcomes.setdefault((status, attempts, None if error is None else str(error)[:255]), []).append(outboxId)
+        statements = []
+        for outcome, outboxIds in outcomes.items():
+            for i in range(0, len(outboxIds), BATCH_SIZE):
+                ids = outboxIds[i:i+BATCH_SIZE]
+                query = f"UPDATE notificationoutbox SET status = {self.placeholder}, attempts = {self.placeholder}, lastError = {self.placeholder} " \
+                    f"WHERE id in ({', '.join([self.placeholder] * len(ids))})"
+                statements.append((query, [outcome + tuple(ids)]))
+        self.__execute(statements)
+
+
+class SqliteDataSource(SqlDataSource):
+    """A SQLite database with the tables of the MySQL one, e.g. a copy on a compute node or the database of screenerBenchmark.py."""
+
+    placeholder = '?'
+    resultsQuery = "INSERT INTO screenerresult (screener_id, result, lastUpdate) VALUES {values} " \
+        "ON CONFLICT(screener_id) DO UPDATE SET result=excluded.result, lastUpdate=CURRENT_TIMESTAMP"
+    resultsRow = "(?, ?, CURRENT_TIMESTAMP)"
+
+
+class FrameDataSource(DataSource):
+    """The tables as DataFrames in memory, {name: DataFrame} with the TABLE_COLUMNS, a missing table being empty.
+    The quotes of a timeframe are sorted and adjusted once, then each query slices them.
+    What the screeners write is kept in the DataFrames, to be read with getTable.
+    """
+
+    def __init__(self, tables=None):
+        self._tables = dict(tables or {})
+        self._quotes = {}   #timeframe: (adjusted quotes sorted by symbol and date, {symbol: (start, end)})
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def load(source, names=SNAPSHOT_TABLES):
+        """Return a FrameDataSource with the tables of another source, e.g. to screen a database without a query per batch."""
+        return FrameDataSource(dict((name, source.getTable(name)) for name in names))
+
+    def getTable(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = self._readTable(name)
+            return self._tables[name]
+
+    def _readTable(self, name):
+        return pd.DataFrame(columns=TABLE_COLUMNS[name])
+
+    @staticmethod
+    def __getRows(df, columns):
+        values = df[columns].astype(object)
+        return list(values.where(values.notna(), None).itertuples(index=False, name=None))
+
+    def __getActiveSymbols(self):
+        symbols = self.getTable('symbols')
+        return symbols[symbols['active'] == 1]
+
+    def __append(self, name, rows):
+        with self._lock:
+            self._tables[name] = pd.concat([self.getTable(name), pd.DataFrame(rows, columns=TABLE_COLUMNS[name])], ignore_index=True, sort=False)
+
+    def getCandlestickPatterns(self):
+        return self.__getRows(self.getTable('candlestickpattern').sort_values('performanceRank', kind='mergesort'), TABLE_COLUMNS['candlestickpattern'])
+
+    def getSymbols(self, columns):
+        return self.__getRows(self.__getActiveSymbols(), columns)
+
+    def selectSymbols(self, symbols=None, industries=None, lastDate=None, bounds=()):
+        df = self.__getActiveSymbols()
+        mask = np.ones(len(df), dtype=bool)
+        if lastDate is not None:
+            mask &= (pd.to_datetime(df['lastDate']) >= pd.Timestamp(lastDate)).values
+        if symbols is not None:
+            mask &= df['ticker'].isin(list(symbols)).values
+        for column, low, high in bounds:
+            if low is not None:
+                mask &= (df[column] >= float(low)).values
+            if high is not None:
+                mask &= (df[column] <= float(high)).values
+        if industries is not None:
+            mask &= df['industry'].isin(list(industries)).values
+        return df['ticker'][mask].tolist()
+
+    def getExchangeSymbols(self, exchanges):
+        df = self.__getActiveSymbols()
+        return df['ticker'][df['exchange_id'].astype(str).isin([str(exchange) for exchange in exchanges])].tolist()
+
+    def getRelativeStrength(self, symbol):
+        symbols = self.getTable('symbols')
+        values = symbols['ibdRelativeStrength'][symbols['ticker'] == symbol]
+        return None if len(values) == 0 or pd.isna(values.iloc[0]) else values.iloc[0]
+
+    def getRelativeStrengthRanking(self, symbols, top, limit):
+        df = self.__getActiveSymbols()
+        df = df[df['ticker'].isin(list(symbols))]
+        #as MySQL, the symbols without relative strength come first in ascending order
+        df = df.sort_values('ibdRelativeStrength', ascending=not top, kind='mergesort', na_position='last' if top else 'first')
+        return df['ticker'][:int(limit)].tolist()
+
+    def __getQuotes(self, timeframe):
+        with self._lock:
+            if timeframe not in self._quotes:
+                df = self.getTable(timeframe + '_quotes')
+                df = df.assign(date=pd.to_datetime(df['formatted_date'])).sort_values(['symbol', 'date'], kind='mergesort')
+                quotes = pd.DataFrame({'open': df['open']*df['adjclose']/df['close'], 'high': df['high']*df['adjclose']/df['close'],
+                    'low': df['low']*df['adjclose']/df['close'], 'close': df['adjclose'], 'volume': df['volume']}).round(4)
+                quotes.index = pd.DatetimeIndex(df['date'].values, name='date')
+                symbols, starts = np.unique(df['symbol'].values.astype(str), return_index=True)
+                ends = np.append(starts[1:], len(df))
+                self._quotes[timeframe] = (quotes, dict(zip(symbols, zip(starts, ends))))
+            return self._quotes[timeframe]
+
+    def queryQuotes(self, symbols, timeframe, datapoints):
+        quotes, positions = self.__getQuotes(timeframe)
+        results = {}
+        for symbol in symbols:
+            if symbol in positions:
+                start, end = positions[symbol]
+                results[symbol] = quotes.iloc[max(start, end - datapoints):end].copy()
+        return results
+
+    def getScreeners(self, region=None, screener_id=None):
+        screeners = self.getTable('screener')
+        if region is not None:
+            screeners = screeners[screeners['region'] == region]
+        if screener_id is not None:
+            screeners = screeners[screeners['id'] == screener_id]
+        results = self.getTable('screenerresult')
+        screeners = screeners.assign(resultLastUpdate=screeners['id'].map(dict(zip(results['screener_id'], results['lastUpdate'])))).sort_values('id', kind='mergesort')
+        return self.__getRows(screeners, SCREENER_COLUMNS + ['resultLastUpdate'])
+
+    def getWatchlists(self, ids):
+        watchlists = self.getTable('watchlist')
+        watchlists = watchlists[watchlists['id'].astype(str).isin([str(id) for id in ids])]
+        return dict((str(id), symbols) for id, symbols in self.__getRows(watchlists, ['id', 'symbols']))
+
+    def getTranslations(self, screener_ids):
+        translations = self.getTable('screenertranslation')
+        return self.__getRows(translations[translations['screener_id'].isin(list(screener_ids))], TABLE_COLUMNS['screenertranslation'])
+
+    def replaceTranslation(self, screener_id, rows):
+        with self._lock:
+            translations = self.getTable('screenertranslation')
+            self._tables['screenertranslation'] = translations[translations['screener_id'] != screener_id]
+            self.__append('screenertranslation', [(screener_id,) + tuple(row) for row in rows])
+
+    def getScreenerResult(self, screener_id):
+        results = self.getTable('screenerresult')
+        values = results['result'][results['screener_id'] == screener_id]
+        return None if len(values) == 0 else values.iloc[-1]
+
+    def getScreenerRecipients(self, screener_ids):
+        screeners = self.getTable('screener')
+        screeners = screeners[screeners['id'].isin(list(screener_ids))]
+        users = self.getTable('user')
+        users = users[users['isVerified'] == 1]
+        return self.__getRows(screeners.assign(email=screeners['user_id'].map(dict(zip(users['id'], users['email'])))), ['id', 'name', 'user_id', 'email'])
+
+    def saveScreenerResults(self, results):
+        with self._lock:
+            ids = set(screener_id for screener_id, message in results)
+            saved = self.getTable('screenerresult')
+            self._tables['screenerresult'] = saved[~saved['screener_id'].isin(list(ids))]
+            now = pd.Timestamp.utcnow().tz_localize(None)
+            self.__append('screenerresult', [(screener_id, message, now) for screener_id, message in results])
+
+    def addNotifications(self, notifications):
+        now = pd.Timestamp.utcnow().tz_localize(None)
+        self.__append('notificationoutbox', [tuple(notification) + ('pending', 0, None, now, now) for notification in notifications])
+
+    def getPendingNotifications(self):
+        outbox = self.getTable('notificationoutbox')
+        return self.__getRows(outbox[outbox['status'] == 'pending'].sort_values(['created', 'id'], kind='mergesort'), ['id', 'channel', 'receiver', 'subject', 'body'])
+
+    def updateNotifications(self, updates):
+        with self._lock:
+            outbox = self.getTable('notificationoutbox').copy()
+            now = pd.Timestamp.utcnow().tz_localize(None)
+            for outboxId, status, attempts, error in updates:
+                row = outbox['id'] == outboxId
+                outbox.loc[row, 'status'] = status
+                outbox.loc[row, 'attempts'] = attempts
+                outbox.loc[row, 'lastError'] = None if error is None else str(error)[:255]
+                outbox.loc[row, 'lastUpdate'] = now
+            self._tables['notificationoutbox'] = outbox
+
+
+class ParquetDataSource(FrameDataSource):
+    """A snapshot of the tables in {table}.parquet files of a directory, written by exportTables (pyarrow or fastparquet is needed).
+    A table is read when first used, so the worker processes forked afterwards share it.
+    The snapshot isn't modified, what the screeners write is only kept in memory.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self._path = path
+
+    def _readTable(self, name):
+        path = os.path.join(self._path, name + '.parquet')
+        if not os.path.exists(path):
+            return super()._readTable(name)
+        return pd.read_parquet(path, columns=TABLE_COLUMNS[name])
+
+
+def exportTables(source, path, logger, names=SNAPSHOT_TABLES):
+    """Write the tables of a source to {table}.parquet files in path, the snapshot read by ParquetDataSource.
+    Each file is written to a temporary one first, so a reader never opens a partial file."""
+    os.makedirs(path, exist_ok=True)
+    for name in names:
+        try:
+            df = source.getTable(name)
+        except Exception as e:
+            logger.warning(f'{name} is not exported: {e}')
+            continue
+        temporaryPath = os.path.join(path, name + '.parquet.tmp')
+        df.to_parquet(temporaryPath, index=False)
+        os.replace(temporaryPath, os.path.join(path, name + '.parquet'))
+        logger.info(f'{name}: {len(df)} rows exported')
+
+def openDataSource(url):
+    """Return the source of a url: parquet:///path/to/snapshot for a ParquetDataSource, an sqlalchemy url otherwise."""
+    if url.startswith('parquet://'):
+        return ParquetDataSource(url[len('parquet://'):])
+    from sqlalchemy import create_engine
+    return getSqlDataSource(create_engine(url))
+
+def getSqlDataSource(engine):
+    return SqliteDataSource(engine) if engine.dialect.name == 'sqlite' else SqlDataSource(engine)
+
+#source of the current process, set by useDataSource, otherwise the database of utils.engine or the snapshot of SCREENER_DATABASE_URL
+currentSource = None
+sourceLock = threading.Lock()
+
+def useDataSource(source):
+    global currentSource
+    currentSource = source
+
+def getDataSource():
+    global currentSource
+    with sourceLock:
+        if currentSource is None:
+            url = os.getenv('SCREENER_DATABASE_URL', '')
+            currentSource = openDataSource(url) if url.startswith('parquet://') else getSqlDataSource(utils.getEngine())
+    return currentSource
+
+
+def main():
+    #export the tables of the database to a snapshot read by genericScreener.py -d parquet://<path>
+    path = 'snapshot'
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "p:")
+    except getopt.GetoptError:
+        print(f'Usage: {os.path.basename(__file__)} [-p] [<path>]')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-p", "--path"):
+            path = arg
+
+    logging.config.fileConfig("logging.cfg")
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.info('export snapshot - start')
+    exportTables(getDataSource(), path, logger)
+    logger.info('export snapshot - end')
+
+
+if __name__ == '__main__':
+    main()
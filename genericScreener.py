@@ -2,29 +2,53 @@
 
 import pandas as pd
 import numpy as np
-import re, json
-from ta import *
-import sys, os, logging, logging.config, traceback, concurrent_log_handler, getopt
+import re, json, ast, functools, importlib
+import sys, os, logging, logging.config, traceback, getopt
 import multiprocessing as mp
 import contextlib
+import asyncio
 import heapq  
-import talib
+import zlib, hashlib
+from collections import OrderedDict
 from datetime import datetime, timedelta
 #import numba as nb
-#from timeit import default_timer as timer
+from timeit import default_timer as timer
 
 # Internal imports
 import utils
-
-logging.config.fileConfig("logging.cfg")
+import quoteStore
+import indicatorState
+import patternIndex
+import notificationDispatcher
+import symbolIndex
+import screenerProfiler
+import dataSource
+
+#configured by main, an application importing the module configures its own logging
 logger = logging.getLogger(os.path.basename(__file__))
 
 #define constants 
 IBDRS = 'ibd relative strength'
+QUOTES_BATCH_SIZE = 500   #number of symbols whose quotes are fetched together in one query
+SCREENING_MODES = ['symbol', 'panel']
+INDICATOR_CACHE_BUDGET = 256 * 1024 * 1024   #bytes of indicator values each worker keeps for a runScreeners pass
+#estimated costs of the statements, the cheapest operands of an and/or are evaluated first
+PRICE_COST = 1   #open, high, low, close, volume and range are read from the quotes
+INDICATOR_COST = 10   #ta indicator
+CANDLESTICK_COST = 100   #TA-Lib candlestick pattern scan
+PIPELINE_QUEUE_SIZE = 8   #screeners waiting between two stages of runScreeners, see ScreenerPipeline
+TRANSLATION_CACHE_SIZE = 10000   #statements whose translation is kept, see translateStatement
+RESULTS_BATCH_SIZE = 100   #screener results saved together by runScreeners
+PROFILE_LOGGED_PHASES = 10   #most expensive phases logged at the end of a profiled run
+CANDLESTICK_LOOKBACK = 20   #bars read before a bar to detect a pattern on it, when TA-Lib doesn't tell
+STATEMENT_TYPES = {1: 'is above/below', 2: 'is in between', 3: 'crossed above/below', 4: 'gained', 4.1: 'dropped', 5: 'increase', 5.1: 'decrease',
+    6: 'reach high/low', 7: 'top', 8: 'bottom', 99: 'form'}   #labels of the statement phases of the profiler, see MyScreener.__translate
 
 #group ta names by number of parameters
 ta_names = {} 
 TA_MAPPING = dict((k.lower(), v) for k,v in utils.ta_mapping.items())
+#ta functions, name: (function name, data series, number of parameters), see getTaAttribute
+TA_FUNCTIONS = dict((k, (v[0], v[1:-1], v[-1])) for k, v in TA_MAPPING.items())
 #sort by name in descending order to make sure the longest name is matched
 sorted_ta_mapping = {k: v for k, v in sorted(TA_MAPPING.items(), key=lambda x: x[0], reverse=True)}
 for k, v in sorted_ta_mapping.items():
@@ -48,9 +72,6 @@ INDICATOR_FUNCTION = r'(min|max|avg)\s*\(\s*({}|open|high|low|close|volume|range
 INDICATOR = r'((daily|weekly|monthly)\s+)?({0}|{1})(\s+[1-9]\d*\s+{2}\s+ago)?'.format(INDICATOR_PLAIN, INDICATOR_FUNCTION, PERIOD)
 #logger.debug(indicator)
 
-CP_NAMES = '|'.join([name.lower().replace(' ', '\s+') for name in sorted(utils.get_cp_mapping().keys(), reverse=True)])
-CANDLESTICK_PATTERN = r'((?P<timeframe>daily|weekly|monthly)\s+)?(?P<cspattern>{0})'.format(CP_NAMES)
-
 IS_ABOVE_BELOW_BETWEEN = r'''(?P<indicator>({0}))\s+(is|was|has\s+been|had\s+been)\s+            
     ((?P<more_less>((more|less)\s+than\s+\d+\.?\d*(%|\s+point|\s+points)\s+))?(?P<above_below>above|below)\s+((?P<above_below_indicator>({0}))|(?P<above_below_value>-?\d+\.?\d*))                    
     | ((?P<between>from)\s+((?P<between_indicator1>({0}))|(?P<between_value1>-?\d+\.?\d*))\s+to\s+((?P<between_indicator2>({0}))|(?P<between_value2>-?\d+\.?\d*))))                        
@@ -74,12 +95,39 @@ REACHED_HIGH_LOW = r'''(?P<indicator>({0}))\s+(reached|has\s+reached)\s+
 TOP_BOTTOM = r'''(?P<top_botom>top|bottom)\s+(?P<number>[1-9]\d*)\s+
     ((?P<indicator>({0}))|IBD\s+Relative\s+Strength)'''.format(INDICATOR)
 
-FORMED = r'''{0}\s+(formed|has\s+formed)(\s+within\s+the\s+last\s+(?P<duration>[1-9]\d*\s+{1}))?'''.format(CANDLESTICK_PATTERN, PERIOD)
+def getFormedPattern():
+    """The names of the candlestick patterns are read from the database, when the first statement needs them."""
+    cpNames = '|'.join([name.lower().replace(' ', '\s+') for name in sorted(utils.get_cp_mapping().keys(), reverse=True)])
+    candlestickPattern = r'((?P<timeframe>daily|weekly|monthly)\s+)?(?P<cspattern>{0})'.format(cpNames)
+    return r'''{0}\s+(formed|has\s+formed)(\s+within\s+the\s+last\s+(?P<duration>[1-9]\d*\s+{1}))?'''.format(candlestickPattern, PERIOD)
+
+class LazyRegex:
+    """Regular expression compiled when it is first searched, pattern being a string or a function returning it.
+    Compiling the grammars takes most of the time of importing the module."""
+
+    def __init__(self, pattern, flags=0):
+        self._pattern = pattern
+        self._flags = flags
+        self._regex = None
+
+    def search(self, string):
+        if self._regex is None:
+            self._regex = re.compile(self._pattern() if callable(self._pattern) else self._pattern, self._flags)
+        return self._regex.search(string)
 
 indicator_1 = r'((?P<timeframe>daily|weekly|monthly)\s+)?(?P<indicator>{0})(?P<offset>\s+[1-9]\d*\s+{1}\s+ago)?'.format(INDICATOR_PLAIN, PERIOD)
 indicator_2 = r'((?P<timeframe>daily|weekly|monthly)\s+)?(min|max|avg)\s*\(\s*(?P<indicator>{0}),\s*(?P<range>[1-9]\d*)\s*\)\s*(?P<offset>\s+[1-9]\d*\s+{1}\s+ago)?'.format(INDICATOR_PLAIN, PERIOD)
-PLAIN_INDICATOR_RE = re.compile(indicator_1, re.IGNORECASE | re.VERBOSE)
-AGGREGATE_INDICATOR_RE = re.compile(indicator_2, re.IGNORECASE | re.VERBOSE)
+PLAIN_INDICATOR_RE = LazyRegex(indicator_1, re.IGNORECASE | re.VERBOSE)
+AGGREGATE_INDICATOR_RE = LazyRegex(indicator_2, re.IGNORECASE | re.VERBOSE)
+EXPRESSION_TOKEN_RE = re.compile(r'(\[|\]| and | or |[*])')   #operators of an expression, statements are in between
+#grammars of the statements, tried in this order by parseStatement
+IS_ABOVE_BELOW_BETWEEN_RE = LazyRegex(IS_ABOVE_BELOW_BETWEEN, re.IGNORECASE | re.VERBOSE)
+CROSSED_ABOVE_BELOW_RE = LazyRegex(CROSSED_ABOVE_BELOW, re.IGNORECASE | re.VERBOSE)
+DROPPED_GAINED_RE = LazyRegex(DROPPED_GAINED, re.IGNORECASE | re.VERBOSE)
+INCREASING_DECREASING_RE = LazyRegex(INCREASING_DECREASING, re.IGNORECASE | re.VERBOSE)
+REACHED_HIGH_LOW_RE = LazyRegex(REACHED_HIGH_LOW, re.IGNORECASE | re.VERBOSE)
+TOP_BOTTOM_RE = LazyRegex(TOP_BOTTOM, re.IGNORECASE | re.VERBOSE)
+FORMED_RE = LazyRegex(getFormedPattern, re.IGNORECASE | re.VERBOSE)
 
 
 def evaluate(a):
@@ -92,11 +140,248 @@ def tolist(pandas_series):
     return None if pandas_series is None else pandas_series.fillna(-999999999).round(4).tolist()
     #return None if pandas_series is None else pandas_series.fillna(method='bfill').dropna().round(4).tolist()
 
+class IndicatorCache:
+    """Least recently used cache of calculated indicators, reused by all the screeners of a runScreeners pass.
+    Entries are keyed by (symbol, timeframe, canonical indicator, number of bars, date of the last bar),
+    so an indicator is only reused when it was calculated from exactly the same quotes.
+    Candlestick pattern results are kept in the same way.
+    """
+
+    def __init__(self, budget=INDICATOR_CACHE_BUDGET):
+        self._budget = budget
+        self._size = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def getKey(symbol, timeframe, indicator, df):
+        """indicator is canonical, see getCanonicalIndicator."""
+        return (symbol, timeframe, indicator, len(df), df.index[-1] if len(df) > 0 else None)
+
+    @staticmethod
+    def getSize(series):
+        return 64 + series.memory_usage(index=False) if isinstance(series, pd.Series) else 64
+
+    def lookup(self, key):
+        """Return (found, series), a failed calculation is cached as None."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return (True, self._entries[key])
+        self.misses += 1
+        return (False, None)
+
+    def store(self, key, series):
+        if key in self._entries:
+            return
+        self._entries[key] = series
+        self._size += IndicatorCache.getSize(series)
+        while self._size > self._budget and len(self._entries) > 1:
+            key, series = self._entries.popitem(last=False)
+            self._size -= IndicatorCache.getSize(series)
+            self.evictions += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self._size}
+
+#ta classes and the functions computing one of their outputs, see getTaFamily; the indicators of a family with the same data series 
+#and parameters share one object, e.g. macd(12,26,9), macd signal(12,26,9) and macd histogram(12,26,9) share MACD(close, 26, 12, 9).
+#Ichimoku isn't a family, its functions don't pass their parameters to the class in the same way.
+TA_FAMILY_FUNCTIONS = {'trend.MACD': ['macd', 'macd_signal', 'macd_diff'], 
+                       'trend.ADXIndicator': ['adx', 'adx_pos', 'adx_neg'],
+                       'trend.AroonIndicator': ['aroon_up', 'aroon_down'],
+                       'trend.VortexIndicator': ['vortex_indicator_pos', 'vortex_indicator_neg'],
+                       'trend.PSARIndicator': ['psar_up', 'psar_down', 'psar_up_indicator', 'psar_down_indicator'],
+                       'volatility.BollingerBands': ['bollinger_mavg', 'bollinger_hband', 'bollinger_lband', 'bollinger_wband', 'bollinger_pband'],
+                       'volatility.KeltnerChannel': ['keltner_channel_hband', 'keltner_channel_lband', 'keltner_channel_mband', 'keltner_channel_wband', 'keltner_channel_pband'],
+                       'volatility.DonchianChannel': ['donchian_channel_hband', 'donchian_channel_lband', 'donchian_channel_mband', 'donchian_channel_wband', 'donchian_channel_pband']}
+
+#indicators calculated at once for a panel of bars x symbols, exactly like the ta functions do for a single symbol
+PANEL_FUNCTIONS = {
+    'trend.sma_indicator': lambda panel, n: panel.rolling(window=n, min_periods=n).mean(),
+    'trend.ema_indicator': lambda panel, n: panel.ewm(span=n, min_periods=n, adjust=False).mean()
+}
+
+#cache of the current worker process, created by initWorker
+indicatorCache = None
+#statements and indicator calculations (ta indicators and candlestick scans) of the current process, per symbol
+evaluationStats = {'statements': 0, 'skippedStatements': 0, 'calculations': 0, 'skippedCalculations': 0}
+
+#quote store read instead of the database, states of its indicators and index of its candlestick patterns, set by useQuoteStore
+localStore = None
+localStates = None
+localPatterns = None
+#active symbols of the run, set by runScreeners, the screeners query the symbols table when it is None
+localSymbols = None
+
+#plan of the screener run by the current worker process, set by setWorkerPlan
+workerPlan = None
+#symbol batches screened by the current process and the seconds spent loading their quotes and screening them
+batchStats = {'batches': 0, 'symbols': 0, 'quotesSeconds': 0.0, 'screeningSeconds': 0.0}
+#phases timed by the current process when the run is profiled, see screenerProfiler.py
+profiler = None
+
+def profile(phase, label=None, screener=None):
+    """Time a phase with the profiler of the current process, do nothing when the run isn't profiled."""
+    return screenerProfiler.timePhase(profiler, phase, label, screener)
+
+def useQuoteStore(path, lastDates=None):
+    """Read the quotes from the quote store at path (see quoteStore.py), or from the database when path is None.
+    The symbols whose stored quotes end before their lastDates are read from the database."""
+    global localStore, localStates, localPatterns
+    localStore = None if path is None else quoteStore.QuoteStore(path, lastDates)
+    localStates = None if path is None else indicatorState.IndicatorStates(path)
+    localPatterns = None if path is None else patternIndex.PatternIndex(path)
+
+def initWorker(cacheBudget, storePath=None, profiling=False, lastDates=None):
+    """Initialize a worker process, its connections to the database are kept for all the batches it screens."""
+    global indicatorCache, workerPlan, profiler
+    dataSource.getDataSource().dispose()   #don't share the connections of the parent process
+    indicatorCache = IndicatorCache(cacheBudget)
+    useQuoteStore(storePath, lastDates)
+    workerPlan = None
+    profiler = screenerProfiler.ScreenerProfiler() if profiling else None
+    for k in evaluationStats.keys():
+        evaluationStats[k] = 0
+    for k in batchStats.keys():
+        batchStats[k] = 0
+
+def setWorkerPlan(planId, tree, timeframes, translation, mode, screenerId=None):
+    """Keep the plan of a screener in the current worker process, so the batches of its symbols only carry planId."""
+    global workerPlan
+    workerPlan = (planId, tree, timeframes, translation, mode, compileTranslation(translation))
+    if profiler is not None:
+        profiler.screener = screenerId
+
+def screenPlannedBatch(planId, symbols):
+    """Screen a batch of symbols with the plan set by setWorkerPlan, in the mode of the plan."""
+    if workerPlan is None or workerPlan[0] != planId:
+        raise Exception(f'Unknown screening plan {planId}')
+    planId, tree, timeframes, translation, mode, plan = workerPlan
+    start = timer()
+    quotes = loadQuotes(symbols, timeframes)
+    loaded = timer()
+    screenBatch = MyScreener.screenPanel if mode == 'panel' else MyScreener.screenBatch
+    results = screenBatch(symbols, tree, timeframes, translation, quotes, plan)
+    end = timer()
+    batchStats['batches'] += 1
+    batchStats['symbols'] += len(symbols)
+    batchStats['quotesSeconds'] += loaded - start
+    batchStats['screeningSeconds'] += end - loaded
+    logger.debug(f'batch of {len(symbols)} symbols: {loaded - start:.3f}s loading quotes, {end - loaded:.3f}s screening')
+    return results
+
+def getIndicatorCacheStats():
+    return None if indicatorCache is None else indicatorCache.stats()
+
+def getEvaluationStats():
+    return dict(evaluationStats)
+
+def getBatchStats():
+    return dict(batchStats)
+
+def getProfilerPhases():
+    return None if profiler is None else profiler.getPhases()
+
+def countEvaluation(translation, statements, calculations, symbols=1):
+    """Add the statements evaluated and the indicators calculated for some symbols to evaluationStats."""
+    names = set()
+    for k, v in translation.items():
+        if v[0] == 99:
+            names.add(k)   #a candlestick scan per statement
+        else:
+            names.update(indicator[0] + ' ' + indicator[1] for indicator in getStatementIndicators(v))
+    evaluationStats['statements'] += statements * symbols
+    evaluationStats['skippedStatements'] += (len(translation) - statements) * symbols
+    evaluationStats['calculations'] += calculations * symbols
+    evaluationStats['skippedCalculations'] += (len(names) - calculations) * symbols
+
+
+class ScreenerPool:
+    """Worker processes kept for a whole runScreeners pass. 
+    A symbol is always screened by the same worker, so the indicators cached by that worker for one screener 
+    are reused by the next screeners. The plan of a screener is sent once to each worker, then only the symbol batches.
+    The workers are forked from the process that imported the modules, and started before the first screener.
+    """
+
+    def __init__(self, processes=None, cacheBudget=INDICATOR_CACHE_BUDGET, storePath=None, profiling=False, lastDates=None):
+        if processes is None:
+            processes = mp.cpu_count()   #this process is mainly cpu bound
+        start = timer()
+        self._pools = [mp.Pool(processes=1, initializer=initWorker, initargs=(cacheBudget, storePath, profiling, lastDates)) for i in range(processes)]
+        for pool in self._pools:
+            pool.apply(getBatchStats)   #wait for the worker to be initialized
+        self.startupSeconds = timer() - start
+        self._planId = 0
+
+    @property
+    def processes(self):
+        return len(self._pools)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.terminate()
+
+    def terminate(self):
+        for pool in self._pools:
+            pool.terminate()
+        for pool in self._pools:
+            pool.join()
+
+    def screen(self, symbols, tree, timeframes, translation, mode='symbol', screenerId=None):
+        """Return the screening results in the order of the given symbols, tree is the parsed expression (see parseExpression)."""
+        self._planId += 1
+        partitions = [[] for pool in self._pools]
+        for symbol in symbols:
+            partitions[zlib.crc32(symbol.encode()) % len(self._pools)].append(symbol)
+        plans = []
+        tasks = []
+        for pool, partition in zip(self._pools, partitions):
+            if len(partition) == 0:
+                continue
+            #a pool has a single process, which runs its tasks in order
+            plans.append(pool.apply_async(setWorkerPlan, (self._planId, tree, timeframes, translation, mode, screenerId)))
+            for i in range(0, len(partition), QUOTES_BATCH_SIZE):
+                batch = partition[i:i+QUOTES_BATCH_SIZE]
+                tasks.append((batch, pool.apply_async(screenPlannedBatch, (self._planId, batch))))
+        for plan in plans:
+            plan.get()
+        results = {}
+        for batch, task in tasks:
+            results.update(zip(batch, task.get()))
+        return [results[symbol] for symbol in symbols]
+
+    def getCacheStats(self):
+        return self.__sumStats(getIndicatorCacheStats)
+
+    def getEvaluationStats(self):
+        return self.__sumStats(getEvaluationStats)
+
+    def getBatchStats(self):
+        return self.__sumStats(getBatchStats)
+
+    def getProfilerPhases(self):
+        """Return the phases timed by each worker, None for the workers not profiling."""
+        return [pool.apply(getProfilerPhases) for pool in self._pools]
+
+    def __sumStats(self, getStats):
+        stats = {}
+        for pool in self._pools:
+            for k, v in pool.apply(getStats).items():
+                stats[k] = stats.get(k, 0) + v
+        return stats
+
+
 class MyScreener:
 
     def __init__(self):
         self._id = None
         self._expression = None
+        self._expressionTree = None
         self._exchanges = None
         self._symbols = None
         self._priceType = None
@@ -123,6 +408,13 @@ class MyScreener:
     @expression.setter
     def expression(self, value):
         self._expression = value
+        self._expressionTree = None
+
+    @property
+    def expressionTree(self):
+        if self._expressionTree is None and self._expression is not None:
+            self._expressionTree = parseExpression(self._expression)
+        return self._expressionTree
         
     @property
     def exchanges(self):
@@ -220,179 +512,10 @@ class MyScreener:
             7 - 'top'
             8 - 'bottom'
             99 - 'form' (candlestick pattern)
-        """        
-        
-        sceenerRegex = re.compile(IS_ABOVE_BELOW_BETWEEN, re.IGNORECASE | re.VERBOSE)
-        mo = sceenerRegex.search(statement)
-        if mo is not None:
-            logger.debug(f"{mo.group('indicator')}, {mo.group('more_less')}, {mo.group('above_below')}, {mo.group('above_below_indicator')}, {mo.group('above_below_value')}, \
-{mo.group('between')}, {mo.group('between_indicator1')}, {mo.group('between_value1')}, {mo.group('between_indicator2')}, {mo.group('between_value2')}, {mo.group('duration')}")
-            indicator = mo.group('indicator').strip().lower()
-            value1 = getIndicatorComponents(indicator)
-            duration = mo.group('duration')
-            if duration is not None:
-                duration = getOffset(duration.strip(), value1[0])
-                value1[-1] += duration
-
-            if mo.group('above_below') is not None:
-                type = 1
-                comparator = [None if mo.group('more_less') is None else mo.group('more_less').strip(), mo.group('above_below')]
-                value2 = mo.group('above_below_value')
-                if value2 is not None:
-                    if duration is not None or statement.rstrip().endswith(value2):
-                        return [type, value1, comparator, value2, duration]
-                value2 = mo.group('above_below_indicator')
-                if value2 is not None:
-                    value2 = getIndicatorComponents(value2.strip().lower())
-                    if duration is not None:
-                        if value1[0] == value2[0]:
-                            value2[-1] += duration
-                        else:
-                            value2[-1] += getOffset(mo.group('duration'), value2[0])
-                    if duration is not None or statement.rstrip().endswith(mo.group('above_below_indicator')):
-                        return [type, value1, comparator, value2, duration]
-
-            if mo.group('between') is not None:
-                type = 2
-                between_value1 = mo.group('between_value1')
-                between_indicator1 = mo.group('between_indicator1')
-                if between_indicator1 is not None:
-                    between_indicator1 = mo.group('between_indicator1').strip().lower()
-                    between_value1 = getIndicatorComponents(between_indicator1)
-                    if duration is not None:
-                        if value1[0] == between_value1[0]:
-                            between_value1[-1] += duration
-                        else:
-                            between_value1[-1] += getOffset(mo.group('duration'), between_value1[0])
-                between_value2 = mo.group('between_value2')
-                if between_value2 is not None:
-                    noduration = statement.rstrip().endswith(between_value2)
-                between_indicator2 = mo.group('between_indicator2')
-                if between_indicator2 is not None:
-                    noduration = statement.rstrip().endswith(between_indicator2)
-                    between_value2 = getIndicatorComponents(between_indicator2.strip().lower())
-                    if duration is not None:
-                        if value1[0] == between_value2[0]:
-                            between_value2[-1] += duration
-                        else:
-                            between_value2[-1] += getOffset(mo.group('duration'), between_value2[0])
-                if between_value1 is not None and between_value2 is not None:
-                    if duration is not None or noduration:
-                        return [type, value1, between_value1, between_value2, duration]
-
-        sceenerRegex = re.compile(CROSSED_ABOVE_BELOW, re.IGNORECASE | re.VERBOSE)
-        mo = sceenerRegex.search(statement)
-        if mo is not None:
-            type = 3
-            logger.debug(f"{mo.group('indicator')}, {mo.group('above_below')}, {mo.group('above_below_indicator')}, {mo.group('above_below_value')}, {mo.group('duration')}")
-            indicator = mo.group('indicator').strip().lower()
-            value1 = getIndicatorComponents(indicator)
-            duration = mo.group('duration')
-            if duration is not None:
-                duration = getOffset(duration.strip(), value1[0])
-                value1[-1] += duration
-            comparator = mo.group('above_below')
-            value2 = mo.group('above_below_value')
-            if value2 is not None:
-                if duration is not None or statement.rstrip().endswith(value2):
-                    return [type, value1, comparator, value2, duration]
-            value2 = mo.group('above_below_indicator')
-            if value2 is not None:
-                value2 = getIndicatorComponents(value2.strip().lower())
-                if duration is not None:
-                    if value1[0] == value2[0]:
-                        value2[-1] += duration
-                    else:
-                        value2[-1] += getOffset(mo.group('duration'), value2[0])
-                if duration is not None or statement.rstrip().endswith(mo.group('above_below_indicator')):
-                    return [type, value1, comparator, value2, duration]
-
-        sceenerRegex = re.compile(DROPPED_GAINED, re.IGNORECASE | re.VERBOSE)
-        mo = sceenerRegex.search(statement)
-        if mo is not None:
-            logger.debug(f"{mo.group('indicator')}, {mo.group('verb')}, {mo.group('more_less')}, {mo.group('duration')}")
-            if mo.group('verb').lower() == 'gained':
-                type = 4
-            else:
-                type = 4.1
-            indicator = mo.group('indicator').strip().lower()
-            value1 = getIndicatorComponents(indicator)
-            duration = mo.group('duration')
-            if duration is not None:
-                duration = getOffset(duration.strip(), value1[0])
-                value1[-1] += duration
-            comparator = mo.group('more_less')
-            if duration is not None or statement.rstrip().endswith(comparator):
-                return [type, value1, comparator, duration]
-    
-        sceenerRegex = re.compile(INCREASING_DECREASING, re.IGNORECASE | re.VERBOSE)
-        mo = sceenerRegex.search(statement)
-        if mo is not None:
-            logger.debug(f"{mo.group('indicator')}, {mo.group('verb')}, {mo.group('duration')}")
-            if mo.group('verb').lower() == 'increasing':
-                type = 5
-            else:
-                type = 5.1
-            indicator = mo.group('indicator').strip().lower()
-            value1 = getIndicatorComponents(indicator)
-            duration = mo.group('duration')
-            duration = getOffset(duration.strip(), value1[0])
-            value1[-1] += duration
-            return [type, value1, duration]
-    
-        sceenerRegex = re.compile(REACHED_HIGH_LOW, re.IGNORECASE | re.VERBOSE)
-        mo = sceenerRegex.search(statement)
-        if mo is not None:
-            type = 6
-            logger.debug(f"{mo.group('indicator')}, {mo.group('high_low')}, {mo.group('duration')}")
-            indicator = mo.group('indicator').strip().lower()
-            value1 = getIndicatorComponents(indicator)
-            duration = mo.group('duration')
-            if duration is not None:
-                duration = getOffset(duration.strip(), value1[0])
-                value1[-1] += duration
-            value2 = mo.group('high_low')
-            if duration is not None or statement.rstrip().endswith(value2):
-                return [type, value1, value2, duration]
-
-        sceenerRegex = re.compile(TOP_BOTTOM, re.IGNORECASE | re.VERBOSE)
-        mo = sceenerRegex.search(statement)
-        if mo is not None:
-            logger.debug(f"{mo.group('top_botom')}, {mo.group('number')}, {mo.group('indicator')}")
-            if mo.group('top_botom').lower() == 'top':
-                type = 7
-            else:
-                type = 8
-            if mo.group('indicator') is None:
-                value1 = IBDRS
-            else:
-                indicator = mo.group('indicator').strip().lower()
-                value1 = getIndicatorComponents(indicator)
-            return [type, mo.group('number'), value1]
-
-        sceenerRegex = re.compile(FORMED, re.IGNORECASE | re.VERBOSE)
-        mo = sceenerRegex.search(statement)
-        if mo is not None:
-            type = 99
-            logger.debug(f"{mo.group('timeframe')}, {mo.group('cspattern')}, {mo.group('duration')}")
-            timeframe = mo.group('timeframe')
-            if timeframe is None: 
-                timeframe = 'daily'
-            else:
-                timeframe = timeframe.lower()
-            cspattern = mo.group('cspattern').strip().lower()
-            cspattern = ' '.join(cspattern.split())   #remove extra whitespace  
-            duration = mo.group('duration')
-            if duration is not None:
-                duration = getOffset(duration.strip(), timeframe)
-            if duration is not None or statement.rstrip().lower().endswith('formed'):
-                return [type, timeframe, cspattern, duration]
-            
-        errorMessage = f'"{statement}" is unrecognizable, please check against the acceptable syntax, make sure the candlestick pattern name or indicator name is spelled correctly, and required parameters are included.'
-        # (http://screenerapp.aifinancials.net/screenerSyntax)
-        logger.error(errorMessage)
-        raise Exception(errorMessage)
-        
+        The translations are cached by translateStatement.
+        """
+        with profile('translation', None, self._id):
+            return json.loads(translateStatement(statement.strip()))
 
     def __separate(self, expression):
         expression = expression.replace('\n', ' ').strip()
@@ -401,382 +524,271 @@ class MyScreener:
             logger.error(errorMessage)
             raise Exception(errorMessage)
 
-        tokens = re.split(r' and | or |[*]', expression, re.IGNORECASE | re.VERBOSE);
-        statements = []
-        for token in tokens:
-            token = token.strip().replace('[', '').replace(']', '')
-            if len(token) > 0:
-                statements.append(token)
-        return statements
+        self._expressionTree = parseExpression(expression)
+        return getStatements(self._expressionTree)
 
     @staticmethod
-    def populateIndicators(value, indicators, dataframe):
+    def populateIndicators(value, indicators, dataframe, symbol=None):
         np.seterr(all='warn')
         name = value[0] + ' ' + value[1]
         if name not in indicators.keys():
             if value[1] in ['open', 'high', 'low', 'close', 'volume', 'range']:
-                if value[1] == 'range':
-                    x = "dataframe['" + value[0] + "']['high'] - dataframe['" + value[0] + "']['low']"
-                else:
-                    x = "dataframe['" + value[0] + "']['" + value[1] + "']"
-                #with warnings.catch_warnings():
-                #    warnings.filterwarnings('error')
                 try:
-                    indicators[name] = eval(x)
+                    if value[1] == 'range':
+                        indicators[name] = dataframe[value[0]]['high'] - dataframe[value[0]]['low']
+                    else:
+                        indicators[name] = dataframe[value[0]][value[1]]
                 except:
                     indicators[name] = None
             else:
-                i = value[1].find('(')
-                key = value[1][:i]
-                parameters = value[1][i+1:]
-                if key in TA_MAPPING.keys():
-                    mapped = TA_MAPPING[key]
-                    x = mapped[0] + '('
-                    for j in range(1, len(mapped)-1):
-                        x += "dataframe['" + value[0] + "']['" + mapped[j] + "'],"
-                    if len(parameters) > 1:
-                        if 'macd' in key:   #swap 1st and 2nd arguments for MACD to conform to the usual order of parameters
-                            parameters = parameters[:-1].split(',')
-                            if key == 'macd':
-                                x += parameters[1] + ',' + parameters[0] + ')'
-                            else:
-                                x += parameters[1] + ',' + parameters[0] + ',' + parameters[2] + ')'
-                        elif key == 'median bollinger band':   #the function needs just 1 parameter
-                            parameters = parameters[:-1].split(',')
-                            x += parameters[0] + ')'
-                        else:
-                            x += parameters
-                    else:
-                        x = x[:-1] + ')'
+                key, parameters = splitIndicator(value[1])
+                if key in TA_FUNCTIONS.keys():
+                    #aliases and differently written parameters are the same canonical indicator, calculated once
+                    canonicalName = (value[0],) + getCanonicalIndicator(key, parameters)
+                    if canonicalName in indicators:
+                        indicators[name] = indicators[canonicalName]
+                        return
+                    cacheKey = None
+                    if indicatorCache is not None and symbol is not None:
+                        cacheKey = IndicatorCache.getKey(symbol, value[0], canonicalName[1:], dataframe[value[0]])
+                        found, series = indicatorCache.lookup(cacheKey)
+                        if found:
+                            indicators[name] = indicators[canonicalName] = series
+                            return
                     #with warnings.catch_warnings():
                     #    warnings.filterwarnings('error')
-                    try:
-                        indicators[name] = eval(x)  #eval_nb(x)
-                    except:
-                        indicators[name] = None
+                    series = None
+                    with profile('indicator', getIndicatorFamily(key)):
+                        if localStates is not None and symbol is not None:
+                            series = localStates.getSeries(symbol, value[0], normalizeIndicator(value[1]), dataframe[value[0]])
+                        try:
+                            if series is None:
+                                series = callTaFunction(key, parameters, dataframe[value[0]], indicators, value[0])
+                            indicators[name] = indicators[canonicalName] = series
+                        except:
+                            indicators[name] = indicators[canonicalName] = None
+                    if cacheKey is not None:
+                        indicatorCache.store(cacheKey, indicators[name])
                 else:
                     logger.warning(f'{value[1]} is undefined in ta_mapping')
                     return
         
     @staticmethod
-    def getResults(symbol, timeframes, translation):
-        #start = timer()
+    def getResults(symbol, timeframes, translation, quotes=None, plan=None, tree=None):
+        """Return the results of the statements, only the ones needed to evaluate tree when it is given."""
         if len(translation) == 1 and list(translation.values())[0][0] in [7, 8] and type(list(translation.values())[0][2]) is str:   #IBDRS
             ibdRelativeStrength = 0
-            query = f"SELECT ibdRelativeStrength FROM symbols WHERE ticker = '{symbol}'"
-            with contextlib.closing(utils.engine.raw_connection()) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query)
-                row = cursor.fetchone()
-                cursor.close()
-            if row is not None and row[0] is not None:
-                ibdRelativeStrength = row[0]
+            value = dataSource.getDataSource().getRelativeStrength(symbol)
+            if value is not None:
+                ibdRelativeStrength = value
             return {symbol: ibdRelativeStrength}
 
+        if quotes is None:
+            quotes = loadQuotes([symbol], timeframes)[symbol]
         dataframe = {}
-        for timeframe, maxPeriod in timeframes.items():
-            tablename = timeframe + '_quotes'
-            datapoints = maxPeriod * 2 + 50  #500
-            #query = "SELECT formatted_date, open, high, low, close, adjclose, volume FROM '{0}' WHERE symbol = '{1}' ORDER BY formatted_date DESC LIMIT 500".format(tablename, symbol[0])
-            query = f"SELECT formatted_date as date, open*adjclose/close as open, high*adjclose/close as high, low*adjclose/close as low, adjclose as close, volume FROM {tablename} WHERE symbol = '{symbol}' ORDER BY formatted_date DESC LIMIT {datapoints}"
-            query = f"SELECT * FROM ({query}) as quotes ORDER BY date ASC"
-            with contextlib.closing(utils.engine.raw_connection()) as conn:
-                df = pd.read_sql_query(query, conn, index_col='date')
+        for timeframe in timeframes.keys():
+            df = quotes[timeframe]
             #df.info(verbose=True)
             if (df.empty or df.size < 3) and timeframe == 'daily':
                 return None
-            dataframe[timeframe] = df.round(4)
-        #end = timer()
-        #logger.debug(f'retrieved data in {str(100*(end-start))} ms')
+            dataframe[timeframe] = df
         #logger.debug('got dataframe')
 
         if len(translation) == 1 and list(translation.values())[0][0] in [7, 8]:
             indicators = {}
             v = list(translation.values())[0]
-            MyScreener.populateIndicators(v[2], indicators, dataframe)
+            MyScreener.populateIndicators(v[2], indicators, dataframe, symbol)
             name = v[2][0] + ' ' + v[2][1]
             if indicators[name] is None or len(indicators[name]) <= v[2][2]:
                 return {symbol: 0}
             else:
                 return {symbol: getIndicatorValue(indicators, v[2], 1)}
 
-        #start = timer()
+        #indicators are only calculated when a statement needing them is evaluated
         indicators = {}
-        for k, v in translation.items():
-            if v[0] != 99:
-                MyScreener.populateIndicators(v[1], indicators, dataframe)
-                if len(v) > 3:
-                    if v[0] == 2 and type(v[2]) is list:
-                        MyScreener.populateIndicators(v[2], indicators, dataframe)
-                    if type(v[3]) is list:
-                        MyScreener.populateIndicators(v[3], indicators, dataframe)
-        #logger.debug(indicators)
-        #end = timer()
-        #logger.debug(f'populated indicators in {str(100*(end-start))} ms')
-        
-        cp_mapping = dict((k.lower(), v) for k,v in utils.get_cp_mapping().items())
-        #logger.debug(cp_mapping)
+        if plan is None:
+            plan = compileTranslation(translation)
+        arrays = {}
+        def getIndicator(indicatorComponents):
+            name = indicatorComponents[0] + ' ' + indicatorComponents[1]
+            if name not in arrays:
+                MyScreener.populateIndicators(indicatorComponents, indicators, dataframe, symbol)
+                arrays[name] = getIndicatorArrays(indicators[name])
+            return arrays[name]
+
         results = {}
-        for k, v in translation.items():
+        def getResult(k):
+            v = translation[k]
             results[k] = None
-            try:
-                if v[0] == 1:   #'is above/below'
-                    if v[4] is None:
-                        v[4] = 1
-                    for i in range(1, v[4]+1):
-                        name = v[1][0] + ' ' + v[1][1]
-                        if indicators[name] is None or len(indicators[name]) <= i:
-                            results[k] = False
-                            break
-                        value1 = getIndicatorValue(indicators, v[1], i)
-                        if type(v[3]) is list:
-                            index = getIndex(i, v[1][0], v[3][0])
-                            name = v[3][0] + ' ' + v[3][1]
-                            if indicators[name] is None or len(indicators[name]) <= index:
-                                results[k] = False
-                                break
-                            value2 = getIndicatorValue(indicators, v[3], index)
-                        else:
-                            value2 = float(v[3])
-                        if v[2][0] is None:
-                            if v[2][1] == 'above':
-                               result = (value1 >= value2)
-                            else:
-                               result = (value1 <= value2)
-                        else:
-                            mo = re.search(r'\d+\.?\d*', v[2][0])
-                            extra = float(mo.group())
-                            if 'more' in v[2][0]:
-                                if v[2][1] == 'above':
-                                    if '%' in v[2][0]:
-                                        result = (value1 >= (value2 + abs(value2) * extra/100))
-                                    else:
-                                        result = (value1 >= (value2 + extra))
-                                else:
-                                    if '%' in v[2][0]:
-                                        result = (value1 <= (value2 - abs(value2) * extra/100))
-                                    else:
-                                        result = (value1 <= (value2 - extra))
-                            else:
-                                if v[2][1] == 'above':
-                                    if '%' in v[2][0]:
-                                        result = (value1 >= value2 and value1 < (value2 + abs(value2) * extra/100))
-                                    else:
-                                        result = (value1 >= value2 and value1 < (value2 + extra))
-                                else:
-                                    if '%' in v[2][0]:
-                                        result = (value1 <= value2 and value1 > (value2 - abs(value2) * extra/100))
-                                    else:
-                                        result = (value1 <= value2 and value1 > (value2 - extra))
-                        
-                        if not result:
-                            results[k] = False
-                            break
-                        
-                    if results[k] is None:
-                        results[k] = True
-                    
-                if v[0] == 2:   #'is in between'
-                    if v[4] is None:
-                        v[4] = 1
-                    for i in range(1, v[4]+1):
-                        name = v[1][0] + ' ' + v[1][1]
-                        if indicators[name] is None or len(indicators[name]) <= i:
-                            results[k] = False
-                            break
-                        value = getIndicatorValue(indicators, v[1], i)
-                        if type(v[2]) is list:
-                            index = getIndex(i, v[1][0], v[2][0])
-                            name = v[2][0] + ' ' + v[2][1]
-                            if indicators[name] is None or len(indicators[name]) <= index:
-                                results[k] = False
-                                break
-                            value1 = getIndicatorValue(indicators, v[2], index)
-                        else:
-                            value1 = float(v[2])
-                        if type(v[3]) is list:
-                            index = getIndex(i, v[1][0], v[3][0])
-                            name = v[3][0] + ' ' + v[3][1]
-                            if indicators[name] is None or len(indicators[name]) <= index:
-                                results[k] = False
-                                break
-                            value2 = getIndicatorValue(indicators, v[3], index)
-                        else:
-                            value2 = float(v[3])
-                        if value1 > value2:  
-                            result = (value >= value2 and value <= value1)
-                        else:
-                            result = (value >= value1 and value <= value2)
-
-                        if not result:
-                            results[k] = False
-                            break
-                        
-                    if results[k] is None:
-                        results[k] = True
-                    
-                if v[0] == 3:   #'crossed above/below'
-                    if v[4] is None:
-                        v[4] = 1
-                    for i in range(1, v[4]+1):
-                        name = v[1][0] + ' ' + v[1][1]
-                        if indicators[name] is None or len(indicators[name]) <= i:
-                            results[k] = False
-                            break
-                        value1 = getIndicatorValue(indicators, v[1], i)
-                        value1_1 = getIndicatorValue(indicators, v[1], i+1)
-                        if type(v[3]) is list:
-                            index = getIndex(i, v[1][0], v[3][0])
-                            name = v[3][0] + ' ' + v[3][1]
-                            if indicators[name] is None or len(indicators[name]) <= index:
-                                results[k] = False
-                                break
-                            value2 = getIndicatorValue(indicators, v[3], index)
-                            value2_1 = getIndicatorValue(indicators, v[3], index+1)
-                        else:
-                            value2 = float(v[3])
-                            value2_1 = value2
-                        if v[2] == 'above':
-                            result = (value1 >= value2 and value1_1 <= value2_1)
-                        else:
-                            result = (value1 <= value2 and value1_1 >= value2_1)
-                            
-                        if result:
-                            results[k] = True
-                            break
-                        
-                    if results[k] is None:
-                        results[k] = False
-                    
-                if v[0] in [4, 4.1]:   #['gained', 'dropped']
-                    name = v[1][0] + ' ' + v[1][1]
-                    if indicators[name] is None or len(indicators[name]) < 3:
-                        results[k] = False
-                    else:
-                        if v[3] is None:
-                            v[3] = 1
-                        value1 = getIndicatorValue(indicators, v[1], 1)
-                        value2 = getIndicatorValue(indicators, v[1], 1+v[3])
-                        mo = re.search(r'\d+\.?\d*', v[2])
-                        extra = float(mo.group())
-                        if 'more' in v[2]:
-                            if v[0] == 4:
-                                if '%' in v[2]:
-                                    result = (value1 >= (value2 + abs(value2) * extra/100))
-                                else:
-                                    result = (value1 >= (value2 + extra))
-                            else:
-                                if '%' in v[2]:
-                                    result = (value1 <= (value2 - abs(value2) * extra/100))
-                                else:
-                                    result = (value1 <= (value2 - extra))
-                        else:
-                            if v[0] == 4:
-                                if '%' in v[2]:
-                                    result = (value1 >= value2 and value1 < (value2 + abs(value2) * extra/100))
-                                else:
-                                    result = (value1 >= value2 and value1 < (value2 + extra))
-                            else:
-                                if '%' in v[2]:
-                                    result = (value1 <= value2 and value1 > (value2 - abs(value2) * extra/100))
-                                else:
-                                    result = (value1 <= value2 and value1 > (value2 - extra))
-
-                        results[k] = (False if result is None else result)
-                        
-                if v[0] in [5, 5.1]:   #['increasing', 'decreasing']
-                    name = v[1][0] + ' ' + v[1][1]
-                    for i in range(1, v[2]+1):
-                        if indicators[name] is None or len(indicators[name]) <= i:
-                            results[k] = False
-                            break
-                        value1 = getIndicatorValue(indicators, v[1], i)
-                        value2 = getIndicatorValue(indicators, v[1], i+1)
-                        if v[0] == 5:
-                           result = (value1 >= value2)
-                        else:
-                           result = (value1 <= value2)
-                            
-                        if not result:
-                            results[k] = False
-                            break
-                            
-                    if results[k] is None:
-                        results[k] = True
-                    
-                if v[0] == 6:   #'reached high/low'
-                    if v[3] is None:
-                        v[3] = 1
-                    period = getOffset(v[2].strip().lower(), v[1][0])
-                    name = v[1][0] + ' ' + v[1][1]
-                    for i in range(1, v[3]+1):
-                        if indicators[name] is None or len(indicators[name]) <= i+period:
-                            results[k] = False
-                            break
-                        value1 = getIndicatorValue(indicators, v[1], i)
-                        value2 = [getIndicatorValue(indicators, v[1], i+j) for j in range(period)]
-                        if 'high' in v[2]:
-                            result = (value1 >= max(value2))
-                        else:
-                            result = (value1 <= min(value2))
-                        if result:
-                            results[k] = True
-                            break
-                        
-                    if results[k] is None:
-                        results[k] = False
-                    
+            with profile('statement', STATEMENT_TYPES.get(v[0])):
+                if v[0] in [1, 2, 3, 4, 4.1, 5, 5.1, 6]:
+                    outcome = evaluateStatement(plan[k], getIndicator)[0]
+                    if outcome == OUTCOME_ERROR:
+                        raise IndexError(f'{k}: single positional indexer is out-of-bounds')
+                    results[k] = (outcome == OUTCOME_TRUE)
+
                 if v[0] == 99:   #formed Candlestick Pattern
-                    name = v[2]
-                    if 'candlestick pattern' in name:
-                        isPatternFound = False
-                        sortedByRankMap = sorted(cp_mapping.items(), key=lambda x: x[1][2])
-                        if name == 'bullish candlestick pattern':
-                            cs_patterns = (kc.lower() for kc,vc in sortedByRankMap if len(vc[0]) > 0 and vc[1] > 0)
-                        elif name == 'bearish candlestick pattern':
-                            cs_patterns = (kc.lower() for kc,vc in sortedByRankMap if len(vc[0]) > 0 and vc[1] < 0)
-                        else:
-                            cs_patterns = (kc.lower() for kc,vc in sortedByRankMap if len(vc[0]) > 0 and vc[1] == 0)
-                        for cs_pattern in cs_patterns:  #sorted by performance rank
-                            isPatternFound = isCandlestickPatternFound(cs_pattern, v[3], dataframe[v[1]], cp_mapping)
-                            if isPatternFound:
-                                break
-                        results[k] = isPatternFound
-                    else:
-                        results[k] = isCandlestickPatternFound(name, v[3], dataframe[v[1]], cp_mapping)
-                    
-                #logger.debug(k + ' = ' + str(results[k]))
-            except Exception as e:
-                logger.error(f'{symbol[0]}: {traceback.format_exc()}')
-                return None
-                    
+                    results[k] = isStatementPatternFound(v, dataframe[v[1]], symbol)
+            #logger.debug(k + ' = ' + str(results[k]))
+            return results[k]
+
+        try:
+            if tree is None:
+                for k in translation.keys():
+                    getResult(k)
+            else:
+                evaluateTree(tree, getResult)
+        except Exception as e:
+            logger.error(f'{symbol[0]}: {traceback.format_exc()}')
+            return None
+        finally:
+            countEvaluation(translation, len(results), len([k for k in indicators.keys() if type(k) is str]) + len([k for k in results.keys() if translation[k][0] == 99]))
         return results        
 
 
     @staticmethod
-    def sceener(symbol, expression, timeframes, translation):
-        utils.engine.dispose()
+    def sceener(symbol, tree, timeframes, translation, quotes=None, plan=None):
+        if quotes is None:
+            dataSource.getDataSource().dispose()
         result = False
-        results = MyScreener.getResults(symbol, timeframes, translation)
+        results = MyScreener.getResults(symbol, timeframes, translation, quotes, plan, tree)
         logger.debug(results)
         if len(translation) == 1 and list(translation.values())[0][0] in [7, 8]:
             return results
         if results is not None:
-            #logger.debug('expression: ' + expression)
-            newexpression = expression
-            for k, v in results.items():
-                newexpression = newexpression.replace(k, str(v))  
-            newexpression = newexpression.replace('[', '(').replace(']', ')').replace('\r', ' ').replace('\n', ' ')
-            #logger.debug('newexpression: ' + newexpression)
-            try:
-                result = eval(newexpression)
-            except Exception as e:
-                logger.error(f'{newexpression}: {traceback.format_exc()}')
-                return None
+            result = evaluateTree(tree, results.get)   #the statements reached are the ones getResults evaluated
         logger.debug(f'{symbol}: {str(result)}')
         return symbol if result else None
 
 
+    @staticmethod
+    def screenBatch(symbols, tree, timeframes, translation, quotes=None, plan=None):
+        """Screen a batch of symbols with the quotes of the whole batch fetched at once."""
+        if quotes is None:
+            quotes = loadQuotes(symbols, timeframes)
+        if plan is None:
+            plan = compileTranslation(translation)
+        return [MyScreener.sceener(symbol, tree, timeframes, translation, quotes[symbol], plan) for symbol in symbols]
+
+
+    @staticmethod
+    def screenPanel(symbols, tree, timeframes, translation, quotes=None, plan=None):
+        """Screen a batch of symbols cross-sectionally, with the same results as screenBatch. 
+        The quotes of each timeframe are stacked into a panel of bars x symbols, every distinct indicator is calculated 
+        once for the whole panel and every statement is evaluated as a mask over the symbols it can still decide,
+        the indicators without a panel function being only calculated for them as screenBatch does.
+        """
+        translationValue = list(translation.values())[0]
+        if quotes is None:
+            quotes = loadQuotes(symbols, timeframes)
+        if 'daily' in timeframes:
+            panelSymbols = [symbol for symbol in symbols if not (quotes[symbol]['daily'].empty or quotes[symbol]['daily'].size < 3)]
+        else:
+            panelSymbols = list(symbols)
+        results = dict((symbol, None) for symbol in symbols)
+        if len(panelSymbols) == 0:
+            return [results[symbol] for symbol in symbols]
+
+        panels = dict((timeframe, getPanel(quotes, panelSymbols, timeframe)) for timeframe in timeframes.keys())
+        arrays = {}   #name: (values, lengths, calculated) of an indicator, calculated being the mask of the symbols it is calculated for
+        symbolIndicators = [{} for symbol in panelSymbols]   #indicators of each symbol calculated with the ta functions
+        def getIndicator(indicatorComponents, columns):
+            name = indicatorComponents[0] + ' ' + indicatorComponents[1]
+            if name not in arrays:
+                arrays[name] = MyScreener.populatePanelIndicator(indicatorComponents, panels[indicatorComponents[0]], quotes, panelSymbols, columns, symbolIndicators)
+            values, lengths, calculated = arrays[name]
+            missing = columns[~calculated[columns]]
+            if len(missing) > 0:
+                missingValues, missingLengths, missingCalculated = MyScreener.populatePanelIndicator(indicatorComponents, panels[indicatorComponents[0]], quotes, panelSymbols, missing, symbolIndicators)
+                values[:, missing] = missingValues[:, missing]
+                lengths[missing] = missingLengths[missing]
+                calculated[missing] = True
+            if len(columns) == len(panelSymbols):
+                return (values, lengths)
+            return (values[:, columns], lengths[columns])
+        allColumns = np.arange(len(panelSymbols))
+
+        if len(translation) == 1 and translationValue[0] in [7, 8]:
+            values, lengths = getIndicator(translationValue[2], allColumns)
+            value, readable = getIndicatorValues(values, lengths, translationValue[2], np.array([1]))
+            for j, symbol in enumerate(panelSymbols):
+                results[symbol] = {symbol: 0 if lengths[j] <= translationValue[2][2] else value[0, j]}
+            return [results[symbol] for symbol in symbols]
+
+        if plan is None:
+            plan = compileTranslation(translation)
+        statements = []
+        def getOutcome(k, active):
+            v = translation.get(k)
+            statements.append(k)
+            columns = allColumns if active is None else np.flatnonzero(active)
+            outcomes = np.full(len(panelSymbols), OUTCOME_FALSE)   #ignored for the symbols already decided
+            try:
+                with profile('statement', STATEMENT_TYPES.get(v[0])):
+                    if v[0] == 99:
+                        outcomes[columns] = [MyScreener.getPatternOutcome(panelSymbols[j], v, quotes[panelSymbols[j]][v[1]]) for j in columns]
+                    else:
+                        outcomes[columns] = evaluateStatement(plan[k], lambda indicatorComponents: getIndicator(indicatorComponents, columns))
+            except Exception as e:
+                logger.error(f'{k}: {traceback.format_exc()}')
+                outcomes[columns] = OUTCOME_ERROR
+            return outcomes
+
+        outcome = combineOutcomes(tree, getOutcome)
+        countEvaluation(translation, len(set(statements)), len(arrays) + len([k for k in set(statements) if translation.get(k, [None])[0] == 99]), len(panelSymbols))
+        for j, symbol in enumerate(panelSymbols):
+            logger.debug(f'{symbol}: {str(outcome[j])}')
+            results[symbol] = symbol if outcome[j] == OUTCOME_TRUE else None
+        return [results[symbol] for symbol in symbols]
+
+
+    @staticmethod
+    def getPatternOutcome(symbol, translation, df):
+        try:
+            return OUTCOME_TRUE if isStatementPatternFound(translation, df, symbol) else OUTCOME_FALSE
+        except Exception as e:
+            logger.error(f'{symbol}: {traceback.format_exc()}')
+            return OUTCOME_ERROR
+
+
+    @staticmethod
+    def populatePanelIndicator(value, panel, quotes, symbols, columns, symbolIndicators):
+        """Calculate an indicator for a panel of symbols, return its (values, lengths) arrays and the mask of the symbols
+        it is calculated for: all of them with a panel function, the ones of columns when calculated symbol by symbol.
+        symbolIndicators are the indicators of each symbol (see populateIndicators), kept by the caller for the next indicators."""
+        np.seterr(all='warn')
+        fields, lengths = panel
+        calculated = np.ones(len(symbols), dtype=bool)
+        if value[1] in ['open', 'high', 'low', 'close', 'volume']:
+            return (fields[value[1]], lengths, calculated)
+        if value[1] == 'range':
+            return (fields['high'] - fields['low'], lengths, calculated)
+
+        key, parameters = splitIndicator(value[1])
+        if key not in TA_FUNCTIONS.keys():
+            logger.warning(f'{value[1]} is undefined in ta_mapping')
+            raise KeyError(value[0] + ' ' + value[1])
+        mapped = TA_MAPPING[key]
+        hasState = localStates is not None and localStates.hasIndicator(value[0], normalizeIndicator(value[1]))
+        if mapped[0] in PANEL_FUNCTIONS and parameters.isdigit() and not parameters.startswith('0') and not hasState:
+            with profile('indicator', getIndicatorFamily(key)):
+                return (PANEL_FUNCTIONS[mapped[0]](pd.DataFrame(fields[mapped[1]]), int(parameters)).values, lengths, calculated)
+
+        #other indicators are calculated symbol by symbol with the ta functions
+        name = value[0] + ' ' + value[1]
+        values = np.full(fields['close'].shape, np.nan)
+        indicatorLengths = np.zeros(len(symbols), dtype=int)
+        calculated = np.zeros(len(symbols), dtype=bool)
+        calculated[columns] = True
+        for j in columns:
+            MyScreener.populateIndicators(value, symbolIndicators[j], quotes[symbols[j]], symbols[j])
+            series = symbolIndicators[j].get(name)
+            if series is not None and len(series) > 0:
+                values[values.shape[0]-len(series):, j] = series.values
+                indicatorLengths[j] = len(series)
+        return (values, indicatorLengths, calculated)
+
+
     @staticmethod
     def calculateIndicator(timeframe, function, dataframe):
         np.seterr(all='warn')
@@ -784,34 +796,16 @@ class MyScreener:
             return (function, dataframe[timeframe][function])
 
         i = function.find('(')
-        name = function[:i]
-        parameters = function[i+1:]
-        result = None
-        for k, v in TA_MAPPING.items():
-            if name.lower() == k:
-                x = v[0] + '('
-                for j in range(1, len(v)-1):
-                    x += "dataframe['" + timeframe + "']['" + v[j] + "'],"
-                if len(parameters) > 1:
-                    key = name.lower()
-                    if 'macd' in key:   #swap 1st and 2nd arguments for MACD to conform to the usual order of parameters
-                        parameters = parameters[:-1].split(',')
-                        if key == 'macd':
-                            x += parameters[1] + ',' + parameters[0] + ')'
-                        else:
-                            x += parameters[1] + ',' + parameters[0] + ',' + parameters[2] + ')'
-                    else:
-                        x += parameters
-                else:
-                    x = x[:-1] + ')'
-                #print(x)
-                try:
-                    result = eval(x)
-                except Exception as e:
-                    logger.error(f'{x}: {traceback.format_exc()}')
-                    result = dataframe[timeframe]['close']
-                    result.values[:] = 0
-                return (k + function[i:], result)
+        name, parameters = splitIndicator(function)
+        key = name.lower()
+        if key in TA_FUNCTIONS.keys():
+            try:
+                result = callTaFunction(key, parameters, dataframe[timeframe])
+            except Exception as e:
+                logger.error(f'{function}: {traceback.format_exc()}')
+                result = dataframe[timeframe]['close']
+                result.values[:] = 0
+            return (key if i < 0 else key + function[i:], result)
         
         errorMessage = f'{name} is undefined in ta_mapping'
         logger.error(errorMessage)
@@ -834,7 +828,7 @@ class MyScreener:
 
             symbol = 'SPY'      #['FSZ-DBA.TO', 204]  #this is a test case for exception
             #start = timer()
-            result = MyScreener.sceener(symbol, expression, timeframes, translation)
+            result = MyScreener.sceener(symbol, orderTree(self._expressionTree, translation)[0], timeframes, translation)
             #end = timer()
             #logger.debug(f'got result in {str(100*(end-start))} ms')
             #if len(translation) == 1 and list(translation.values())[0][0] in [7, 8]:
@@ -904,32 +898,39 @@ class MyScreener:
                 volume = 'avg90DayVolume'
 
         lastDate = (datetime.today() - timedelta(days=4)).strftime(utils.date_format)   #take into account weekend and holidays
-        query = f"SELECT ticker FROM symbols WHERE active=1 and lastDate >= '{lastDate}'"  #only consider symbols that are active and have price up to date
-        if self._symbols is not None:
-            query += " and ticker in (" + ', '.join(["'%s'" %symbol for symbol in self._symbols]) + ")"
-        if price is not None:
-            if self._priceLow is not None:
-                query += " and " + price + ">=" + str(self._priceLow)
-            if self._priceHigh is not None:
-                query += " and " + price + "<=" + str(self._priceHigh)
-        if volume is not None:
-            if self._volumeLow is not None:
-                query += " and " + volume + ">=" + str(self._volumeLow)
-            if self._volumeHigh is not None:
-                query += " and " + volume + "<=" + str(self._volumeHigh)
-        if self._industries is not None:
-            query += " and industry in (" + ', '.join(["'%s'" %industry for industry in self._industries.split()]) + ")"
-
-        #logger.info(query)
-        with contextlib.closing(utils.engine.raw_connection()) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            cursor.close()
-        return [row[0] for row in rows]
-
-
-    def getMatchingSymbols(self):
+        industries = None if self._industries is None else self._industries.split()
+        bounds = [(column, low, high) for column, low, high in [(price, self._priceLow, self._priceHigh), (volume, self._volumeLow, self._volumeHigh)] if column is not None]
+        if localSymbols is not None:
+            with profile('universe', 'index', self._id):
+                return localSymbols.select(self._symbols, None, industries, lastDate, bounds)
+        #only consider symbols that are active and have price up to date
+        with profile('universe', 'database', self._id):
+            return dataSource.getDataSource().selectSymbols(self._symbols, industries, lastDate, bounds)
+
+
+    def getCanonicalKey(self):
+        """Hash the translated expression and the universe filters of the screener, 
+        screeners with the same key have the same matching symbols."""
+        try:
+            expression = getCanonicalExpression(self.expressionTree, self._translation or {})
+        except Exception as e:
+            expression = self._expression   #can't be parsed, only the same expression is the same screener
+        split = lambda value: None if isBlank(value) else sorted(str(value).split())
+        price = None
+        if self._priceType is not None and (self._priceLow is not None or self._priceHigh is not None):
+            price = [self._priceType, self._priceLow, self._priceHigh]
+        volume = None
+        if self._volumeType is not None and (self._volumeLow is not None or self._volumeHigh is not None):
+            volume = [self._volumeType, self._volumeLow, self._volumeHigh]
+        key = [expression, None if self._symbols is None else sorted(self._symbols), split(self._exchanges), split(self._industries), price, volume]
+        return hashlib.sha1(json.dumps(key, default=str).encode()).hexdigest()
+
+
+    def getMatchingSymbols(self, pool=None, mode='symbol'):
+        """Return the symbols matching the screener, mode is either 'symbol' (each symbol screened on its own) or 
+        'panel' (all the symbols of a batch screened at once, see screenPanel)."""
+        if mode not in SCREENING_MODES:
+            raise Exception(f'Unknown screening mode {mode}')
         logger.info('screener_id = ' + str(self._id))
         if self._translation is None or len(self._translation) == 0:
             if self._expression is None or len(self._expression) == 0:
@@ -967,31 +968,27 @@ class MyScreener:
                 isBottom = True
 
         if (isTop or isBottom) and type(translationValue[2]) is str:   #IBDRS
-            query = "SELECT ticker FROM symbols WHERE active=1 and ticker in ({}) order by ibdRelativeStrength {} limit {}" \
-                .format(','.join([f"'{symbol}'" for symbol in symbols]), 'desc' if isTop else 'asc', translationValue[1])
-            with contextlib.closing(utils.engine.raw_connection()) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query)
-                rows = cursor.fetchall()
-                cursor.close()
-            matchingSymbols = [row[0] for row in rows]
+            matchingSymbols = dataSource.getDataSource().getRelativeStrengthRanking(symbols, isTop, translationValue[1])
             logger.info(f'#matchingSymbols: {str(len(matchingSymbols))}')
             return matchingSymbols
 
         timeframes = self.getTimeframes(self._translation)
+        tree = orderTree(self.expressionTree, self._translation)[0]
         """
         #do in single process
         for symbol in symbols:
-            result = MyScreener.sceener(symbol, self._expression, timeframes, self._translation)
+            result = MyScreener.sceener(symbol, tree, timeframes, self._translation)
             if result is not None:
                 matchingSymbols.append(result)
         """     
-        #do with multiprocessing
-        if __name__ == '__main__':
-            parameters = [(symbol, self._expression, timeframes, self._translation) for symbol in symbols]
-            processes = mp.cpu_count()   #this process is mainly cpu bound   
-            with mp.Pool(processes=processes) as pool:
-                results = pool.starmap(MyScreener.sceener, parameters)
+        #do with multiprocessing, with the pool of the caller when the module is imported
+        if pool is not None or __name__ == '__main__':
+            with profile('screening', mode, self._id):   #waiting for the workers, their phases are timed by their own profilers
+                if pool is None:
+                    with ScreenerPool() as pool:
+                        results = pool.screen(symbols, tree, timeframes, self._translation, mode, self._id)
+                else:
+                    results = pool.screen(symbols, tree, timeframes, self._translation, mode, self._id)
             if isTop:
                 results = dict((key,d[key]) for d in results for key in d)
                 matchingSymbols = heapq.nlargest(int(translationValue[1]), results, key=results.get) 
@@ -1007,6 +1004,178 @@ class MyScreener:
         return matchingSymbols
 
 
+@functools.lru_cache(maxsize=TRANSLATION_CACHE_SIZE)
+def translateStatement(statement):
+    """Return the translation of a statement as json, see MyScreener.__translate, 
+    so that each caller of the cache gets its own lists."""
+    return json.dumps(parseStatement(statement))
+
+def parseStatement(statement):
+    """Translate a statement with the first grammar matching it, raise an Exception when none does."""
+    mo = IS_ABOVE_BELOW_BETWEEN_RE.search(statement)
+    if mo is not None:
+        logger.debug(f"{mo.group('indicator')}, {mo.group('more_less')}, {mo.group('above_below')}, {mo.group('above_below_indicator')}, {mo.group('above_below_value')}, \
+{mo.group('between')}, {mo.group('between_indicator1')}, {mo.group('between_value1')}, {mo.group('between_indicator2')}, {mo.group('between_value2')}, {mo.group('duration')}")
+        indicator = mo.group('indicator').strip().lower()
+        value1 = getIndicatorComponents(indicator)
+        duration = mo.group('duration')
+        if duration is not None:
+            duration = getOffset(duration.strip(), value1[0])
+            value1[-1] += duration
+
+        if mo.group('above_below') is not None:
+            type = 1
+            comparator = [None if mo.group('more_less') is None else mo.group('more_less').strip(), mo.group('above_below')]
+            value2 = mo.group('above_below_value')
+            if value2 is not None:
+                if duration is not None or statement.rstrip().endswith(value2):
+                    return [type, value1, comparator, value2, duration]
+            value2 = mo.group('above_below_indicator')
+            if value2 is not None:
+                value2 = getIndicatorComponents(value2.strip().lower())
+                if duration is not None:
+                    if value1[0] == value2[0]:
+                        value2[-1] += duration
+                    else:
+                        value2[-1] += getOffset(mo.group('duration'), value2[0])
+                if duration is not None or statement.rstrip().endswith(mo.group('above_below_indicator')):
+                    return [type, value1, comparator, value2, duration]
+
+        if mo.group('between') is not None:
+            type = 2
+            between_value1 = mo.group('between_value1')
+            between_indicator1 = mo.group('between_indicator1')
+            if between_indicator1 is not None:
+                between_indicator1 = mo.group('between_indicator1').strip().lower()
+                between_value1 = getIndicatorComponents(between_indicator1)
+                if duration is not None:
+                    if value1[0] == between_value1[0]:
+                        between_value1[-1] += duration
+                    else:
+                        between_value1[-1] += getOffset(mo.group('duration'), between_value1[0])
+            between_value2 = mo.group('between_value2')
+            if between_value2 is not None:
+                noduration = statement.rstrip().endswith(between_value2)
+            between_indicator2 = mo.group('between_indicator2')
+            if between_indicator2 is not None:
+                noduration = statement.rstrip().endswith(between_indicator2)
+                between_value2 = getIndicatorComponents(between_indicator2.strip().lower())
+                if duration is not None:
+                    if value1[0] == between_value2[0]:
+                        between_value2[-1] += duration
+                    else:
+                        between_value2[-1] += getOffset(mo.group('duration'), between_value2[0])
+            if between_value1 is not None and between_value2 is not None:
+                if duration is not None or noduration:
+                    return [type, value1, between_value1, between_value2, duration]
+
+    mo = CROSSED_ABOVE_BELOW_RE.search(statement)
+    if mo is not None:
+        type = 3
+        logger.debug(f"{mo.group('indicator')}, {mo.group('above_below')}, {mo.group('above_below_indicator')}, {mo.group('above_below_value')}, {mo.group('duration')}")
+        indicator = mo.group('indicator').strip().lower()
+        value1 = getIndicatorComponents(indicator)
+        duration = mo.group('duration')
+        if duration is not None:
+            duration = getOffset(duration.strip(), value1[0])
+            value1[-1] += duration
+        comparator = mo.group('above_below')
+        value2 = mo.group('above_below_value')
+        if value2 is not None:
+            if duration is not None or statement.rstrip().endswith(value2):
+                return [type, value1, comparator, value2, duration]
+        value2 = mo.group('above_below_indicator')
+        if value2 is not None:
+            value2 = getIndicatorComponents(value2.strip().lower())
+            if duration is not None:
+                if value1[0] == value2[0]:
+                    value2[-1] += duration
+                else:
+                    value2[-1] += getOffset(mo.group('duration'), value2[0])
+            if duration is not None or statement.rstrip().endswith(mo.group('above_below_indicator')):
+                return [type, value1, comparator, value2, duration]
+
+    mo = DROPPED_GAINED_RE.search(statement)
+    if mo is not None:
+        logger.debug(f"{mo.group('indicator')}, {mo.group('verb')}, {mo.group('more_less')}, {mo.group('duration')}")
+        if mo.group('verb').lower() == 'gained':
+            type = 4
+        else:
+            type = 4.1
+        indicator = mo.group('indicator').strip().lower()
+        value1 = getIndicatorComponents(indicator)
+        duration = mo.group('duration')
+        if duration is not None:
+            duration = getOffset(duration.strip(), value1[0])
+            value1[-1] += duration
+        comparator = mo.group('more_less')
+        if duration is not None or statement.rstrip().endswith(comparator):
+            return [type, value1, comparator, duration]
+
+    mo = INCREASING_DECREASING_RE.search(statement)
+    if mo is not None:
+        logger.debug(f"{mo.group('indicator')}, {mo.group('verb')}, {mo.group('duration')}")
+        if mo.group('verb').lower() == 'increasing':
+            type = 5
+        else:
+            type = 5.1
+        indicator = mo.group('indicator').strip().lower()
+        value1 = getIndicatorComponents(indicator)
+        duration = mo.group('duration')
+        duration = getOffset(duration.strip(), value1[0])
+        value1[-1] += duration
+        return [type, value1, duration]
+
+    mo = REACHED_HIGH_LOW_RE.search(statement)
+    if mo is not None:
+        type = 6
+        logger.debug(f"{mo.group('indicator')}, {mo.group('high_low')}, {mo.group('duration')}")
+        indicator = mo.group('indicator').strip().lower()
+        value1 = getIndicatorComponents(indicator)
+        duration = mo.group('duration')
+        if duration is not None:
+            duration = getOffset(duration.strip(), value1[0])
+            value1[-1] += duration
+        value2 = mo.group('high_low')
+        if duration is not None or statement.rstrip().endswith(value2):
+            return [type, value1, value2, duration]
+
+    mo = TOP_BOTTOM_RE.search(statement)
+    if mo is not None:
+        logger.debug(f"{mo.group('top_botom')}, {mo.group('number')}, {mo.group('indicator')}")
+        if mo.group('top_botom').lower() == 'top':
+            type = 7
+        else:
+            type = 8
+        if mo.group('indicator') is None:
+            value1 = IBDRS
+        else:
+            indicator = mo.group('indicator').strip().lower()
+            value1 = getIndicatorComponents(indicator)
+        return [type, mo.group('number'), value1]
+
+    mo = FORMED_RE.search(statement)
+    if mo is not None:
+        type = 99
+        logger.debug(f"{mo.group('timeframe')}, {mo.group('cspattern')}, {mo.group('duration')}")
+        timeframe = mo.group('timeframe')
+        if timeframe is None: 
+            timeframe = 'daily'
+        else:
+            timeframe = timeframe.lower()
+        cspattern = mo.group('cspattern').strip().lower()
+        cspattern = ' '.join(cspattern.split())   #remove extra whitespace  
+        duration = mo.group('duration')
+        if duration is not None:
+            duration = getOffset(duration.strip(), timeframe)
+        if duration is not None or statement.rstrip().lower().endswith('formed'):
+            return [type, timeframe, cspattern, duration]
+        
+    errorMessage = f'"{statement}" is unrecognizable, please check against the acceptable syntax, make sure the candlestick pattern name or indicator name is spelled correctly, and required parameters are included.'
+    # (http://screenerapp.aifinancials.net/screenerSyntax)
+    logger.error(errorMessage)
+    raise Exception(errorMessage)
+
 def isBlank(myString):
     if myString and myString.strip():
         #myString is not None AND myString is not empty or blank
@@ -1101,6 +1270,76 @@ def getIndicatorComponents(indicatorString):
         maxPeriod = getMaxPeriod(indicator) + functionRange + offset
         return [timeframe, indicator, offset, functionType, functionRange, maxPeriod]
 
+def normalizeIndicator(indicator):
+    """Lowercase an indicator and remove the whitespace around and within its parameters."""
+    name_parameters = indicator.lower().split('(')
+    if len(name_parameters) < 2:
+        return ' '.join(indicator.lower().split())
+    return ' '.join(name_parameters[0].split()) + '(' + ''.join(name_parameters[1].split())
+
+def splitIndicator(indicator):
+    """Split an indicator like 'macd(12,26,9)' into its name and parameters ('macd', '12,26,9')."""
+    i = indicator.find('(')
+    if i < 0:
+        return (indicator, '')
+    return (indicator[:i], indicator[i+1:].rstrip()[:-1])
+
+@functools.lru_cache(maxsize=None)
+def getTaArguments(key, parameters, family=False):
+    """Bind the parameters of an indicator to the positional arguments of its ta function, 
+    or of the ta class of its family (see getTaFamily) when family is True."""
+    if len(parameters.strip()) == 0:
+        return ()
+    arguments = [ast.literal_eval(parameter.strip()) for parameter in parameters.split(',')]
+    if 'macd' in key:   #swap 1st and 2nd arguments for MACD to conform to the usual order of parameters
+        arguments[0], arguments[1] = arguments[1], arguments[0]
+        if not family:
+            arguments = arguments[:2] if key == 'macd' else arguments[:3]
+    elif key == 'median bollinger band' and not family:   #the function needs just 1 parameter
+        arguments = arguments[:1]
+    return tuple(arguments)
+
+@functools.lru_cache(maxsize=None)
+def getCanonicalIndicator(key, parameters):
+    """Return (ta function, data series, arguments) of an indicator, the same for its aliases like ma(10) and SMA( 10 )."""
+    return (TA_MAPPING[key][0], TA_FUNCTIONS[key][1], getTaArguments(key, parameters))
+
+@functools.lru_cache(maxsize=None)
+def getTaAttribute(name):
+    """Return the function or class module.name of the ta library, None when the installed ta library doesn't have it.
+    ta is imported when the first indicator is calculated."""
+    module, attribute = name.split('.')
+    value = getattr(importlib.import_module('ta.' + module), attribute, None)
+    if value is None:
+        logger.warning(f'{name} is not available in the installed ta library')
+    return value
+
+@functools.lru_cache(maxsize=None)
+def getTaFamily(function):
+    """Return the ta class of a ta function computing one of its outputs, None when the function isn't in a family."""
+    for family, functions in TA_FAMILY_FUNCTIONS.items():
+        module, className = family.split('.')
+        if function in [module + '.' + name for name in functions]:
+            familyClass = getTaAttribute(family)
+            return family if familyClass is not None and hasattr(familyClass, function.split('.')[1]) else None
+    return None
+
+def getIndicatorFamily(key):
+    """Return the ta family of an indicator, or its ta function when it isn't in a family."""
+    function = TA_FUNCTIONS[key][0]
+    return getTaFamily(function) or function
+
+def callTaFunction(key, parameters, df, indicators=None, timeframe=None):
+    """Calculate an indicator, the ta object of its family is kept in indicators to calculate the other indicators of the family."""
+    function, series, count = TA_FUNCTIONS[key]
+    family = getTaFamily(function)
+    if indicators is not None and family is not None:
+        familyName = (timeframe, family, series, getTaArguments(key, parameters, True))
+        if familyName not in indicators:
+            indicators[familyName] = getTaAttribute(family)(*[df[name] for name in series], *familyName[3])
+        return getattr(indicators[familyName], function.split('.')[1])()
+    return getTaAttribute(function)(*[df[name] for name in series], *getTaArguments(key, parameters))
+
 def getIndex(baseIndex, baseTimeframe, timeframe):
     index = baseIndex
     if timeframe != baseTimeframe:   
@@ -1130,227 +1369,759 @@ def getIndicatorValue(indicators, indicatorComponents, index):
             raise Exception(f'Unknown function type {indicatorComponents[3]}')
     return value
 
+#outcomes of a compiled statement for each symbol
+OUTCOME_ERROR = -1
+OUTCOME_FALSE = 0
+OUTCOME_TRUE = 1
+OUTCOME_UNDECIDED = 2
+
+def getIndexes(baseIndexes, baseTimeframe, timeframe):
+    """Vectorized getIndex."""
+    indexes = baseIndexes
+    if timeframe != baseTimeframe:
+        if baseTimeframe == 'daily':
+            if timeframe == 'weekly':
+                indexes = (baseIndexes-1) // 5
+            elif timeframe == 'monthly':
+                indexes = (baseIndexes-1) // 20
+        if baseTimeframe == 'weekly':
+            if timeframe == 'monthly':
+                indexes = (baseIndexes-1) // 4
+    return indexes
+
+def getIndicatorArrays(series):
+    """Convert an indicator series to the (values, lengths) arrays used by compiled statements."""
+    if series is None or len(series) == 0:
+        return (np.full((1, 1), np.nan), np.zeros(1, dtype=int))
+    return (np.asarray(series.values, dtype=float).reshape(-1, 1), np.array([len(series)]))
+
+def getIndicatorValues(values, lengths, indicatorComponents, indexes):
+    """Vectorized getIndicatorValue for many indexes of many symbols at once.
+    values is a 2-D array of bars x symbols aligned on the last bar (shorter histories are padded with NaN at the top), 
+    lengths is the number of bars of each symbol.
+    Return (values, readable), two arrays of indexes x symbols, where readable is False when getIndicatorValue would 
+    raise an IndexError and the value is NaN.
+    """
+    n = values.shape[0]
+    columns = np.arange(values.shape[1])
+    positions = -(indexes + indicatorComponents[2]).reshape(-1, 1)
+    if indicatorComponents[3] < 1:  #plain indicator
+        positions = np.where(positions < 0, lengths + positions, positions)
+        readable = (positions >= 0) & (positions < lengths)
+        rows = np.clip(n - lengths + positions, 0, n - 1)
+        return (np.where(readable, values[rows, columns], np.nan), readable)
+
+    #min/max/avg function over the slice [-index-range-offset : -index-offset], clipped at the first bar
+    functionRange = indicatorComponents[4]
+    stops = np.where(positions < 0, np.maximum(lengths + positions, 0), 0)
+    ends = n - lengths + stops   #exclusive end row of each slice in values
+    if indicatorComponents[3] in [1, 2]:
+        rolling = pd.DataFrame(values).rolling(functionRange, min_periods=1)
+        aggregated = (rolling.min() if indicatorComponents[3] == 1 else rolling.max()).values
+        result = aggregated[np.clip(ends - 1, 0, n - 1), columns]
+    elif indicatorComponents[3] == 3:
+        padded = np.concatenate([np.full((functionRange, values.shape[1]), np.nan), values])
+        windows = padded[ends[..., np.newaxis] + np.arange(functionRange), columns[:, np.newaxis]]
+        isValue = ~np.isnan(windows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = np.where(isValue, windows, 0).sum(axis=-1) / isValue.sum(axis=-1)
+    else:
+        raise Exception(f'Unknown function type {indicatorComponents[3]}')
+    return (np.where(stops > 0, result, np.nan), np.ones(result.shape, dtype=bool))
+
+def getFirstOutcome(outcomes, default):
+    """Return, for each symbol, the first outcome that is not undecided, as the original per-bar loops would break on."""
+    if outcomes.shape[0] == 0:
+        return np.full(outcomes.shape[1], default)
+    decided = outcomes != OUTCOME_UNDECIDED
+    first = outcomes[decided.argmax(axis=0), np.arange(outcomes.shape[1])]
+    return np.where(decided.any(axis=0), first, default)
+
+def getComparator(moreLess, aboveBelow):
+    """Compile 'is [more/less than x(%| points)] above/below' into a vectorized comparison."""
+    if moreLess is None:
+        if aboveBelow == 'above':
+            return lambda value1, value2: value1 >= value2
+        return lambda value1, value2: value1 <= value2
+    mo = re.search(r'\d+\.?\d*', moreLess)
+    extra = float(mo.group())
+    isPercent = '%' in moreLess
+    isMore = 'more' in moreLess
+    isAbove = aboveBelow == 'above'
+    def compare(value1, value2):
+        margin = np.abs(value2) * extra/100 if isPercent else extra
+        if isMore:
+            return (value1 >= (value2 + margin)) if isAbove else (value1 <= (value2 - margin))
+        if isAbove:
+            return (value1 >= value2) & (value1 < (value2 + margin))
+        return (value1 <= value2) & (value1 > (value2 - margin))
+    return compare
+
+def compileStatement(translation):
+    """Compile a translated statement (types 1 to 6) into a plan of array operations, see evaluateStatement."""
+    statementType = translation[0]
+    plan = {'type': statementType, 'indicator': translation[1]}
+    if statementType == 1:
+        plan['duration'] = 1 if translation[4] is None else translation[4]
+        plan['compare'] = getComparator(translation[2][0], translation[2][1])
+        plan['other'] = translation[3] if type(translation[3]) is list else float(translation[3])
+    elif statementType == 2:
+        plan['duration'] = 1 if translation[4] is None else translation[4]
+        plan['from'] = translation[2] if type(translation[2]) is list else float(translation[2])
+        plan['to'] = translation[3] if type(translation[3]) is list else float(translation[3])
+    elif statementType == 3:
+        plan['duration'] = 1 if translation[4] is None else translation[4]
+        plan['isAbove'] = translation[2] == 'above'
+        plan['other'] = translation[3] if type(translation[3]) is list else float(translation[3])
+    elif statementType in [4, 4.1]:
+        plan['duration'] = 1 if translation[3] is None else translation[3]
+        plan['compare'] = getComparator(translation[2], 'above' if statementType == 4 else 'below')
+    elif statementType in [5, 5.1]:
+        plan['duration'] = translation[2]
+    elif statementType == 6:
+        plan['duration'] = 1 if translation[3] is None else translation[3]
+        plan['period'] = getOffset(translation[2].strip().lower(), translation[1][0])
+        plan['isHigh'] = 'high' in translation[2]
+    else:
+        return None
+    return plan
+
+def compileTranslation(translation):
+    plans = {}
+    for k, v in translation.items():
+        plans[k] = None if v[0] == 99 else compileStatement(v)
+    return plans
+
+def evaluateStatement(plan, getIndicator):
+    """Evaluate a compiled statement for one or many symbols with O(bars) array operations.
+    getIndicator returns the (values, lengths) arrays of an indicator.
+    Return an array with one outcome per symbol: OUTCOME_TRUE, OUTCOME_FALSE or OUTCOME_ERROR.
+    """
+    statementType = plan['type']
+    indicator = plan['indicator']
+    values, lengths = getIndicator(indicator)
+    indexes = np.arange(1, plan['duration']+1)
+    tooShort = lengths <= indexes.reshape(-1, 1)
+    with np.errstate(invalid='ignore'):
+        if statementType == 1:   #'is above/below'
+            value1, readable1 = getIndicatorValues(values, lengths, indicator, indexes)
+            outcomes = np.where(tooShort, OUTCOME_FALSE, np.where(~readable1, OUTCOME_ERROR, OUTCOME_UNDECIDED))
+            other = plan['other']
+            if type(other) is list:
+                outcomes, value2 = evaluateOther(outcomes, getIndicator, indicator, other, indexes)
+            else:
+                value2 = other
+            outcomes = np.where(outcomes != OUTCOME_UNDECIDED, outcomes, np.where(plan['compare'](value1, value2), OUTCOME_UNDECIDED, OUTCOME_FALSE))
+            return getFirstOutcome(outcomes, OUTCOME_TRUE)
+
+        if statementType == 2:   #'is in between'
+            value, readable = getIndicatorValues(values, lengths, indicator, indexes)
+            outcomes = np.where(tooShort, OUTCOME_FALSE, np.where(~readable, OUTCOME_ERROR, OUTCOME_UNDECIDED))
+            bounds = []
+            for other in [plan['from'], plan['to']]:
+                if type(other) is list:
+                    outcomes, bound = evaluateOther(outcomes, getIndicator, indicator, other, indexes)
+                else:
+                    bound = other
+                bounds.append(bound)
+            value1, value2 = bounds
+            result = np.where(value1 > value2, (value >= value2) & (value <= value1), (value >= value1) & (value <= value2))
+            outcomes = np.where(outcomes != OUTCOME_UNDECIDED, outcomes, np.where(result, OUTCOME_UNDECIDED, OUTCOME_FALSE))
+            return getFirstOutcome(outcomes, OUTCOME_TRUE)
+
+        if statementType == 3:   #'crossed above/below'
+            value1, readable1 = getIndicatorValues(values, lengths, indicator, indexes)
+            value1_1, readable1_1 = getIndicatorValues(values, lengths, indicator, indexes+1)
+            outcomes = np.where(tooShort, OUTCOME_FALSE, np.where(~(readable1 & readable1_1), OUTCOME_ERROR, OUTCOME_UNDECIDED))
+            other = plan['other']
+            if type(other) is list:
+                outcomes, value2, value2_1 = evaluateOther(outcomes, getIndicator, indicator, other, indexes, True)
+            else:
+                value2 = value2_1 = other
+            if plan['isAbove']:
+                result = (value1 >= value2) & (value1_1 <= value2_1)
+            else:
+                result = (value1 <= value2) & (value1_1 >= value2_1)
+            outcomes = np.where(outcomes != OUTCOME_UNDECIDED, outcomes, np.where(result, OUTCOME_TRUE, OUTCOME_UNDECIDED))
+            return getFirstOutcome(outcomes, OUTCOME_FALSE)
+
+        if statementType in [4, 4.1]:   #['gained', 'dropped']
+            value1, readable1 = getIndicatorValues(values, lengths, indicator, np.array([1]))
+            value2, readable2 = getIndicatorValues(values, lengths, indicator, np.array([1+plan['duration']]))
+            result = plan['compare'](value1, value2)
+            outcomes = np.where(lengths < 3, OUTCOME_FALSE, np.where(~(readable1 & readable2), OUTCOME_ERROR, np.where(result, OUTCOME_TRUE, OUTCOME_FALSE)))
+            return outcomes[0]
+
+        if statementType in [5, 5.1]:   #['increasing', 'decreasing']
+            value1, readable1 = getIndicatorValues(values, lengths, indicator, indexes)
+            value2, readable2 = getIndicatorValues(values, lengths, indicator, indexes+1)
+            result = (value1 >= value2) if statementType == 5 else (value1 <= value2)
+            outcomes = np.where(tooShort, OUTCOME_FALSE, np.where(~(readable1 & readable2), OUTCOME_ERROR, np.where(result, OUTCOME_UNDECIDED, OUTCOME_FALSE)))
+            return getFirstOutcome(outcomes, OUTCOME_TRUE)
+
+        if statementType == 6:   #'reached high/low'
+            period = plan['period']
+            tooShort = lengths <= (indexes + period).reshape(-1, 1)
+            if period < 1:   #no bar to compare with
+                return getFirstOutcome(np.where(tooShort, OUTCOME_FALSE, OUTCOME_ERROR), OUTCOME_FALSE)
+            #values of every bar of the windows [index, index+period-1] of all indexes, extreme of each window with a reversed rolling
+            value, readable = getIndicatorValues(values, lengths, indicator, np.arange(1, plan['duration']+period))
+            rolling = pd.DataFrame(value[::-1]).rolling(period, min_periods=1)
+            extreme = (rolling.max() if plan['isHigh'] else rolling.min()).values[::-1][:plan['duration']]
+            unreadable = np.concatenate([np.zeros((1, value.shape[1])), np.cumsum(~readable, axis=0)])
+            readable = (unreadable[period:] - unreadable[:-period])[:plan['duration']] == 0
+            value = value[:plan['duration']]
+            result = (value >= extreme) if plan['isHigh'] else (value <= extreme)
+            outcomes = np.where(tooShort, OUTCOME_FALSE, np.where(~readable, OUTCOME_ERROR, np.where(result, OUTCOME_TRUE, OUTCOME_UNDECIDED)))
+            return getFirstOutcome(outcomes, OUTCOME_FALSE)
+
+    raise Exception(f'Unknown statement type {statementType}')
+
+def evaluateOther(outcomes, getIndicator, indicator, other, indexes, withPrevious=False):
+    """Values of the indicator a statement compares with, at the indexes matching the ones of the statement indicator, 
+    and the outcomes updated where that indicator is too short or unreadable."""
+    otherValues, otherLengths = getIndicator(other)
+    otherIndexes = getIndexes(indexes, indicator[0], other[0])
+    value, readable = getIndicatorValues(otherValues, otherLengths, other, otherIndexes)
+    if withPrevious:
+        previous, readablePrevious = getIndicatorValues(otherValues, otherLengths, other, otherIndexes+1)
+        readable = readable & readablePrevious
+    otherOutcomes = np.where(otherLengths <= otherIndexes.reshape(-1, 1), OUTCOME_FALSE, np.where(~readable, OUTCOME_ERROR, OUTCOME_UNDECIDED))
+    outcomes = np.where(outcomes != OUTCOME_UNDECIDED, outcomes, otherOutcomes)
+    if withPrevious:
+        return (outcomes, value, previous)
+    return (outcomes, value)
+
+def updateIndicatorStates(translations):
+    """Bring the states of the indicators used by the translations up to date with the quote store (see indicatorState.py).
+    Only the indicators whose states give the values calculated from the bars loaded for a screener have states,
+    so the results of the screeners are the same with and without the quote store."""
+    indicators = {}
+    for translation in translations:
+        for v in translation.values():
+            if v[0] == 99:
+                continue
+            for indicatorComponents in getStatementIndicators(v):
+                indicator = normalizeIndicator(indicatorComponents[1])
+                key, parameters = splitIndicator(indicator)
+                if key not in TA_FUNCTIONS.keys():
+                    continue
+                function, series = TA_MAPPING[key][0], TA_FUNCTIONS[key][1]
+                if indicatorState.createState(function, series, getTaArguments(key, parameters)) is not None:
+                    indicators.setdefault(indicatorComponents[0], {})[indicator] = (function, series, getTaArguments(key, parameters), functools.partial(callTaFunction, key, parameters))
+    for timeframe, timeframeIndicators in indicators.items():
+        localStates.update(localStore, timeframe, timeframeIndicators, logger)
+
+def updateCandlestickPatternIndex():
+    """Index all the candlestick patterns of the quote store, for all its timeframes (see patternIndex.py)."""
+    patterns = {}
+    for name in utils.get_cp_mapping().keys():
+        try:
+            patterns[name.lower()] = getCandlestickPatterns(name.lower())
+        except Exception:
+            logger.warning(f'{name} is undefined in TA-Lib')   #its statements fail when screening
+    for timeframe in quoteStore.TIMEFRAMES:
+        localPatterns.update(localStore, timeframe, patterns, logger)
+
 def replaceTranslation(screener_id, translationMap):
-    with contextlib.closing(utils.engine.raw_connection()) as conn:
-        cursor = conn.cursor()
-        query = f"DELETE FROM screenertranslation WHERE screener_id = {screener_id}"
-        cursor.execute(query)
-        newrows = []
-        for statement, translation in translationMap.items():
-            row = (screener_id, statement, json.dumps(translation))
-            newrows.append(row)
-        if len(newrows) > 0:
-            query = "INSERT INTO screenertranslation (screener_id, statement, translation) VALUES (%s, %s, %s)"
-            cursor.executemany(query, newrows)
-        conn.commit()
-        cursor.close()
+    newrows = []
+    for statement, translation in translationMap.items():
+        row = (statement, json.dumps(translation))
+        newrows.append(row)
+    dataSource.getDataSource().replaceTranslation(screener_id, newrows)
+
+def loadQuotes(symbols, timeframes):
+    """Retrieve the latest quotes of many symbols from the quote store when one is used, 
+    otherwise (or for the symbols it doesn't have) from the data source, with one query per batch of symbols and timeframe.
+    Return {symbol: {timeframe: dataframe}}, where a symbol without quotes gets an empty dataframe.
+    """
+    columns = quoteStore.COLUMNS
+    quotes = dict((symbol, {}) for symbol in symbols)
+    symbols = list(quotes.keys())
+    for timeframe, maxPeriod in timeframes.items():
+        datapoints = maxPeriod * 2 + 50  #500
+        missingSymbols = symbols
+        if localStore is not None:
+            missingSymbols = []
+            with profile('quotes', 'store'):
+                for symbol in symbols:
+                    df = localStore.getQuotes(symbol, timeframe, datapoints)
+                    if df is None:
+                        missingSymbols.append(symbol)
+                    elif not df.empty:
+                        quotes[symbol][timeframe] = df
+        for i in range(0, len(missingSymbols), QUOTES_BATCH_SIZE):
+            with profile('quotes', 'database'):
+                for symbol, df in dataSource.getDataSource().queryQuotes(missingSymbols[i:i+QUOTES_BATCH_SIZE], timeframe, datapoints).items():
+                    quotes[symbol][timeframe] = df
+        for symbol in symbols:
+            if timeframe not in quotes[symbol]:
+                quotes[symbol][timeframe] = pd.DataFrame(columns=columns)
+    return quotes
+
+def getPanel(quotes, symbols, timeframe):
+    """Stack the quotes of a timeframe into 2-D arrays of bars x symbols aligned on the last bar, 
+    return ({field: array}, number of bars of each symbol)."""
+    lengths = np.array([len(quotes[symbol][timeframe]) for symbol in symbols], dtype=int)
+    n = max(1, lengths.max())
+    fields = {}
+    for field in ['open', 'high', 'low', 'close', 'volume']:
+        values = np.full((n, len(symbols)), np.nan)
+        for j, symbol in enumerate(symbols):
+            if lengths[j] > 0:
+                values[n-lengths[j]:, j] = quotes[symbol][timeframe][field].values
+        fields[field] = values
+    return (fields, lengths)
+
+def parseExpression(expression):
+    """Parse the expression of a screener once into a boolean tree, a statement is a leaf and a node is a tuple ('and'|'or', children). 
+    As when the expression was evaluated by python, 'and' takes precedence over 'or', '*' over both and [ ] groups statements.
+    """
+    tokens = []
+    for i, token in enumerate(EXPRESSION_TOKEN_RE.split(expression.replace('\r', ' ').replace('\n', ' '))):
+        token = token.strip()
+        if len(token) > 0:
+            tokens.append((token, i % 2 == 1))   #(text, is an operator)
+    position = 0
+
+    def accept(operator):
+        nonlocal position
+        if position < len(tokens) and tokens[position] == (operator, True):
+            position += 1
+            return True
+        return False
 
-def isCandlestickPatternFound(name, duration, df, cp_mapping):
-    result = None
-    if cp_mapping[name] is None:
-        result = False
+    def parseOperands(operator, parseOperand):
+        children = [parseOperand()]
+        while accept(operator):
+            children.append(parseOperand())
+        return children[0] if len(children) == 1 else ('or' if operator == 'or' else 'and', children)
+
+    def parseStatement():
+        nonlocal position
+        if accept('['):
+            node = parseOperands('or', parseConjunction)
+            if not accept(']'):
+                raise SyntaxError(f'missing ] in {expression}')
+            return node
+        if position >= len(tokens) or tokens[position][1]:
+            raise SyntaxError(f'missing statement in {expression}')
+        position += 1
+        return tokens[position-1][0]
+
+    def parseConjunction():
+        return parseOperands('and', lambda: parseOperands('*', parseStatement))
+
+    try:
+        tree = parseOperands('or', parseConjunction)
+        if position < len(tokens):
+            raise SyntaxError(f'unexpected {tokens[position][0]} in {expression}')
+    except SyntaxError as e:
+        logger.error(str(e))
+        raise Exception(str(e))
+    return tree
+
+def getStatements(tree):
+    """Return the statements of a boolean tree from left to right."""
+    if type(tree) is str:
+        return [tree]
+    return [statement for child in tree[1] for statement in getStatements(child)]
+
+def getStatementIndicators(translation):
+    """Return the indicators a translated statement needs, as getIndicatorComponents returns them."""
+    if translation[0] in [7, 8]:
+        return [translation[2]] if type(translation[2]) is list else []
+    indicators = [translation[1]]
+    if len(translation) > 3:
+        if translation[0] == 2 and type(translation[2]) is list:
+            indicators.append(translation[2])
+        if type(translation[3]) is list:
+            indicators.append(translation[3])
+    return indicators
+
+def getStatementCost(translation):
+    """Estimate the cost of evaluating a translated statement, a missing statement fails at once."""
+    if translation is None:
+        return 0
+    if translation[0] == 99:
+        return CANDLESTICK_COST
+    return sum(PRICE_COST if indicator[1] in ['open', 'high', 'low', 'close', 'volume', 'range'] else INDICATOR_COST for indicator in getStatementIndicators(translation))
+
+def orderTree(tree, translation):
+    """Sort the operands of every and/or node of a boolean tree by estimated cost, so the cheap statements 
+    decide the outcome before the expensive ones are evaluated; return (tree, cost)."""
+    if type(tree) is str:
+        return (tree, getStatementCost(translation.get(tree)))
+    children = sorted([orderTree(child, translation) for child in tree[1]], key=lambda x: x[1])
+    return ((tree[0], [child for child, cost in children]), sum(cost for child, cost in children))
+
+def getCanonicalExpression(tree, translation):
+    """Write a boolean tree with the translations of its statements, the operands of a node being sorted, 
+    so expressions differing only by the wording or the order of their statements are the same."""
+    if type(tree) is str:
+        return json.dumps(translation[tree]) if tree in translation else tree
+    return tree[0] + '(' + ', '.join(sorted(getCanonicalExpression(child, translation) for child in tree[1])) + ')'
+
+def evaluateTree(tree, getResult):
+    """Evaluate a boolean tree from left to right, getResult(statement) is only called when the statement can still change the outcome."""
+    if type(tree) is str:
+        return bool(getResult(tree))
+    if tree[0] == 'and':
+        return all(evaluateTree(child, getResult) for child in tree[1])
+    return any(evaluateTree(child, getResult) for child in tree[1])
+
+def combineOutcomes(tree, getOutcome, active=None):
+    """Evaluate a boolean tree over arrays of outcomes, one per symbol, with the same short-circuit as evaluateTree: 
+    an error only counts for the symbols reaching its statement, and getOutcome(statement, active) is not called once every symbol is decided.
+    active is the mask of the symbols reaching the statement (None for all of them), the outcomes of the others are ignored."""
+    if type(tree) is str:
+        return getOutcome(tree, active)
+    decisive = OUTCOME_FALSE if tree[0] == 'and' else OUTCOME_TRUE
+    combined = None
+    for child in tree[1]:
+        outcome = combineOutcomes(child, getOutcome, active)
+        decided = (outcome == OUTCOME_ERROR) | (outcome == decisive)
+        if combined is None:
+            combined = np.where(decided, outcome, OUTCOME_UNDECIDED)
+        else:
+            combined = np.where((combined == OUTCOME_UNDECIDED) & decided, outcome, combined)
+        active = (combined == OUTCOME_UNDECIDED) if active is None else active & (combined == OUTCOME_UNDECIDED)
+        if not active.any():
+            break
+    return np.where(combined == OUTCOME_UNDECIDED, OUTCOME_TRUE if decisive == OUTCOME_FALSE else OUTCOME_FALSE, combined)
+
+@functools.lru_cache(maxsize=None)
+def getCandlestickPatterns(name):
+    """Return the (TA-Lib function, sign, lookback) of the patterns of a candlestick statement sorted by performance rank,
+    lookback being the number of bars the function reads before a bar to detect the pattern on it.
+    A signal class (bullish, bearish or neutral candlestick pattern) has all the patterns of its sign.
+    """
+    import talib, talib.abstract
+    cp_mapping = dict((k.lower(), v) for k,v in utils.get_cp_mapping().items())
+    if 'candlestick pattern' in name:
+        sign = 1 if name == 'bullish candlestick pattern' else -1 if name == 'bearish candlestick pattern' else 0
+        names = [kc for kc,vc in sorted(cp_mapping.items(), key=lambda x: x[1][2]) if len(vc[0]) > 0 and (vc[1] > 0) - (vc[1] < 0) == sign]
     else:
-        if duration is None:
-            duration = 1
-        value = getattr(talib, cp_mapping[name][0])(df['open'], df['high'], df['low'], df['close'])
-        #logger.debug(name + ': ' + str(value))
-        sign_of_value = cp_mapping[name][1]
-        for i in range(1, duration+1):
-            if sign_of_value > 0 and value.iloc[-i] > 0:
-                result = True
-                break
-            elif sign_of_value < 0 and value.iloc[-i] < 0:
-                result = True
+        names = [name]
+    patterns = []
+    for cs_pattern in names:
+        if cp_mapping[cs_pattern] is None:
+            continue
+        function = cp_mapping[cs_pattern][0]
+        try:
+            lookback = talib.abstract.Function(function).lookback
+        except Exception:
+            lookback = CANDLESTICK_LOOKBACK
+        patterns.append((getattr(talib, function), cp_mapping[cs_pattern][1], lookback))
+    return tuple(patterns)
+
+def findCandlestickPattern(patterns, duration, df):
+    """Return the index of the first of patterns formed on one of the last duration bars of df, None when none of them is.
+    Only the last duration + lookback bars are scanned, the same contiguous float64 arrays are passed to all the patterns.
+    """
+    window = duration + max([pattern[2] for pattern in patterns] + [0])
+    prices = [np.ascontiguousarray(df[column].values[-window:], dtype=np.float64) for column in ['open', 'high', 'low', 'close']]
+    for j, (function, sign, lookback) in enumerate(patterns):
+        value = function(*prices)[-duration:]
+        if (sign > 0 and (value > 0).any()) or (sign < 0 and (value < 0).any()) or (sign == 0 and (value != 0).any()):
+            return j
+        if duration > len(value):
+            raise IndexError('single positional indexer is out-of-bounds')
+    return None
+
+def isStatementPatternFound(translation, df, symbol=None):
+    """Return True when the candlestick pattern of a statement, or one of the patterns of its signal class, is formed.
+    The result is read from the candlestick pattern index when it has the quotes, otherwise cached like the indicators."""
+    duration = 1 if translation[3] is None else translation[3]
+    if localPatterns is not None and symbol is not None:
+        isPatternFound = localPatterns.isPatternFound(symbol, translation[1], translation[2], duration, df)
+        if isPatternFound is not None:
+            return isPatternFound
+    cacheKey = None
+    if indicatorCache is not None and symbol is not None:
+        cacheKey = IndicatorCache.getKey(symbol, translation[1], ('candlestick', translation[2], duration), df)
+        found, isPatternFound = indicatorCache.lookup(cacheKey)
+        if found:
+            return isPatternFound
+    with profile('candlestick', translation[2]):
+        isPatternFound = findCandlestickPattern(getCandlestickPatterns(translation[2]), duration, df) is not None
+    if cacheKey is not None:
+        indicatorCache.store(cacheKey, isPatternFound)
+    return isPatternFound
+
+
+class ScreenerPipeline:
+    """Stages of a runScreeners pass, run concurrently with bounded queues between them:
+    - prepare: load the symbols of the exchanges of the next screeners
+    - screen: run the screeners one after the other in the worker pool, the cpu bound stage
+    - publish: save the results by batches of RESULTS_BATCH_SIZE, then queue their emails to the dispatcher, which sends them in its own threads
+    The blocking database calls run in the default thread pool executor of the event loop.
+    """
+
+    def __init__(self, pool, dispatcher, intraday=False, mode='symbol'):
+        self._pool = pool
+        self._dispatcher = dispatcher
+        self._intraday = intraday
+        self._mode = mode
+        self.defaultScreeners = []
+        self.messages = {}   #message of each distinct screener run, by canonical key
+        self.screenersRun = 0
+        self.writeStats = {'rows': 0, 'commits': 0, 'seconds': 0.0}
+        self._exchangeSymbols = {}   #symbols of the exchanges of the screeners, queried once per run
+        self._recipients = {}
+
+    async def run(self, myScreeners):
+        screenQueue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        publishQueue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        self._recipients = await asyncio.get_running_loop().run_in_executor(None, getScreenerRecipients, [myScreener.id for myScreener in myScreeners])
+        await asyncio.gather(self.__prepare(myScreeners, screenQueue), self.__screen(screenQueue, publishQueue), self.__publish(publishQueue))
+
+    async def __prepare(self, myScreeners, screenQueue):
+        loop = asyncio.get_running_loop()
+        keys = set()
+        for myScreener in myScreeners:
+            key = myScreener.getCanonicalKey()
+            #the symbols of a screener already run or copied from a default screener aren't needed
+            if key not in keys and not (self._intraday and myScreener.id < 6) and myScreener.symbols is None and not isBlank(myScreener.exchanges):
+                myScreener.symbols = await self.__getExchangeSymbols(myScreener.exchanges)
+            keys.add(key)
+            await screenQueue.put((myScreener, key))
+        await screenQueue.put(None)
+
+    async def __getExchangeSymbols(self, exchanges):
+        key = frozenset(exchanges.split())
+        if key not in self._exchangeSymbols:
+            if localSymbols is not None:
+                with profile('universe', 'index'):
+                    self._exchangeSymbols[key] = localSymbols.select(exchanges=exchanges.split())
+            else:
+                self._exchangeSymbols[key] = await asyncio.get_running_loop().run_in_executor(None, getExchangeSymbols, exchanges)
+        return list(self._exchangeSymbols[key])
+
+    async def __screen(self, screenQueue, publishQueue):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await screenQueue.get()
+            if item is None:
                 break
-            elif sign_of_value == 0 and value.iloc[-i] != 0:
-                result = True
+            myScreener, key = item
+            message = None
+            defaultScreener = None
+            if myScreener.id < 6:
+                self.defaultScreeners.append((myScreener, key))
+                if self._intraday: 
+                    continue  #don't run defaultScreeners intraday
+            if key in self.messages:   #same screener already run, e.g. a clone of another user's screener
+                message = self.messages[key]
+            elif myScreener.id >= 6:
+                for ds, dsKey in self.defaultScreeners:
+                    if key == dsKey:
+                        defaultScreener = ds
+                        break;
+            if defaultScreener is not None:  #copy result from defaultScreeners when criteria totally match
+                message = await loop.run_in_executor(None, getScreenerResult, defaultScreener.id)
+
+            if message is None: 
+                if myScreener.symbols is None and not isBlank(myScreener.exchanges):
+                    myScreener.symbols = await self.__getExchangeSymbols(myScreener.exchanges)
+                if len(myScreener.symbols) == 0:
+                    continue
+                matchingSymbols = await loop.run_in_executor(None, myScreener.getMatchingSymbols, self._pool, self._mode)
+                self.screenersRun += 1
+                if len(matchingSymbols) > 0:
+                    message = 'Matching symbols: ' + ' '.join(matchingSymbols)
+                else:
+                    message = 'No matching symbols'
+            self.messages[key] = message
+            await publishQueue.put((myScreener, message))
+        await publishQueue.put(None)
+
+    async def __publish(self, publishQueue):
+        loop = asyncio.get_running_loop()
+        results = []
+        while True:
+            item = await publishQueue.get()
+            if item is not None:
+                myScreener, message = item
+                #logger.info(f'screener_id = {myScreener.id}, message = {message}')
+                if myScreener.id in self._recipients:
+                    results.append((myScreener.id, message))
+            if len(results) > 0 and (item is None or len(results) >= RESULTS_BATCH_SIZE):
+                start = timer()
+                await loop.run_in_executor(None, saveScreenerResults, results)
+                self.writeStats['rows'] += len(results)
+                self.writeStats['commits'] += 1
+                self.writeStats['seconds'] += timer() - start
+                mails = []
+                for screener_id, message in results:
+                    screener_name, email = self._recipients[screener_id]
+                    if email is not None:  
+                        subject = f"Result of screener [{screener_name}]"
+                        mails.append((email, subject, message + utils.mail_signature))
+                if len(mails) > 0:
+                    await loop.run_in_executor(None, self._dispatcher.sendMails, mails)
+                results = []
+            if item is None:
                 break
-            
-    if result is None:
-        result = False
-    return result
 
 
-def runScreeners(region=None, intraday=False):
+def getExchangeSymbols(exchanges):
+    with profile('universe', 'database'):
+        return dataSource.getDataSource().getExchangeSymbols(exchanges.split())
+
+def getScreenerResult(screener_id):
+    return dataSource.getDataSource().getScreenerResult(screener_id)
+
+def getScreenerRecipients(screener_ids):
+    """Return {screener_id: (name of the screener, email of its user)} with one query, the email being None 
+    for the system user and the users not verified."""
+    recipients = {}
+    for row in dataSource.getDataSource().getScreenerRecipients(screener_ids):
+        recipients[row[0]] = (row[1], row[3] if row[2] != 1 else None)   #send email to non system user
+    return recipients
+
+def saveScreenerResults(results):
+    """Save the (screener_id, message) results of screeners with one statement and one commit."""
+    with profile('write'):
+        dataSource.getDataSource().saveScreenerResults(results)
+
+
+def loadScreeners(region=None, intraday=False):
+    """Return the screeners to run with their symbols or exchanges and their translations, loaded with one query per table."""
+    myScreeners = []
+    source = dataSource.getDataSource()
+    screeners = source.getScreeners(region)
+    if intraday:   #run newly created or updated screeners only
+        #always include defaultScreeners to copy results from when user created screeners from sample records
+        screeners = [screener for screener in screeners if screener[0] < 6 or screener[-1] is None or screener[-1] <= screener[-2]]
+
+    watchlistIds = set()
+    for screener in screeners:
+        if not isBlank(screener[9]):
+            watchlistIds.update(screener[9].split())
+    watchlists = {}
+    if len(watchlistIds) > 0:
+        watchlists = source.getWatchlists(watchlistIds)
+
+    for screener in screeners:
+        myScreener = MyScreener()
+        watchlistIdsOfScreener = screener[9]
+        if isBlank(watchlistIdsOfScreener):    #watchlists take precedence to exchanges
+            myScreener.exchanges = screener[8]
+        else:
+            symbols = set()
+            for watchlistId in watchlistIdsOfScreener.split():
+                if watchlistId in watchlists:
+                    symbols.update(watchlists[watchlistId].split(' '))
+            myScreener.symbols = symbols
+        if not isBlank(myScreener.exchanges) or myScreener.symbols is not None:
+            setScreenerFields(myScreener, screener)
+            myScreener.translation = {}
+            myScreeners.append(myScreener)
+
+    screenersById = dict((myScreener.id, myScreener) for myScreener in myScreeners)
+    for screener_id, statement, translation in source.getTranslations(list(screenersById.keys())):
+        screenersById[screener_id].translation[statement] = json.loads(translation)
+    return myScreeners
+
+def setScreenerFields(myScreener, screener):
+    """Set the fields of a screener from its row, see dataSource.SCREENER_COLUMNS."""
+    myScreener.id = screener[0]
+    myScreener.expression = screener[1]
+    myScreener.priceType = screener[2]
+    myScreener.priceLow = screener[3]
+    myScreener.priceHigh = screener[4]
+    myScreener.volumeType = screener[5]
+    myScreener.volumeLow = screener[6]
+    myScreener.volumeHigh = screener[7]
+    myScreener.industries = screener[10]
+
+
+def runScreeners(region=None, intraday=False, mode='symbol', storePath=None, profilePath=None, outbox=False):
+    """Run the screeners of a region, profilePath is the file the profile of the run is written to (see screenerProfiler.py),
+    the run isn't profiled when it is None. With outbox, the emails are kept in the notificationoutbox table until they are sent
+    (see notificationDispatcher.py). The quote store at storePath only has end of day quotes, it can't be used by intraday runs."""
     #if intraday:
     #    logging.config.fileConfig("logging_app.cfg")
     #    logger = applogging.getLogger(os.path.basename(__file__))
+    if intraday and storePath is not None:
+        raise Exception('The quote store only has end of day quotes, intraday runs read the database')
     logger.info('runScreeners - start')
-    myScreeners = []
-    with contextlib.closing(utils.engine.raw_connection()) as conn:
-        cursor = conn.cursor()
-        query = "SELECT id, expression, priceType, priceLow, priceHigh, volumeType, volumeLow, volumeHigh, exchanges, watchlists, industries, lastUpdate FROM screener" 
-        if region is not None:
-            query += " WHERE region = '{}'".format(region) 
-        query += " ORDER BY id" 
-        cursor.execute(query)
-        screeners = cursor.fetchall()
-        for screener in screeners:
-            if intraday:   #run newly created or updated screeners only
-                if screener[0] >= 6:  #always include defaultScreeners to copy results from when user created screeners from sample records
-                    query = f"SELECT lastUpdate FROM screenerresult WHERE screener_id = {screener[0]}" 
-                    cursor.execute(query)
-                    result = cursor.fetchone()
-                    if result is not None and result[0] > screener[-1]:
-                        #print(f'screener {screener[0]} skipped')
-                        continue
-
-            #print(f'screener {screener[0]} is going to be run')
-            myScreener = MyScreener()
-            watchlists = screener[9]
-            if isBlank(watchlists):    #watchlists take precedence to exchanges
-                myScreener.exchanges = screener[8]
-            else:
-                query = f"SELECT symbols FROM watchlist where id in ({watchlists.replace(' ',',')})"
-                cursor.execute(query)
-                rows = cursor.fetchall()
-                symbols = set()
-                for row in rows:
-                    symbols.update(row[0].split(' '))
-                myScreener.symbols = symbols
-            if not isBlank(myScreener.exchanges) or myScreener.symbols is not None:
-                myScreener.id = screener[0]
-                myScreener.expression = screener[1]
-                myScreener.priceType = screener[2]
-                myScreener.priceLow = screener[3]
-                myScreener.priceHigh = screener[4]
-                myScreener.volumeType = screener[5]
-                myScreener.volumeLow = screener[6]
-                myScreener.volumeHigh = screener[7]
-                myScreener.industries = screener[10]
-
-                query = f"SELECT statement, translation FROM screenertranslation where screener_id = {myScreener.id}"
-                cursor.execute(query)
-                rows = cursor.fetchall()
-                translation = {}
-                for row in rows:
-                    translation[row[0]] = json.loads(row[1])
-                myScreener.translation = translation
-                myScreeners.append(myScreener)
-        cursor.close()
-
-    defaultScreeners = []
-    for myScreener in myScreeners:
-        message = None
-        query_result = None
-        if myScreener.id < 6:
-            defaultScreeners.append(myScreener)
-            if intraday: 
-                continue  #don't run defaultScreeners intraday
-            #query_result = f"SELECT result FROM screenerresult WHERE screener_id = {myScreener.id}" 
-        else:
-            for ds in defaultScreeners:
-                if (myScreener.expression == ds.expression and myScreener.exchanges == ds.exchanges and myScreener.industries == ds.industries and 
-                    myScreener.priceType == ds.priceType and myScreener.priceLow == ds.priceLow and myScreener.priceHigh == ds.priceHigh and 
-                    myScreener.volumeType == ds.volumeType and myScreener.volumeLow == ds.volumeLow and myScreener.volumeHigh == ds.volumeHigh):  
-                    query_result = f"SELECT result FROM screenerresult WHERE screener_id = {ds.id}" 
-                    break;
-        if query_result is not None:  #copy result from defaultScreeners when criteria totally match
-            with contextlib.closing(utils.engine.raw_connection()) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query_result)
-                result = cursor.fetchone()
-                cursor.close()
-                if result is not None:
-                    message = result[0]
-                 
-        if message is None: 
-            if myScreener.symbols is None and not isBlank(myScreener.exchanges):
-                query = f"SELECT ticker FROM symbols WHERE active=1 and exchange_id in ({myScreener.exchanges.replace(' ',',')})" 
-                with contextlib.closing(utils.engine.raw_connection()) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(query)
-                    rows = cursor.fetchall()
-                    cursor.close()
-                myScreener.symbols = [row[0] for row in rows]
-            if len(myScreener.symbols) == 0:
-                continue
-            matchingSymbols = myScreener.getMatchingSymbols()
-            utils.engine.dispose()
-            if len(matchingSymbols) > 0:
-                message = 'Matching symbols: ' + ' '.join(matchingSymbols)
-            else:
-                message = 'No matching symbols'
-                    
-        #logger.info(f'screener_id = {myScreener.id}, message = {message}')
-        with contextlib.closing(utils.engine.raw_connection()) as conn:
-            cursor = conn.cursor()
-            query = f"SELECT user_id, name FROM screener WHERE id = {myScreener.id}"
-            cursor.execute(query)
-            screener = cursor.fetchone()
-            screener_name = ''
-            email = None
-            if screener is not None:
-                user_id = screener[0]
-                screener_name = screener[1]
-                if user_id != 1:  #send email to non system user
-                    query = f"SELECT email FROM user WHERE id = {user_id} and isVerified = 1"
-                    cursor.execute(query)
-                    result = cursor.fetchone()
-                    if result is not None:
-                        email = result[0]
-                
-                #query = "UPDATE screener SET result = %s, resultTimestamp = %s WHERE id = %s" 
-                query = "INSERT INTO screenerresult (screener_id, result) VALUES (%s, %s) ON DUPLICATE KEY UPDATE result=%s, lastUpdate=UTC_TIMESTAMP()"
-                cursor.execute(query, (myScreener.id, message, message))
-                conn.commit()
-                
-            cursor.close()
-                
-        if email is not None:  
-            subject = f"Result of screener [{screener_name}]"
-            message += utils.mail_signature
-            utils.sendMail(email, subject, message, logger)
+    global localSymbols, profiler
+    profiler = None if profilePath is None else screenerProfiler.ScreenerProfiler()
+    with profile('universe', 'load'):
+        localSymbols = symbolIndex.SymbolIndex.load()
+    logger.info(f'{len(localSymbols)} active symbols')
+    lastDates = None if storePath is None else localSymbols.getLastDates()
+    useQuoteStore(storePath, lastDates)
+    if localStore is not None:
+        staleSymbols = localStore.getStaleSymbols()
+        if len(staleSymbols) > 0:
+            logger.warning(f'quote store: {len(staleSymbols)} symbols with quotes after the store are read from the database, refresh the store after the EOD load')
+    with profile('screeners', 'load'):
+        myScreeners = loadScreeners(region, intraday)
+    if storePath is not None:
+        with profile('store', 'indicator states'):
+            updateIndicatorStates([myScreener.translation for myScreener in myScreeners])
+        with profile('store', 'candlestick patterns'):
+            updateCandlestickPatternIndex()
+
+    with ScreenerPool(storePath=storePath, profiling=profiler is not None, lastDates=lastDates) as pool:
+        with notificationDispatcher.NotificationDispatcher(logger, outbox=outbox, profiler=profiler) as dispatcher:
+            pipeline = ScreenerPipeline(pool, dispatcher, intraday, mode)
+            asyncio.run(pipeline.run(myScreeners))
+        writeStats = pipeline.writeStats
+        logger.info(f"results: {writeStats['rows']} saved with {writeStats['commits']} commits in {writeStats['seconds']:.2f}s ({0 if writeStats['commits'] == 0 else 1000*writeStats['seconds']/writeStats['commits']:.0f}ms per commit)")
+        notificationStats = dispatcher.stats()
+        logger.info(f"notifications: {notificationStats['sent']} sent, {notificationStats['failed']} failed, {notificationStats['retries']} retries, {notificationStats['sessions']} SMTP sessions")
+        defaultScreeners = pipeline.defaultScreeners
+        screenersRun = pipeline.screenersRun
+        screenersDone = len(myScreeners) - (len(defaultScreeners) if intraday else 0)
+        logger.info(f"deduplication: {screenersRun} screeners run for {screenersDone} screeners ({0 if screenersDone == 0 else 100 - 100*screenersRun//screenersDone}% deduplicated)")
+        cacheStats = pool.getCacheStats()
+        lookups = cacheStats['hits'] + cacheStats['misses']
+        logger.info(f"indicator cache: {cacheStats['hits']} hits, {cacheStats['misses']} misses ({0 if lookups == 0 else 100*cacheStats['hits']//lookups}% hit ratio), {cacheStats['evictions']} evictions, {cacheStats['entries']} entries, {cacheStats['bytes']//1024} KB")
+        evaluationStats = pool.getEvaluationStats()
+        logger.info(f"lazy evaluation: {evaluationStats['statements']} statements evaluated, {evaluationStats['skippedStatements']} skipped, {evaluationStats['calculations']} indicator calculations, {evaluationStats['skippedCalculations']} skipped")
+        batchStats = pool.getBatchStats()
+        workSeconds = batchStats['quotesSeconds'] + batchStats['screeningSeconds']
+        logger.info(f"worker pool: {pool.startupSeconds:.2f}s starting {pool.processes} workers, {workSeconds:.1f}s of work ({0 if workSeconds == 0 else 100*pool.startupSeconds/(pool.startupSeconds + workSeconds):.1f}% startup)")
+        logger.info(f"batches: {batchStats['batches']} batches of {batchStats['symbols']} symbols, {batchStats['quotesSeconds']:.1f}s loading quotes, {batchStats['screeningSeconds']:.1f}s screening ({0 if batchStats['batches'] == 0 else 1000*(batchStats['quotesSeconds'] + batchStats['screeningSeconds'])/batchStats['batches']:.0f}ms per batch)")
+        if profiler is not None:
+            for phases in pool.getProfilerPhases():
+                profiler.merge(phases)
+            for phase in profiler.report()['phases'][:PROFILE_LOGGED_PHASES]:
+                logger.info(f"profile: {phase['phase']}{'' if phase['label'] is None else ' ' + phase['label']}: {phase['calls']} calls, {phase['selfSeconds']:.2f}s ({phase['seconds']:.2f}s with the phases inside)")
+            profiler.save(profilePath)
+            logger.info(f'profile saved to {profilePath}')
     logger.info('runScreeners - end')
 
 
 def testScreener(id, symbols=None):
     myScreener = MyScreener()
-    with contextlib.closing(utils.engine.raw_connection()) as conn:
-        cursor = conn.cursor()
-        query = f"SELECT id, expression, priceType, priceLow, priceHigh, volumeType, volumeLow, volumeHigh, exchanges, watchlists, industries FROM screener WHERE id = {id}" 
-        cursor.execute(query)
-        screener = cursor.fetchone()
-        if symbols is not None:
-            myScreener.symbols = symbols
+    source = dataSource.getDataSource()
+    screener = source.getScreeners(screener_id=id)[0]
+    if symbols is not None:
+        myScreener.symbols = symbols
+    else:
+        watchlists = screener[9]
+        if isBlank(watchlists):    #watchlists take precedence to exchanges
+            myScreener.exchanges = screener[8]
         else:
-            watchlists = screener[9]
-            if isBlank(watchlists):    #watchlists take precedence to exchanges
-                myScreener.exchanges = screener[8]
-            else:
-                query = f"SELECT symbols FROM watchlist where id in ({watchlists.replace(' ',',')})"
-                cursor.execute(query)
-                rows = cursor.fetchall()
-                symbols = set()
-                for row in rows:
-                    symbols.update(row[0].split(' '))
-                myScreener.symbols = symbols
-
-        if myScreener.symbols is not None or not isBlank(myScreener.exchanges):
-            myScreener.id = screener[0]
-            myScreener.expression = screener[1]
-            myScreener.priceType = screener[2]
-            myScreener.priceLow = screener[3]
-            myScreener.priceHigh = screener[4]
-            myScreener.volumeType = screener[5]
-            myScreener.volumeLow = screener[6]
-            myScreener.volumeHigh = screener[7]
-            myScreener.industries = screener[10]
-
-            query = f"SELECT statement, translation FROM screenertranslation where screener_id = {myScreener.id}"
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            translation = {}
-            for row in rows:
-                translation[row[0]] = json.loads(row[1])
-            myScreener.translation = translation
-
-        if myScreener.symbols is None and not isBlank(myScreener.exchanges):
-            query = f"SELECT ticker FROM symbols WHERE active=1 and exchange_id in ({myScreener.exchanges.replace(' ',',')})" 
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            myScreener.symbols = [row[0] for row in rows]
-        cursor.close()
+            symbols = set()
+            for watchlist in source.getWatchlists(watchlists.split()).values():
+                symbols.update(watchlist.split(' '))
+            myScreener.symbols = symbols
+
+    if myScreener.symbols is not None or not isBlank(myScreener.exchanges):
+        setScreenerFields(myScreener, screener)
+        translation = {}
+        for screener_id, statement, statementTranslation in source.getTranslations([myScreener.id]):
+            translation[statement] = json.loads(statementTranslation)
+        myScreener.translation = translation
+
+    if myScreener.symbols is None and not isBlank(myScreener.exchanges):
+        myScreener.symbols = source.getExchangeSymbols(myScreener.exchanges.split())
 
     if len(myScreener.symbols) > 0:
         matchingSymbols = myScreener.getMatchingSymbols()
@@ -1361,26 +2132,45 @@ def testScreener(id, symbols=None):
      
 
 def main():
+    import concurrent_log_handler   #handler of logging.cfg
+    logging.config.fileConfig("logging.cfg", disable_existing_loggers=False)
     region = None
     intraday = False
+    mode = 'symbol'
+    storePath = None
+    profilePath = None
+    outbox = False
     if len(sys.argv) >= 2:
         try:
-            opts, args = getopt.getopt(sys.argv[1:], "r:i")
+            opts, args = getopt.getopt(sys.argv[1:], "r:im:q:p:d:o")
         except getopt.GetoptError:
-            print(f'Usage: {os.path.basename(__file__)} [-r|-i] [<region>|<intraday>]')
+            print(f'Usage: {os.path.basename(__file__)} [-r|-i|-m|-q|-p|-d|-o] [<region>|<intraday>|<mode>|<quote store path>|<profile path, .json or .prom>|<data source url>|<outbox>]')
             sys.exit(2)
         for opt, arg in opts:
             if opt in ("-r", "--region"):
                 region = arg
             elif opt in ("-i", "--intraday"):
                 intraday = True
+            elif opt in ("-m", "--mode"):   #symbol or panel, faster for the price, MA and EMA statements calculated for a whole batch at once, as fast for the others
+                mode = arg
+            elif opt in ("-q", "--quotes"):   #end of day runs only, see quoteStore.py
+                storePath = arg
+            elif opt in ("-p", "--profile"):
+                profilePath = arg
+            elif opt in ("-d", "--data"):   #sqlalchemy url or parquet:///path of a snapshot, see dataSource.py
+                dataSource.useDataSource(dataSource.openDataSource(arg))
+            elif opt in ("-o", "--outbox"):   #needs the notificationoutbox table, see notificationDispatcher.py
+                outbox = True
             
         if region is not None:
             region = utils.regions.get(int(region))
             if region is None:
                 region = 'Americas'
+        if intraday and storePath is not None:
+            print('The quote store only has end of day quotes, -q can\'t be used with -i')
+            sys.exit(2)
 
-    runScreeners(region, intraday)
+    runScreeners(region, intraday, mode, storePath, profilePath, outbox)
     
     
 if __name__ == '__main__':  
@@ -0,0 +1,200 @@
+#! python3
+
+import pandas as pd
+import numpy as np
+import os, glob, pickle, collections
+
+#define constants
+STATE_BARS = 500   #latest values kept for each indicator, screeners needing more bars calculate the indicator from the quotes
+STATE_FORMAT = 3   #format of the states, the states of another format are rebuilt from the quotes
+STATE_CHECK_SYMBOLS = 20   #symbols whose served values are checked against the ta function when the states are updated
+
+
+class RollingState:
+    """Last n values of a series, for the Donchian channels."""
+
+    def __init__(self, name, n, statistic):
+        self.name = name
+        self.n = n
+        self.statistic = statistic
+        self.window = collections.deque(maxlen=n)
+
+    def initialize(self, df):
+        self.window = collections.deque(df[self.name].values[-self.n:], maxlen=self.n)
+
+    def update(self, bar):
+        self.window.append(bar[self.name])
+        if len(self.window) < self.n:
+            return np.nan
+        return max(self.window) if self.statistic == 'max' else min(self.window)
+
+
+def createState(function, series, arguments):
+    """Return the state calculating a ta function bar by bar, None when it isn't supported.
+    Only the indicators whose values don't depend on the first bar they are calculated from are supported, so the values
+    of the states are the ones calculated from the bars loaded by a screener: the highest high and the lowest low of the
+    Donchian channels. The moving averages and the Bollinger bands are sums rounded differently from another first bar,
+    the recursive (EMA, RSI, ATR) and cumulative (OBV, ADI) indicators are seeded by it."""
+    if len(arguments) != 1 or not (type(arguments[0]) is int or (type(arguments[0]) is float and arguments[0].is_integer())):
+        return None
+    n = int(arguments[0])
+    if function == 'volatility.donchian_channel_hband':   #highest high and lowest low, as volatility.DonchianChannel
+        return RollingState('high', n, 'max')
+    if function == 'volatility.donchian_channel_lband':
+        return RollingState('low', n, 'min')
+    return None
+
+def getServedValues(values, window, length):
+    """Return the last length values of an indicator as calculated from these bars only, undefined before window bars."""
+    values = np.array(values[-length:], dtype=float)
+    values[:window-1] = np.nan
+    return values
+
+
+class IndicatorStates:
+    """States of the rolling indicators of every symbol of a quote store (see createState), kept in its 'states' directory:
+    - {timeframe}.pkl: the version, {symbol: row} and {indicator: (file, {symbol: (date, close)}, window)}, the date and the close of the last bar calculated
+    - {timeframe}-{version}-states.pkl: the states, only read by update
+    - {timeframe}-{version}-{file}.npy: the latest STATE_BARS values of an indicator, one row per symbol
+    After each EOD refresh of the quote store, update calculates the new bars from the states in O(1) per bar,
+    and rebuilds the states of a symbol from its whole history when its quotes changed (adjclose changed by a split or a dividend).
+    An indicator is only served when its values for STATE_CHECK_SYMBOLS symbols are the ones of its ta function for the same bars.
+    """
+
+    def __init__(self, path):
+        self._path = os.path.join(path, 'states')
+        self._timeframes = {}
+
+    def __getManifestPath(self, timeframe):
+        return os.path.join(self._path, timeframe + '.pkl')
+
+    def __getPath(self, timeframe, version, name):
+        return os.path.join(self._path, f'{timeframe}-{version}-{name}')
+
+    def getTimeframe(self, timeframe):
+        """Return (manifest, {indicator: memory map}) of a timeframe, None when there are no states for it."""
+        if timeframe not in self._timeframes:
+            try:
+                with open(self.__getManifestPath(timeframe), 'rb') as f:
+                    manifest = pickle.load(f)
+            except FileNotFoundError:
+                return None
+            arrays = dict((indicator, np.load(self.__getPath(timeframe, manifest['version'], f'{v[0]}.npy'), mmap_mode='r')) for indicator, v in manifest['indicators'].items())
+            self._timeframes[timeframe] = (manifest, arrays)
+        return self._timeframes[timeframe]
+
+    @staticmethod
+    def __isCurrent(stored, indicator):
+        return stored is not None and stored[0].get('format') == STATE_FORMAT and indicator in stored[0]['indicators']
+
+    def hasIndicator(self, timeframe, indicator):
+        return IndicatorStates.__isCurrent(self.getTimeframe(timeframe), indicator)
+
+    def getSeries(self, symbol, timeframe, indicator, df):
+        """Return the indicator calculated from the states for the quotes of df, None when the states can't tell."""
+        stored = self.getTimeframe(timeframe)
+        if not IndicatorStates.__isCurrent(stored, indicator) or len(df) == 0 or len(df) > STATE_BARS:
+            return None
+        last = stored[0]['indicators'][indicator][1].get(symbol)
+        if last is None or last[0] != np.datetime64(pd.Timestamp(df.index[-1]), 'D') or last[1] != df['close'].values[-1]:
+            return None
+        window = stored[0]['indicators'][indicator][2]
+        return pd.Series(getServedValues(stored[1][indicator][stored[0]['symbols'][symbol]], window, len(df)), index=df.index)
+
+    @staticmethod
+    def __check(quotesManifest, columns, manifest, indicator, array, calculate):
+        """Return whether the values served for STATE_CHECK_SYMBOLS symbols spread over the store are the ones calculate returns
+        for the same bars, for the shortest and the longest quotes a screener can get served."""
+        i, lasts, window = manifest['indicators'][indicator]
+        symbols = list(lasts.keys())
+        for symbol in symbols[::max(1, len(symbols) // STATE_CHECK_SYMBOLS)][:STATE_CHECK_SYMBOLS]:
+            offset, length = quotesManifest['symbols'][symbol]
+            for bars in sorted(set([min(length, window * 2 + 50), min(length, STATE_BARS)])):
+                df = pd.DataFrame(dict((column, columns[column][offset+length-bars:offset+length]) for column in ['open', 'high', 'low', 'close', 'volume']))
+                try:
+                    expected = np.asarray(calculate(df), dtype=float)
+                except Exception:
+                    continue
+                served = getServedValues(array[manifest['symbols'][symbol]], window, bars)
+                if served.shape != expected.shape or not ((served == expected) | (np.isnan(served) & np.isnan(expected))).all():
+                    return False
+        return True
+
+    def update(self, store, timeframe, indicators, logger):
+        """Bring the states of indicators ({indicator: (function, series, arguments, calculate)}) up to date with the quote store,
+        calculate(df) being the ta function of the indicator, used when a state is rebuilt and to check the served values."""
+        os.makedirs(self._path, exist_ok=True)
+        quotes = store.getTimeframe(timeframe)
+        if quotes is None:
+            return
+        quotesManifest, columns = quotes
+        stored = self.getTimeframe(timeframe)
+        if stored is not None:
+            with open(self.__getPath(timeframe, stored[0]['version'], 'states.pkl'), 'rb') as f:
+                previousStates = pickle.load(f)
+        symbols = list(quotesManifest['symbols'].keys())
+        manifest = {'version': 1 if stored is None else stored[0]['version'] + 1, 'format': STATE_FORMAT, 'symbols': dict((symbol, i) for i, symbol in enumerate(symbols)), 'indicators': {}}
+        states = {}
+        arrays = {}
+        updated = 0
+        rebuilt = 0
+        for i, (indicator, (function, series, arguments, calculate)) in enumerate(indicators.items()):
+            template = createState(function, series, arguments)
+            if template is None:
+                continue   #calculated from the quotes
+            window = template.n
+            manifest['indicators'][indicator] = (i, {}, window)
+            states[indicator] = {}
+            arrays[indicator] = np.full((len(symbols), STATE_BARS), np.nan)
+            for j, symbol in enumerate(symbols):
+                offset, length = quotesManifest['symbols'][symbol]
+                if length == 0:
+                    continue
+                dates = columns['date'][offset:offset+length]
+                close = columns['close'][offset:offset+length]
+                state = None
+                values = None
+                previous = stored[0]['indicators'][indicator][1].get(symbol) if IndicatorStates.__isCurrent(stored, indicator) else None
+                if previous is not None:
+                    k = np.searchsorted(dates, previous[0])
+                    bars = dict((column, columns[column][offset+k+1:offset+length]) for column in ['open', 'high', 'low', 'close', 'volume'])
+                    if k < length and dates[k] == previous[0] and close[k] == previous[1] and not any(np.isnan(v).any() for v in bars.values()):
+                        state = previousStates[indicator][symbol]
+                        values = np.array(stored[1][indicator][stored[0]['symbols'][symbol]])
+                        newValues = [state.update(dict((column, bars[column][m]) for column in bars.keys())) for m in range(length - k - 1)]
+                        values = np.concatenate([values, newValues])[-STATE_BARS:]
+                        updated += 1
+                if state is None:
+                    df = pd.DataFrame(dict((column, columns[column][offset:offset+length]) for column in ['open', 'high', 'low', 'close', 'volume']))
+                    if df.isnull().values.any():
+                        continue
+                    try:
+                        values = np.asarray(calculate(df), dtype=float)[-STATE_BARS:]
+                    except Exception:
+                        continue   #the indicator can't be calculated yet, as when screening
+                    state = createState(function, series, arguments)
+                    if state is None:
+                        continue
+                    state.initialize(df)
+                    rebuilt += 1
+                arrays[indicator][j, STATE_BARS-len(values):] = values
+                states[indicator][symbol] = state
+                manifest['indicators'][indicator][1][symbol] = (dates[-1], close[-1])
+            if not self.__check(quotesManifest, columns, manifest, indicator, arrays[indicator], calculate):
+                logger.error(f'{timeframe} {indicator}: the states differ from the ta function, the indicator is calculated from the quotes')
+                del manifest['indicators'][indicator]
+        logger.info(f'{timeframe} indicator states: {updated} updated, {rebuilt} rebuilt')
+
+        for indicator, (i, lasts, window) in manifest['indicators'].items():
+            np.save(self.__getPath(timeframe, manifest['version'], f'{i}.npy'), arrays[indicator])
+        with open(self.__getPath(timeframe, manifest['version'], 'states.pkl'), 'wb') as f:
+            pickle.dump(states, f)
+        temporaryPath = self.__getManifestPath(timeframe) + '.tmp'
+        with open(temporaryPath, 'wb') as f:
+            pickle.dump(manifest, f)
+        os.replace(temporaryPath, self.__getManifestPath(timeframe))
+        #the processes still reading the previous version keep their memory maps after the files are removed
+        for path in glob.glob(os.path.join(self._path, f'{timeframe}-*')):
+            if not os.path.basename(path).startswith(f"{timeframe}-{manifest['version']}-"):
+                os.remove(path)
+        self._timeframes.pop(timeframe, None)
@@ -0,0 +1,306 @@
+#! python3
+
+import sys, os, json, time, queue, threading, smtplib, contextlib, uuid, logging, logging.config, getopt, socket
+
+# Internal imports
+import utils
+import screenerProfiler
+import dataSource
+
+#define constants
+NOTIFICATION_WORKERS = 4   #threads sending the notifications, each one with its own SMTP session
+QUEUE_SIZE = 1000   #notifications waiting to be sent, adding one more waits for a worker
+MAX_ATTEMPTS = 3   #attempts to send a notification before it is marked as failed
+RETRY_DELAY = 2   #seconds before the second attempt, doubled for each next one
+OUTBOX_BATCH_SIZE = 100   #statuses of sent notifications written to the outbox at once
+
+#The outbox keeps the notifications until they are sent, the pending ones of an interrupted run are sent by the next one.
+#It is used with outbox=True (genericScreener.py -o) once the table is created:
+#CREATE TABLE notificationoutbox (
+#    id CHAR(32) PRIMARY KEY,             -- assigned by the dispatcher, so the notifications of a batch are added with one statement
+#    channel VARCHAR(10) NOT NULL,        -- email or tweet
+#    receiver VARCHAR(255),
+#    subject VARCHAR(255) NOT NULL,
+#    body TEXT,                           -- the replies of a tweet as a JSON list
+#    status VARCHAR(10) NOT NULL,         -- pending, sent or failed
+#    attempts INT NOT NULL DEFAULT 0,
+#    lastError VARCHAR(255),
+#    created DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+#    lastUpdate DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+#    INDEX (status, created)
+#);
+
+
+class NotificationDispatcher:
+    """Send emails and tweets from a queue with worker threads, instead of connecting and logging in for each of them as utils.sendMail does.
+    Each worker keeps one authenticated SMTP session for all its emails and the workers share one twitter api.
+    A notification failing is sent again after RETRY_DELAY, 2*RETRY_DELAY... seconds, with a new session,
+    a tweet from its first reply that wasn't posted.
+    The SMTP server is the one of the EMAIL_* environment variables by default, a local server like aiosmtpd can be given
+    with starttls=False and no user to test without sending anything, see checkDispatcher.
+    With the outbox, the notifications queued together are added with one statement and their statuses are written
+    OUTBOX_BATCH_SIZE at a time, the ones sent but not written yet when a run is interrupted are sent again by the next one.
+    """
+
+    def __init__(self, logger, workers=NOTIFICATION_WORKERS, outbox=False, host=None, port=None, user=None, password=None, starttls=True, profiler=None):
+        self._logger = logger
+        self._profiler = profiler   #times the notifications sent, see screenerProfiler.py
+        self._outbox = outbox
+        self._host = host if host is not None else os.getenv('EMAIL_SMTP_SERVER')
+        self._port = port if port is not None else os.getenv('EMAIL_SMTP_PORT')
+        self._user = user if user is not None or host is not None else os.getenv('EMAIL_ADDRESS')
+        self._password = password if password is not None or host is not None else os.getenv('EMAIL_PASSWORD')
+        self._sender = self._user if self._user is not None else os.getenv('EMAIL_ADDRESS', 'screener@localhost')
+        self._starttls = starttls
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._api = None
+        self._apiLock = threading.Lock()
+        self._statsLock = threading.Lock()
+        self._stats = {'sent': 0, 'failed': 0, 'retries': 0, 'sessions': 0}
+        self._updates = []   #(id, status, attempts, error) of the notifications to write to the outbox
+        self._updatesLock = threading.Lock()
+        self._workers = [threading.Thread(target=self.__work, daemon=True) for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+        if outbox:
+            self.__resendPending()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def sendMail(self, receiver, subject, body):
+        self.sendMails([(receiver, subject, body)])
+
+    def sendMails(self, mails):
+        """Send (receiver, subject, body) emails, added to the outbox together."""
+        self.__put([('email', receiver, subject, body) for receiver, subject, body in mails])
+
+    def postTweet(self, subject, messages=None):
+        """Post subject, then each of messages in reply to it."""
+        self.__put([('tweet', None, subject, None if messages is None else list(messages))])
+
+    def close(self):
+        """Wait for the queued notifications to be sent, then stop the workers."""
+        for worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self.__writeOutbox(self._updates)
+        self._updates = []
+
+    def stats(self):
+        with self._statsLock:
+            return dict(self._stats)
+
+    def __count(self, name, value=1):
+        with self._statsLock:
+            self._stats[name] += value
+
+    def __put(self, notifications, outboxIds=None):
+        if not self._outbox:
+            outboxIds = [None] * len(notifications)
+        elif outboxIds is None:
+            outboxIds = [uuid.uuid4().hex for notification in notifications]
+            dataSource.getDataSource().addNotifications([(outboxId, channel, receiver, subject, body if channel == 'email' or body is None else json.dumps(body))
+                for outboxId, (channel, receiver, subject, body) in zip(outboxIds, notifications)])
+        for outboxId, notification in zip(outboxIds, notifications):
+            self._queue.put((outboxId, notification))
+
+    def __resendPending(self):
+        rows = dataSource.getDataSource().getPendingNotifications()
+        if len(rows) > 0:
+            self._logger.info(f'{len(rows)} pending notifications to send again')
+            self.__put([(channel, receiver, subject, body if channel == 'email' or body is None else json.loads(body)) for outboxId, channel, receiver, subject, body in rows],
+                [row[0] for row in rows])
+
+    def __updateOutbox(self, outboxId, status, attempts, error):
+        if outboxId is None:
+            return
+        updates = []
+        with self._updatesLock:
+            self._updates.append((outboxId, status, attempts, error))
+            if len(self._updates) >= OUTBOX_BATCH_SIZE:
+                updates, self._updates = self._updates, []
+        self.__writeOutbox(updates)
+
+    def __writeOutbox(self, updates):
+        if len(updates) == 0:
+            return
+        try:
+            dataSource.getDataSource().updateNotifications(updates)
+        except Exception as e:
+            self._logger.error(f'There was a problem updating the notification outbox: {e}')
+
+    def __openSession(self):
+        session = smtplib.SMTP(self._host, self._port)
+        if self._starttls:
+            session.starttls()
+            session.ehlo()
+        if self._user is not None:
+            session.login(self._user, self._password)
+        self.__count('sessions')
+        return session
+
+    def __getApi(self):
+        with self._apiLock:
+            if self._api is None:
+                self._api = utils.create_api(self._logger)
+            return self._api
+
+    def __postTweet(self, subject, messages, posted):
+        """Post subject and the messages in reply to it that aren't in posted ({'id': tweet id, 'replies': replies posted}) yet,
+        posted being updated as they are, so a retry resumes from the first reply that failed."""
+        api = self.__getApi()
+        if posted['id'] is None:
+            posted['id'] = api.update_status(status = subject).id
+        for message in ([] if messages is None else messages[posted['replies']:]):
+            api.update_status(status = message[:140], in_reply_to_status_id = posted['id'], auto_populate_reply_metadata=True)
+            posted['replies'] += 1
+
+    def __work(self):
+        session = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            outboxId, (channel, receiver, subject, body) = item
+            error = None
+            posted = {'id': None, 'replies': 0}
+            with screenerProfiler.timePhase(self._profiler, 'notification', channel):
+                for attempt in range(1, MAX_ATTEMPTS + 1):
+                    try:
+                        if channel == 'email':
+                            if session is None:
+                                session = self.__openSession()
+                            email = utils.createMail(receiver, subject, body)
+                            email['From'] = self._sender
+                            session.sendmail(self._sender, receiver, email.as_string())
+                        else:
+                            self.__postTweet(subject, body, posted)
+                        error = None
+                        break
+                    except smtplib.SMTPRecipientsRefused as e:   #won't be accepted by another attempt
+                        error = e
+                        break
+                    except Exception as e:
+                        error = e
+                        if channel == 'email' and session is not None:
+                            with contextlib.suppress(Exception):
+                                session.close()
+                            session = None
+                        if attempt < MAX_ATTEMPTS:
+                            self.__count('retries')
+                            time.sleep(RETRY_DELAY * 2**(attempt - 1))
+            if error is None:
+                self.__count('sent')
+                self._logger.debug(f'{channel} sent to {receiver}: {subject}')
+            else:
+                self.__count('failed')
+                self._logger.error(f'There was a problem sending {channel} {subject} to {receiver}: {error}')
+            self.__updateOutbox(outboxId, 'sent' if error is None else 'failed', attempt, error)
+        if session is not None:
+            with contextlib.suppress(Exception):
+                session.quit()
+
+
+def checkDispatcher(logger, mails=20):
+    """Send mails emails and a tweet thread through a local aiosmtpd server and a fake twitter api, with an outbox in memory.
+    The server refuses one receiver and fails the first email of another one, the api fails the first attempt at one reply.
+    Return the problems found: the workers not keeping their session, the failures not being retried,
+    a thread posted twice or a reply split, or wrong statuses in the outbox."""
+    from aiosmtpd.controller import Controller   #only needed for the check
+
+    class Handler:
+        def __init__(self):
+            self.sessions = set()
+            self.received = []
+            self.failed = set()
+
+        async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+            if address.startswith('refused'):
+                return '550 no such user'
+            envelope.rcpt_tos.append(address)
+            return '250 OK'
+
+        async def handle_DATA(self, server, session, envelope):
+            self.sessions.add(session)
+            receiver = envelope.rcpt_tos[0]
+            if receiver.startswith('retry') and receiver not in self.failed:
+                self.failed.add(receiver)
+                return '451 try again later'
+            self.received.append(receiver)
+            return '250 OK'
+
+    class Api:
+        def __init__(self):
+            self.tweets = []
+            self.failed = False
+
+        def update_status(self, status, in_reply_to_status_id=None, auto_populate_reply_metadata=False):
+            if in_reply_to_status_id is not None and len(self.tweets) == 2 and not self.failed:
+                self.failed = True
+                raise ConnectionError('reset by peer')
+            self.tweets.append((status, in_reply_to_status_id))
+            return type('Status', (), {'id': len(self.tweets)})
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    handler = Handler()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    previousSource = dataSource.currentSource
+    dataSource.useDataSource(dataSource.FrameDataSource())
+    try:
+        receivers = [f'user{i}@localhost' for i in range(mails)] + ['retry@localhost', 'refused@localhost']
+        with NotificationDispatcher(logger, workers=1, outbox=True, host='127.0.0.1', port=port, starttls=False) as dispatcher:
+            dispatcher._api = api = Api()
+            dispatcher.sendMails([(receiver, 'Screener check', 'Matching symbols: AAPL') for receiver in receivers])
+            dispatcher.postTweet('Screener check', ['first reply', 'second reply\nwith a new line', 'third reply'])
+        outbox = dataSource.getDataSource().getTable('notificationoutbox')
+    finally:
+        dataSource.useDataSource(previousSource)
+        controller.stop()
+    problems = []
+    stats = dispatcher.stats()
+    if len(handler.sessions) != 2 or stats['sessions'] != 2:
+        problems.append(f"{len(handler.sessions)} SMTP sessions for {len(receivers)} emails and one retry, instead of 2")
+    if sorted(handler.received) != sorted(receivers[:-1]):
+        problems.append(f'{len(handler.received)} emails received instead of {len(receivers) - 1}')
+    if api.tweets != [('Screener check', None), ('first reply', 1), ('second reply\nwith a new line', 1), ('third reply', 1)]:
+        problems.append(f'tweets posted: {api.tweets}')
+    if stats['retries'] != 2 or stats['sent'] != len(receivers) or stats['failed'] != 1:
+        problems.append(f'dispatcher stats: {stats}')
+    statuses = dict((receiver if channel == 'email' else channel, (status, attempts)) for channel, receiver, status, attempts in outbox[['channel', 'receiver', 'status', 'attempts']].itertuples(index=False, name=None))
+    expected = dict([(receiver, ('sent', 1)) for receiver in receivers[:-2]] + [('retry@localhost', ('sent', 2)), ('refused@localhost', ('failed', 1)), ('tweet', ('sent', 2))])
+    if statuses != expected:
+        problems.append(f'outbox statuses: {dict(item for item in statuses.items() if expected.get(item[0]) != item[1])}')
+    return problems
+
+
+def main():
+    #check the dispatcher against a local SMTP server, aiosmtpd is needed
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "c")
+    except getopt.GetoptError:
+        print(f'Usage: {os.path.basename(__file__)} -c')
+        sys.exit(2)
+    if ('-c', '') not in opts:
+        print(f'Usage: {os.path.basename(__file__)} -c')
+        sys.exit(2)
+
+    logging.config.fileConfig("logging.cfg")
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.info('check notification dispatcher - start')
+    problems = checkDispatcher(logger)
+    for problem in problems:
+        logger.error(problem)
+    logger.info(f"check notification dispatcher - end, {'failed' if problems else 'passed'}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#! python3
+
+import pandas as pd
+import numpy as np
+import os, glob, pickle
+
+#define constants
+INDEX_BARS = 64   #latest bars kept for each pattern, one bit per bar of an uint64
+
+
+def getPatternBits(fired):
+    """Return the uint64 of the latest INDEX_BARS values of a boolean array, bit b being set when fired is True b bars ago."""
+    bits = np.zeros(INDEX_BARS, dtype=bool)
+    latest = fired[::-1][:INDEX_BARS]
+    bits[:len(latest)] = latest
+    return int(np.packbits(bits, bitorder='little').view('<u8')[0])
+
+
+class PatternIndex:
+    """Candlestick patterns formed on the latest bars of every symbol of a quote store, kept in its 'patterns' directory:
+    - {timeframe}.pkl: the version, the version of the quotes it was calculated from, {name: (column, lookback)}
+      and {symbol: (row, number of bars, date, close)}, the date and the close of the last bar
+    - {timeframe}-{version}-bits.npy: one row per symbol and one uint64 per pattern, see getPatternBits
+    A statement is answered with one lookup instead of running TA-Lib, when the index has the same last bar as the quotes screened.
+    """
+
+    def __init__(self, path):
+        self._path = os.path.join(path, 'patterns')
+        self._timeframes = {}
+
+    def __getManifestPath(self, timeframe):
+        return os.path.join(self._path, timeframe + '.pkl')
+
+    def __getPath(self, timeframe, version, name):
+        return os.path.join(self._path, f'{timeframe}-{version}-{name}')
+
+    def getTimeframe(self, timeframe):
+        """Return (manifest, memory map of the bits) of a timeframe, None when there is no index for it."""
+        if timeframe not in self._timeframes:
+            try:
+                with open(self.__getManifestPath(timeframe), 'rb') as f:
+                    manifest = pickle.load(f)
+            except FileNotFoundError:
+                return None
+            self._timeframes[timeframe] = (manifest, np.load(self.__getPath(timeframe, manifest['version'], 'bits.npy'), mmap_mode='r'))
+        return self._timeframes[timeframe]
+
+    def isPatternFound(self, symbol, timeframe, name, duration, df):
+        """Return whether the pattern name was formed on one of the last duration bars of df, None when the index can't tell."""
+        stored = self.getTimeframe(timeframe)
+        if stored is None or name not in stored[0]['names'] or symbol not in stored[0]['symbols'] or duration > INDEX_BARS:
+            return None
+        column, lookback = stored[0]['names'][name]
+        row, length, date, close = stored[0]['symbols'][symbol]
+        #the patterns only read the last duration + lookback bars, which must be the same in the index and in df
+        if min(length, len(df)) < duration + lookback or date != np.datetime64(pd.Timestamp(df.index[-1]), 'D') or close != df['close'].values[-1]:
+            return None
+        return int(stored[1][row, column]) & ((1 << duration) - 1) != 0
+
+    def update(self, store, timeframe, patterns, logger):
+        """Calculate the index of patterns ({name: ((function, sign, lookback), ...)}, see genericScreener.getCandlestickPatterns)
+        from the quote store, when it changed since the last update."""
+        os.makedirs(self._path, exist_ok=True)
+        quotes = store.getTimeframe(timeframe)
+        if quotes is None:
+            return
+        quotesManifest, columns = quotes
+        stored = self.getTimeframe(timeframe)
+        names = dict((name, (i, max([pattern[2] for pattern in namePatterns] + [0]))) for i, (name, namePatterns) in enumerate(patterns.items()))
+        if stored is not None and stored[0]['quotes'] == quotesManifest['version'] and stored[0]['names'] == names:
+            logger.info(f'{timeframe} candlestick pattern index: up to date')
+            return
+        symbols = list(quotesManifest['symbols'].keys())
+        manifest = {'version': 1 if stored is None else stored[0]['version'] + 1, 'quotes': quotesManifest['version'], 'names': names, 'symbols': {}}
+        bits = np.zeros((len(symbols), len(names)), dtype=np.uint64)
+        functions = set(pattern for namePatterns in patterns.values() for pattern in namePatterns)
+        window = INDEX_BARS + max([pattern[2] for pattern in functions] + [0])
+        for j, symbol in enumerate(symbols):
+            offset, length = quotesManifest['symbols'][symbol]
+            if length == 0:
+                continue
+            start = offset + max(0, length - window)
+            prices = [np.ascontiguousarray(columns[column][start:offset+length], dtype=np.float64) for column in ['open', 'high', 'low', 'close']]
+            fired = {}
+            for function, sign, lookback in functions:
+                try:
+                    value = function(*prices)
+                except Exception:
+                    continue   #the symbol isn't indexed, its patterns are scanned when screening
+                fired[(function, sign, lookback)] = value > 0 if sign > 0 else value < 0 if sign < 0 else value != 0
+            if len(fired) < len(functions):
+                continue
+            for name, (i, lookback) in names.items():
+                bits[j, i] = getPatternBits(np.logical_or.reduce([fired[pattern] for pattern in patterns[name]] + [np.zeros(len(prices[0]), dtype=bool)]))
+            manifest['symbols'][symbol] = (j, length, columns['date'][offset+length-1], columns['close'][offset+length-1])
+        logger.info(f"{timeframe} candlestick pattern index: {len(manifest['symbols'])} symbols, {len(names)} patterns")
+
+        np.save(self.__getPath(timeframe, manifest['version'], 'bits.npy'), bits)
+        temporaryPath = self.__getManifestPath(timeframe) + '.tmp'
+        with open(temporaryPath, 'wb') as f:
+            pickle.dump(manifest, f)
+        os.replace(temporaryPath, self.__getManifestPath(timeframe))
+        #the processes still reading the previous version keep their memory maps after the files are removed
+        for path in glob.glob(os.path.join(self._path, f'{timeframe}-*')):
+            if not os.path.basename(path).startswith(f"{timeframe}-{manifest['version']}-"):
+                os.remove(path)
+        self._timeframes.pop(timeframe, None)
@@ -0,0 +1,179 @@
+#! python3
+
+import pandas as pd
+import numpy as np
+import sys, os, json, glob, logging, logging.config, getopt
+
+# Internal imports
+import utils
+import dataSource
+
+#define constants
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+TIMEFRAMES = ['daily', 'weekly', 'monthly']
+STORE_BARS = 1000   #latest bars kept per symbol and timeframe
+REFRESH_BARS = 5    #latest bars queried by an incremental refresh, the oldest one must be unchanged in the store
+BATCH_SIZE = 500    #number of symbols whose quotes are fetched together in one query
+
+
+def queryQuotes(symbols, timeframe, datapoints):
+    """Retrieve the latest quotes of symbols adjusted with adjclose from the data source, with one query.
+    Return {symbol: dataframe} for the symbols having quotes.
+    """
+    return dataSource.getDataSource().queryQuotes(symbols, timeframe, datapoints)
+
+
+class QuoteStore:
+    """Columnar store of the latest adjusted quotes, one directory holding for each timeframe:
+    - {timeframe}.json: the version of the arrays, the number of bars kept and {symbol: [offset, length]}
+    - {timeframe}-{version}-{column}.npy: the dates and the open, high, low, close and volume of all the symbols, one after the other
+    The arrays are opened as memory maps, so all the processes reading the store share the same pages.
+    A refresh writes a new version of the arrays before replacing the json file, readers keep the version they opened.
+    """
+
+    def __init__(self, path, lastDates=None):
+        """lastDates are the {symbol: lastDate} of the symbols table (see SymbolIndex.getLastDates), the store doesn't serve
+        the symbols whose daily quotes end before their lastDate, e.g. when the store wasn't refreshed after an EOD load."""
+        self._path = path
+        self._timeframes = {}
+        self._lastDates = lastDates
+        self._staleSymbols = None
+
+    def __getManifestPath(self, timeframe):
+        return os.path.join(self._path, timeframe + '.json')
+
+    def __getArrayPath(self, timeframe, version, column):
+        return os.path.join(self._path, f'{timeframe}-{version}-{column}.npy')
+
+    def getTimeframe(self, timeframe):
+        """Return (manifest, {column: memory map}) of a timeframe, None when the store doesn't have it."""
+        if timeframe not in self._timeframes:
+            try:
+                with open(self.__getManifestPath(timeframe)) as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                return None
+            arrays = dict((column, np.load(self.__getArrayPath(timeframe, manifest['version'], column), mmap_mode='r')) for column in ['date'] + COLUMNS)
+            self._timeframes[timeframe] = (manifest, arrays)
+        return self._timeframes[timeframe]
+
+    def getStaleSymbols(self):
+        """Return the set of the symbols having a lastDate after their last daily quote in the store,
+        all the symbols having a lastDate when the store has no daily quotes."""
+        if self._staleSymbols is None:
+            self._staleSymbols = set()
+            stored = self.getTimeframe('daily')
+            for symbol, lastDate in (self._lastDates or {}).items():
+                if pd.isnull(lastDate):
+                    continue
+                position = None if stored is None else stored[0]['symbols'].get(symbol)
+                if position is None or position[1] == 0 or stored[1]['date'][position[0] + position[1] - 1] < np.datetime64(lastDate, 'D'):
+                    self._staleSymbols.add(symbol)
+        return self._staleSymbols
+
+    def getQuotes(self, symbol, timeframe, datapoints):
+        """Return the latest datapoints quotes of a symbol like queryQuotes does,
+        None when the store can't tell (unknown timeframe or symbol, fewer bars kept than requested, stale symbol)."""
+        stored = self.getTimeframe(timeframe)
+        if stored is None or datapoints > stored[0]['bars'] or symbol not in stored[0]['symbols'] or symbol in self.getStaleSymbols():
+            return None
+        arrays = stored[1]
+        offset, length = stored[0]['symbols'][symbol]
+        start = offset + max(0, length - datapoints)
+        end = offset + length
+        return pd.DataFrame(dict((column, arrays[column][start:end]) for column in COLUMNS), index=pd.DatetimeIndex(arrays['date'][start:end], name='date'))
+
+    def __getArrays(self, symbol, timeframe):
+        """Return the (dates, values) stored for a symbol, values being a bars x columns array."""
+        stored = self.getTimeframe(timeframe)
+        if stored is None or symbol not in stored[0]['symbols']:
+            return None
+        offset, length = stored[0]['symbols'][symbol]
+        return (np.array(stored[1]['date'][offset:offset+length]), np.column_stack([stored[1][column][offset:offset+length] for column in COLUMNS]))
+
+    @staticmethod
+    def __toArrays(df):
+        return (pd.to_datetime(df.index).values.astype('datetime64[D]'), df[COLUMNS].values.astype(float))
+
+    def refresh(self, symbols, logger, timeframes=TIMEFRAMES, bars=STORE_BARS):
+        """Bring the store up to date with the database after an EOD load.
+        Only the latest REFRESH_BARS quotes of each symbol are queried, unless the oldest of them doesn't match the store
+        (new symbol, missed refreshes or adjclose changed by a split or a dividend) and all its quotes are reloaded.
+        """
+        os.makedirs(self._path, exist_ok=True)
+        for timeframe in timeframes:
+            current = self.getTimeframe(timeframe)
+            incremental = current is not None and current[0]['bars'] == bars   #otherwise all the quotes are reloaded
+            recent = {}
+            for i in range(0, len(symbols), BATCH_SIZE):
+                recent.update(queryQuotes(symbols[i:i+BATCH_SIZE], timeframe, REFRESH_BARS))
+            arrays = {}
+            reload = []
+            for symbol in symbols:
+                if symbol not in recent:
+                    arrays[symbol] = (np.array([], dtype='datetime64[D]'), np.empty((0, len(COLUMNS))))
+                    continue
+                dates, values = QuoteStore.__toArrays(recent[symbol])
+                stored = self.__getArrays(symbol, timeframe) if incremental else None
+                if stored is not None:
+                    i = np.searchsorted(stored[0], dates[0])
+                    if i < len(stored[0]) and stored[0][i] == dates[0] and np.allclose(stored[1][i], values[0], rtol=0, atol=0, equal_nan=True):
+                        arrays[symbol] = (np.concatenate([stored[0][:i], dates])[-bars:], np.concatenate([stored[1][:i], values])[-bars:])
+                        continue
+                reload.append(symbol)
+            logger.info(f'{timeframe}: {len(symbols) - len(reload)} symbols refreshed, {len(reload)} reloaded')
+            for i in range(0, len(reload), BATCH_SIZE):
+                for symbol, df in queryQuotes(reload[i:i+BATCH_SIZE], timeframe, bars).items():
+                    arrays[symbol] = QuoteStore.__toArrays(df)
+            self.__write(timeframe, symbols, arrays, bars)
+
+    def __write(self, timeframe, symbols, arrays, bars):
+        stored = self.getTimeframe(timeframe)
+        version = 1 if stored is None else stored[0]['version'] + 1
+        manifest = {'version': version, 'bars': bars, 'symbols': {}}
+        offset = 0
+        for symbol in symbols:
+            length = len(arrays[symbol][0])
+            manifest['symbols'][symbol] = [offset, length]
+            offset += length
+        dates = np.concatenate([arrays[symbol][0] for symbol in symbols] + [np.array([], dtype='datetime64[D]')])
+        values = np.concatenate([arrays[symbol][1] for symbol in symbols] + [np.empty((0, len(COLUMNS)))])
+        np.save(self.__getArrayPath(timeframe, version, 'date'), dates)
+        for j, column in enumerate(COLUMNS):
+            np.save(self.__getArrayPath(timeframe, version, column), np.ascontiguousarray(values[:, j]))
+        temporaryPath = self.__getManifestPath(timeframe) + '.tmp'
+        with open(temporaryPath, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temporaryPath, self.__getManifestPath(timeframe))
+        #the processes still reading the previous version keep their memory maps after the files are removed
+        for path in glob.glob(os.path.join(self._path, f'{timeframe}-*.npy')):
+            if not os.path.basename(path).startswith(f'{timeframe}-{version}-'):
+                os.remove(path)
+        self._timeframes.pop(timeframe, None)
+        self._staleSymbols = None
+
+
+def main():
+    path = 'quotes'
+    timeframes = TIMEFRAMES
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "p:t:")
+    except getopt.GetoptError:
+        print(f'Usage: {os.path.basename(__file__)} [-p|-t] [<path>|<timeframes>]')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-p", "--path"):
+            path = arg
+        elif opt in ("-t", "--timeframes"):
+            timeframes = arg.split(',')
+
+    logging.config.fileConfig("logging.cfg")
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.info('refresh quote store - start')
+    symbols = [row[0] for row in dataSource.getDataSource().getSymbols(['ticker'])]
+    QuoteStore(path).refresh(symbols, logger, timeframes)
+    logger.info('refresh quote store - end')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+#! python3
+
+import pandas as pd
+import numpy as np
+import sys, os, json, logging, getopt, tempfile, sqlite3, contextlib
+from datetime import date, datetime, timedelta
+from timeit import default_timer as timer
+try:
+    import resource
+except ImportError:   #not available on windows, the peak memory isn't reported
+    resource = None
+
+# Internal imports
+import utils
+import quoteStore
+import symbolIndex
+import genericScreener
+
+#define constants
+SYMBOLS = 500   #synthetic symbols
+BARS = 750   #daily bars of a symbol, the weekly and monthly bars are aggregated from them
+SEED = 1
+EXCHANGES = [1, 2, 3]
+INDUSTRIES = ['technology', 'energy', 'financial', 'healthcare', 'utilities']
+SHORT_HISTORY = 20   #one symbol in SHORT_HISTORY is a recent listing with a few bars only
+
+#screeners of the benchmark: expression, exchanges, industries, lowest last day price
+EXPRESSIONS = [
+    ('Close 3 days ago has been more than 15% above weekly MA(50) 1 month ago for the last 2 weeks', '1 2 3', None, None),
+    ('Volume MA(90) is above 100000.0 and Close is from 1.0 to 1999.9', '1 2 3', None, 5),
+    ('[EMA(10) 2 days ago crossed above 50 or EMA(10) 2 days ago crossed above EMA(50) within the last 5 days]', '1 2', None, None),
+    ('weekly EMA(10) 1 week ago dropped more than 3% over the last 1 month', '1 2 3', None, None),
+    ('[close 1 day ago is below EMA(23) or close 1 day ago is below EMA(30)] and EMA(10) 1 week ago reached a new 10 weeks high within the last 6 days', '2 3', None, None),
+    ('Median Bollinger Band (20.0,  2.5) has been increasing for 3 days', '1 2 3', 'technology energy', None),
+    ('Bullish candlestick pattern formed within the last 3 days and close is below EMA(10) and close is above 5 and RSI(7) is below 45 and MA(50) is above MA(200) and MA(50) is above MA(50) 50 days ago', '1 2 3', None, None),
+    ('avg(volume, 22) is from volume ma(10) 1 week ago to 9999999999 and MACD(12,   26,9) has crossed above MAX ( MACD  Signal ( 12, 26, 9 ), 10) within the last 5 days and Close is more than 5% above MA(10) for the last 10 days and  Bullish Harami formed    within the last  2 days', '1 2 3', None, None),
+    ('Volume MA ( 20 ) is above 100000 and MA(60) is above 20 and Range is above MIN ( Range, 6 ) 1 day ago and High is below High 1 day ago and Low is above Low 1 day ago and MIN(CCI(10),5) is below -100 and Aroon Up(63) is above Aroon Down(63)', '1 2 3', None, None),
+    ('Upper Bollinger Band(20,2) is above close and Lower Keltner Channel(10) is below close and ADX(14) is above 20 and +DI(14) is above -DI(14)', '1 3', None, 10),
+    ('weekly close crossed below weekly MA(10) within the last 4 weeks and monthly rsi(6) is above 40', '1 2 3', 'financial utilities', None),
+    ('top 20 RSI(14)', '1 2 3', None, None),
+]
+
+#(name, TA-Lib function, sign, performance rank) of the candlestick patterns, the signal classes have no function
+CANDLESTICK_PATTERNS = [
+    ('Bullish Candlestick Pattern', '', 1, 0), ('Bearish Candlestick Pattern', '', -1, 0), ('Neutral Candlestick Pattern', '', 0, 0),
+    ('Morning Star', 'CDLMORNINGSTAR', 1, 1), ('Bullish Engulfing', 'CDLENGULFING', 1, 2), ('Bearish Engulfing', 'CDLENGULFING', -1, 3),
+    ('Hammer', 'CDLHAMMER', 1, 4), ('Shooting Star', 'CDLSHOOTINGSTAR', -1, 5), ('Bullish Harami', 'CDLHARAMI', 1, 6),
+    ('Bearish Harami', 'CDLHARAMI', -1, 7), ('Three White Soldiers', 'CDL3WHITESOLDIERS', 1, 8), ('Evening Star', 'CDLEVENINGSTAR', -1, 9),
+    ('Doji', 'CDLDOJI', 0, 10), ('Spinning Top', 'CDLSPINNINGTOP', 0, 11),
+]
+
+#subset of the tables of the database read by the screeners
+SCHEMA = '''
+CREATE TABLE symbols (id INTEGER PRIMARY KEY, ticker TEXT, exchange_id INT, industry TEXT, active INT, lastDate TEXT,
+    lastDayPrice REAL, avg30DayPrice REAL, avg60DayPrice REAL, avg90DayPrice REAL,
+    lastDayVolume REAL, avg30DayVolume REAL, avg60DayVolume REAL, avg90DayVolume REAL, ibdRelativeStrength REAL);
+CREATE TABLE daily_quotes (symbol TEXT, formatted_date TEXT, open REAL, high REAL, low REAL, close REAL, adjclose REAL, volume INT, PRIMARY KEY (symbol, formatted_date));
+CREATE TABLE weekly_quotes (symbol TEXT, formatted_date TEXT, open REAL, high REAL, low REAL, close REAL, adjclose REAL, volume INT, PRIMARY KEY (symbol, formatted_date));
+CREATE TABLE monthly_quotes (symbol TEXT, formatted_date TEXT, open REAL, high REAL, low REAL, close REAL, adjclose REAL, volume INT, PRIMARY KEY (symbol, formatted_date));
+CREATE TABLE candlestickpattern (name TEXT, functionName TEXT, sign INT, performanceRank INT);
+CREATE TABLE screener (id INTEGER PRIMARY KEY, user_id INT, name TEXT, region TEXT, expression TEXT, priceType INT, priceLow REAL, priceHigh REAL,
+    volumeType INT, volumeLow REAL, volumeHigh REAL, exchanges TEXT, watchlists TEXT, industries TEXT, lastUpdate TEXT);
+CREATE TABLE screenertranslation (screener_id INT, statement TEXT, translation TEXT);
+CREATE TABLE screenerresult (screener_id INT PRIMARY KEY, result TEXT, lastUpdate TEXT);
+CREATE TABLE user (id INT PRIMARY KEY, email TEXT, isVerified INT);
+CREATE TABLE watchlist (id INT PRIMARY KEY, symbols TEXT);
+'''
+
+
+def getSyntheticQuotes(rng, bars):
+    """Return the daily quotes of a random walk ending today, with a day range and a volume of the same order as real ones."""
+    dates = pd.bdate_range(end=pd.Timestamp(date.today()), periods=bars)
+    close = rng.uniform(2, 200) * np.exp(np.cumsum(rng.normal(0.0003, 0.02, bars)))
+    opening = close * (1 + rng.normal(0, 0.01, bars))
+    high = np.maximum(opening, close) * (1 + np.abs(rng.normal(0, 0.01, bars)))
+    low = np.minimum(opening, close) * (1 - np.abs(rng.normal(0, 0.01, bars)))
+    volume = (rng.lognormal(12, 1) * rng.lognormal(0, 0.5, bars)).astype(np.int64)
+    return pd.DataFrame({'open': opening, 'high': high, 'low': low, 'close': close, 'volume': volume}, index=dates)
+
+def aggregateQuotes(df, period):
+    """Aggregate daily quotes to weekly ('W') or monthly ('M') bars dated by their last day."""
+    periods = df.index.to_period(period)
+    aggregated = df.groupby(periods).agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+    aggregated.index = df.index.to_series().groupby(periods).last().values
+    return aggregated
+
+def createDatabase(path, symbols=SYMBOLS, bars=BARS, seed=SEED):
+    """Create the sqlite database of the benchmark: synthetic quotes of the symbols and the candlestick patterns.
+    The screeners are added by createScreeners once the database is used, their translations needing the patterns."""
+    rng = np.random.default_rng(seed)
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        conn.executescript(SCHEMA)
+        for i in range(symbols):
+            ticker = f'SYM{i:05d}'
+            df = getSyntheticQuotes(rng, int(rng.integers(2, 60)) if i % SHORT_HISTORY == SHORT_HISTORY - 1 else bars)
+            for table, quotes in [('daily_quotes', df), ('weekly_quotes', aggregateQuotes(df, 'W')), ('monthly_quotes', aggregateQuotes(df, 'M'))]:
+                rows = [(ticker, day.strftime(utils.date_format), o, h, l, c, c, int(v)) for day, o, h, l, c, v in
+                    zip(quotes.index, quotes['open'], quotes['high'], quotes['low'], quotes['close'], quotes['volume'])]
+                conn.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            close, volume = df['close'].values, df['volume'].values
+            prices = [close[-1]] + [close[-days:].mean() for days in [30, 60, 90]]
+            volumes = [volume[-1]] + [volume[-days:].mean() for days in [30, 60, 90]]
+            conn.execute('INSERT INTO symbols VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (i + 1, ticker, EXCHANGES[i % len(EXCHANGES)], INDUSTRIES[i % len(INDUSTRIES)], df.index[-1].strftime(utils.date_format),
+                *[float(price) for price in prices], *[float(volume) for volume in volumes], float(rng.integers(1, 100))))
+        conn.executemany('INSERT INTO candlestickpattern VALUES (?, ?, ?, ?)', CANDLESTICK_PATTERNS)
+        conn.commit()
+
+def createScreeners(path, expressions=EXPRESSIONS):
+    """Add the screeners of expressions to the database of the benchmark with their translations,
+    so the timed runs don't include translating the expressions."""
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        conn.execute('INSERT INTO user VALUES (1, NULL, 1)')
+        for i, (expression, exchanges, industries, priceLow) in enumerate(expressions):
+            screener_id = 6 + i   #after the default screeners
+            conn.execute('INSERT INTO screener (id, user_id, name, expression, priceType, priceLow, exchanges, industries, lastUpdate) VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)',
+                (screener_id, f'benchmark {i + 1}', expression, None if priceLow is None else 0, priceLow, exchanges, industries, date.today().strftime(utils.date_format)))
+            for statement in genericScreener.getStatements(genericScreener.parseExpression(expression.replace('\n', ' ').strip())):
+                conn.execute('INSERT INTO screenertranslation VALUES (?, ?, ?)', (screener_id, statement, genericScreener.translateStatement(statement.strip())))
+        conn.commit()
+
+def getPeakMemory():
+    """Return the peak resident memory in MB of this process and of its largest terminated child process, None when it can't be measured."""
+    if resource is None:
+        return (None, None)
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024   #ru_maxrss is in bytes on macOS, in KB elsewhere
+    return tuple(resource.getrusage(who).ru_maxrss / unit for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN])
+
+def measureLatency(myScreeners, logger):
+    """Screen every symbol of every screener in this process, return the seconds of each symbol.
+    The quotes of a screener are loaded at once beforehand, as a worker does for a batch."""
+    latencies = []
+    for myScreener in myScreeners:
+        translation = myScreener.translation
+        symbols = getScreenerSymbols(myScreener)
+        if len(symbols) == 0:
+            continue
+        timeframes = myScreener.getTimeframes(translation)
+        tree = genericScreener.orderTree(myScreener.expressionTree, translation)[0]
+        plan = genericScreener.compileTranslation(translation)
+        quotes = genericScreener.loadQuotes(symbols, timeframes)
+        for symbol in symbols:
+            start = timer()
+            genericScreener.MyScreener.sceener(symbol, tree, timeframes, translation, quotes[symbol], plan)
+            latencies.append(timer() - start)
+        logger.info(f'screener {myScreener.id}: {len(symbols)} symbols screened one by one')
+    return np.array(latencies)
+
+def getScreenerSymbols(myScreener):
+    """Return the symbols of a screener from the symbol index of the run, the ones getMatchingSymbols screens."""
+    lastDate = (datetime.today() - timedelta(days=4)).strftime(utils.date_format)
+    bounds = [] if myScreener.priceLow is None else [('lastDayPrice', myScreener.priceLow, None)]
+    industries = None if genericScreener.isBlank(myScreener.industries) else myScreener.industries.split()
+    return genericScreener.localSymbols.select(None, myScreener.exchanges.split(), industries, lastDate, bounds)
+
+def runBenchmark(path, processes=None, mode='symbol', storePath=None, latency=True, logger=None):
+    """Run the screeners of the database at path with a worker pool, as runScreeners does without saving their results,
+    then one by one in this process. Return the report of the benchmark."""
+    logger = logger or logging.getLogger(os.path.basename(__file__))
+    os.environ['SCREENER_DATABASE_URL'] = 'sqlite:///' + os.path.abspath(path)
+    report = {'symbols': 0, 'screeners': 0, 'mode': mode, 'quoteStore': storePath is not None}
+
+    start = timer()
+    genericScreener.localSymbols = symbolIndex.SymbolIndex.load()
+    myScreeners = genericScreener.loadScreeners()
+    for myScreener in myScreeners:
+        myScreener.symbols = genericScreener.localSymbols.select(exchanges=myScreener.exchanges.split())
+    if storePath is not None:
+        quoteStore.QuoteStore(storePath).refresh(genericScreener.localSymbols.tickers.tolist(), logger)
+        genericScreener.useQuoteStore(storePath, genericScreener.localSymbols.getLastDates())
+        genericScreener.updateIndicatorStates([myScreener.translation for myScreener in myScreeners])
+        genericScreener.updateCandlestickPatternIndex()
+    report['setupSeconds'] = timer() - start
+
+    with genericScreener.ScreenerPool(processes, storePath=storePath, lastDates=None if storePath is None else genericScreener.localSymbols.getLastDates()) as pool:
+        report['processes'] = pool.processes
+        report['startupSeconds'] = pool.startupSeconds
+        start = timer()
+        for myScreener in myScreeners:
+            myScreener.getMatchingSymbols(pool, mode)
+        report['screeningSeconds'] = timer() - start
+        batchStats = pool.getBatchStats()
+    report['screeners'] = len(myScreeners)
+    report['symbols'] = batchStats['symbols']
+    report['symbolsPerSecond'] = 0 if report['screeningSeconds'] == 0 else batchStats['symbols'] / report['screeningSeconds']
+    report['quotesSeconds'] = batchStats['quotesSeconds']
+
+    if latency:
+        latencies = measureLatency(myScreeners, logger)
+        if len(latencies) > 0:
+            report['latencyMs'] = dict((name, 1000 * float(np.percentile(latencies, q))) for name, q in [('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)])
+    report['peakMemoryMB'], report['peakWorkerMemoryMB'] = getPeakMemory()
+    return report
+
+def printReport(report):
+    print(f"{report['screeners']} screeners, {report['symbols']} symbols screened in {report['screeningSeconds']:.2f}s by {report['processes']} workers "
+          f"({report['mode']} mode, {'quote store' if report['quoteStore'] else 'database quotes'}): {report['symbolsPerSecond']:.0f} symbols/s")
+    print(f"setup {report['setupSeconds']:.2f}s, worker startup {report['startupSeconds']:.2f}s, {report['quotesSeconds']:.2f}s loading quotes in the workers")
+    if 'latencyMs' in report:
+        latency = report['latencyMs']
+        print(f"per symbol latency: p50 {latency['p50']:.2f}ms, p90 {latency['p90']:.2f}ms, p99 {latency['p99']:.2f}ms, max {latency['max']:.2f}ms")
+    if report['peakMemoryMB'] is not None:
+        print(f"peak RSS: {report['peakMemoryMB']:.0f} MB main process, {report['peakWorkerMemoryMB']:.0f} MB largest worker")
+
+def main():
+    #usage: screenerBenchmark.py [-n symbols] [-b daily bars] [-s seed] [-w workers] [-m symbol|panel] [-q] [-d database path] [-o report path] [-l] [-v]
+    #-q screens with a quote store built from the database, -l skips the latency measure, -d keeps the database (reused when it exists),
+    #-v logs the warnings and errors of the screeners, e.g. the statements too long for the short histories
+    symbols, bars, seed, processes, mode = SYMBOLS, BARS, SEED, None, 'symbol'
+    useStore, latency, databasePath, reportPath, level = False, True, None, None, logging.CRITICAL
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:b:s:w:m:qd:o:lv")
+    except getopt.GetoptError:
+        print(f'Usage: {os.path.basename(__file__)} [-n|-b|-s|-w|-m|-q|-d|-o|-l|-v] [<symbols>|<bars>|<seed>|<workers>|<mode>|<quote store>|<database path>|<report path>|<no latency>|<verbose>]')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-n':
+            symbols = int(arg)
+        elif opt == '-b':
+            bars = int(arg)
+        elif opt == '-s':
+            seed = int(arg)
+        elif opt == '-w':
+            processes = int(arg)
+        elif opt == '-m':
+            mode = arg
+        elif opt == '-q':
+            useStore = True
+        elif opt == '-d':
+            databasePath = arg
+        elif opt == '-o':
+            reportPath = arg
+        elif opt == '-l':
+            latency = False
+        elif opt == '-v':
+            level = logging.WARNING
+
+    logging.basicConfig(level=level)
+    logging.captureWarnings(True)
+    logger = logging.getLogger(os.path.basename(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        path = databasePath or os.path.join(directory, 'benchmark.db')
+        if not os.path.exists(path):
+            start = timer()
+            createDatabase(path, symbols, bars, seed)
+            os.environ['SCREENER_DATABASE_URL'] = 'sqlite:///' + os.path.abspath(path)
+            createScreeners(path)
+            print(f'synthetic database of {symbols} symbols x {bars} daily bars created in {timer() - start:.1f}s')
+        report = runBenchmark(path, processes, mode, os.path.join(directory, 'quotes') if useStore else None, latency, logger)
+    printReport(report)
+    if reportPath is not None:
+        with open(reportPath, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
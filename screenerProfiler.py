@@ -0,0 +1,100 @@
+#! python3
+
+import json, threading, contextlib
+from timeit import default_timer as timer
+
+#define constants
+METRIC_PREFIX = 'screener'   #prefix of the Prometheus metrics
+NOT_PROFILED = contextlib.nullcontext()
+
+
+def timePhase(profiler, phase, label=None, screener=None):
+    """Time a phase with profiler, do nothing when profiler is None."""
+    return NOT_PROFILED if profiler is None else profiler.time(phase, label, screener)
+
+def escapeLabel(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ScreenerProfiler:
+    """Calls and seconds of the phases of a runScreeners pass (universe, quotes, indicator, statement, candlestick...),
+    by screener and by label, e.g. the indicator family or the statement type.
+    Timed phases nest: the seconds of a phase include the phases timed inside it and its selfSeconds don't,
+    so the selfSeconds of the phases of a process add up to the time it spent in them.
+    The profilers of the worker processes are merged into the one of the run with merge.
+    """
+
+    def __init__(self):
+        self.screener = None   #screener of the phases timed without one
+        self._phases = {}   #(screener, phase, label): [calls, seconds, selfSeconds]
+        self._lock = threading.Lock()
+        self._local = threading.local()   #stack of the seconds of the phases nested in the ones being timed by a thread
+        self._start = timer()
+
+    @contextlib.contextmanager
+    def time(self, phase, label=None, screener=None):
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = timer()
+        try:
+            yield
+        finally:
+            seconds = timer() - start
+            nestedSeconds = stack.pop()
+            if len(stack) > 0:
+                stack[-1] += seconds
+            self.add(self.screener if screener is None else screener, phase, label, 1, seconds, seconds - nestedSeconds)
+
+    def add(self, screener, phase, label, calls, seconds, selfSeconds):
+        key = (screener, phase, label)
+        with self._lock:
+            values = self._phases.setdefault(key, [0, 0.0, 0.0])
+            values[0] += calls
+            values[1] += seconds
+            values[2] += selfSeconds
+
+    def getPhases(self):
+        with self._lock:
+            return dict((key, list(values)) for key, values in self._phases.items())
+
+    def merge(self, phases):
+        """Add the phases of another profiler, see getPhases."""
+        for (screener, phase, label), values in phases.items():
+            self.add(screener, phase, label, *values)
+
+    def report(self):
+        """Return the phases of the run and of each screener, the most expensive first."""
+        run = {}
+        screeners = {}
+        for (screener, phase, label), values in self.getPhases().items():
+            for phases, key in [(run, (phase, label))] + ([] if screener is None else [(screeners.setdefault(str(screener), {}), (phase, label))]):
+                total = phases.setdefault(key, [0, 0.0, 0.0])
+                for i, value in enumerate(values):
+                    total[i] += value
+        toList = lambda phases: [{'phase': phase, 'label': label, 'calls': calls, 'seconds': seconds, 'selfSeconds': selfSeconds}
+            for (phase, label), (calls, seconds, selfSeconds) in sorted(phases.items(), key=lambda x: -x[1][2])]
+        return {'seconds': timer() - self._start, 'phases': toList(run), 'screeners': dict((screener, toList(phases)) for screener, phases in screeners.items())}
+
+    def toJson(self):
+        return json.dumps(self.report(), indent=2)
+
+    def toPrometheus(self):
+        """Return the report in the Prometheus text exposition format, the run_phase metrics being the sums of the phase ones
+        over the screeners and the phases outside of any screener."""
+        report = self.report()
+        lines = [f'# TYPE {METRIC_PREFIX}_run_seconds gauge', f"{METRIC_PREFIX}_run_seconds {report['seconds']}"]
+        for metric, screeners in [('run_phase', {None: report['phases']}), ('phase', report['screeners'])]:
+            for name, field, metricType in [('calls_total', 'calls', 'counter'), ('seconds_total', 'seconds', 'counter'), ('self_seconds_total', 'selfSeconds', 'counter')]:
+                lines.append(f'# TYPE {METRIC_PREFIX}_{metric}_{name} {metricType}')
+                for screener, phases in screeners.items():
+                    for phase in phases:
+                        labels = ([] if screener is None else [f'screener="{escapeLabel(screener)}"']) + [f'phase="{escapeLabel(phase["phase"])}"']
+                        if phase['label'] is not None:
+                            labels.append(f'label="{escapeLabel(phase["label"])}"')
+                        lines.append(f"{METRIC_PREFIX}_{metric}_{name}{{{','.join(labels)}}} {phase[field]}")
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path):
+        """Write the report to path, in the Prometheus text format when path ends with .prom, as json otherwise."""
+        with open(path, 'w') as f:
+            f.write(self.toPrometheus() if path.endswith('.prom') else self.toJson())
@@ -0,0 +1,60 @@
+#! python3
+
+import sys, os, getopt, json, statistics, subprocess, tempfile, tarfile, io
+
+#define constants
+RUNS = 10   #fresh interpreters importing the module
+HEAVY_MODULES = ['ta', 'talib', 'sqlalchemy', 'tweepy', 'MySQLdb']
+
+#run by each fresh interpreter, prints the import time and the heavy modules it loaded
+IMPORT_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+import genericScreener
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'modules': len(sys.modules), 'heavy': [name for name in %r if name in sys.modules]}))
+"""
+
+
+def measureImport(path, runs=RUNS):
+    """Import genericScreener from path in runs fresh interpreters, return the statistics of the cold import time."""
+    results = []
+    for i in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT % HEAVY_MODULES], cwd=path, capture_output=True, text=True)
+        if output.returncode != 0:
+            raise RuntimeError(f'importing genericScreener from {path} failed:\n{output.stderr}')
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    seconds = [result['seconds'] for result in results]
+    return {'runs': runs, 'median': statistics.median(seconds), 'min': min(seconds), 'max': max(seconds),
+            'modules': results[-1]['modules'], 'heavy': results[-1]['heavy']}
+
+def extractRevision(revision, path):
+    """Extract the files of a git revision of the repository to path."""
+    archive = subprocess.run(['git', 'archive', revision], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, check=True)
+    with tarfile.open(fileobj=io.BytesIO(archive.stdout)) as tar:
+        tar.extractall(path)
+
+def printResult(name, result):
+    print(f"{name}: median {1000*result['median']:.0f}ms, min {1000*result['min']:.0f}ms, max {1000*result['max']:.0f}ms "
+          f"over {result['runs']} runs, {result['modules']} modules loaded, heavy modules: {', '.join(result['heavy']) or 'none'}")
+
+def main():
+    #usage: startupBenchmark.py [-n runs] [-r git revision to compare with]
+    #the revisions connecting to the database when imported need it to be available
+    runs = RUNS
+    revision = None
+    opts, args = getopt.getopt(sys.argv[1:], "n:r:")
+    for opt, arg in opts:
+        if opt == '-n':
+            runs = int(arg)
+        elif opt == '-r':
+            revision = arg
+
+    if revision is not None:
+        with tempfile.TemporaryDirectory() as path:
+            extractRevision(revision, path)
+            printResult(revision, measureImport(path, runs))
+    printResult('current', measureImport(os.path.dirname(os.path.abspath(__file__)), runs))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#! python3
+
+import pandas as pd
+import numpy as np
+
+# Internal imports
+import dataSource
+
+#define constants
+PRICE_COLUMNS = ['lastDayPrice', 'avg30DayPrice', 'avg60DayPrice', 'avg90DayPrice']
+VOLUME_COLUMNS = ['lastDayVolume', 'avg30DayVolume', 'avg60DayVolume', 'avg90DayVolume']
+
+
+class SymbolIndex:
+    """Active symbols of the symbols table kept in memory for a run: one array per column and a boolean mask
+    per exchange and per industry. The symbols of a screener are selected by combining masks instead of a query,
+    in the order of the table like the query returns them.
+    """
+
+    def __init__(self, rows):
+        """rows are (ticker, exchange_id, industry, lastDate) followed by PRICE_COLUMNS and VOLUME_COLUMNS."""
+        columns = list(zip(*rows)) if len(rows) > 0 else [[]] * (4 + len(PRICE_COLUMNS) + len(VOLUME_COLUMNS))
+        self.tickers = np.array(columns[0], dtype=object)
+        self._lastDates = pd.to_datetime(pd.Series(columns[3], dtype=object), errors='coerce').values.astype('datetime64[D]')
+        self._values = dict((column, np.array(values, dtype=float)) for column, values in zip(PRICE_COLUMNS + VOLUME_COLUMNS, columns[4:]))
+        exchanges = np.array([str(exchange) for exchange in columns[1]], dtype=object)
+        self._exchanges = dict((exchange, exchanges == exchange) for exchange in set(exchanges))
+        industries = np.array(columns[2], dtype=object)
+        self._industries = dict((industry, industries == industry) for industry in set(industries) if industry is not None)
+
+    @staticmethod
+    def load():
+        return SymbolIndex(dataSource.getDataSource().getSymbols(['ticker', 'exchange_id', 'industry', 'lastDate'] + PRICE_COLUMNS + VOLUME_COLUMNS))
+
+    def getLastDates(self):
+        """Return {ticker: lastDate}, NaT for the symbols without one."""
+        return dict(zip(self.tickers, self._lastDates))
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __getMask(self, masks, names):
+        mask = np.zeros(len(self.tickers), dtype=bool)
+        for name in names:
+            if name in masks:
+                mask |= masks[name]
+        return mask
+
+    def select(self, symbols=None, exchanges=None, industries=None, lastDate=None, bounds=()):
+        """Return the tickers among symbols, on one of exchanges and in one of industries when they are given,
+        with a last date from lastDate and the (column, low, high) bounds, low and high being None when the column isn't bounded.
+        """
+        mask = np.ones(len(self.tickers), dtype=bool)
+        if symbols is not None:
+            mask &= np.isin(self.tickers, np.array(list(symbols), dtype=object))
+        if exchanges is not None:
+            mask &= self.__getMask(self._exchanges, [str(exchange) for exchange in exchanges])
+        if industries is not None:
+            mask &= self.__getMask(self._industries, industries)
+        if lastDate is not None:
+            mask &= self._lastDates >= np.datetime64(lastDate, 'D')
+        for column, low, high in bounds:
+            if low is not None:
+                mask &= self._values[column] >= float(low)
+            if high is not None:
+                mask &= self._values[column] <= float(high)
+        return self.tickers[mask].tolist()